@@ -1,11 +1,13 @@
 #db/database.py
 
+import os
 from motor.motor_asyncio import AsyncIOMotorClient
 
-MONGO_URI = "mongodb://localhost:27017"
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 client = AsyncIOMotorClient(MONGO_URI)
-db = client.agentic_ai 
+db = client[os.getenv("MONGO_DB", "agentic_ai")]
 
 
 # Collections
+# One document per chunk; see agents/db/load_pdfs.py for the layout.
 public_docs_collection = db.public_documents
@@ -1,35 +1,211 @@
-import os
-from pypdf import PdfReader
+#db/load_pdfs.py
+"""
+Load a folder of PDFs into MongoDB as chunk-level documents.
+
+    python agents/db/load_pdfs.py --folder pdfs/ --concurrency 4 --dtype float16
+
+Each chunk is stored as one document:
+
+    {source, sha256, chunk, text, start, end,
+     embedding: <raw float16/float32 bytes>, dtype, dim, model,
+     live, updated_at}
+
+- Files are chunked with the embedding model's tokenizer (as PublicAgentRAG
+  does), so nothing is truncated at encode time.
+- Several files are processed concurrently; chunks are written with
+  `insert_many` in batches.
+- Embeddings are stored as raw bytes (BSON binary) instead of JSON lists:
+  384 dims take 768 bytes as float16 instead of about 3.4 KB as doubles.
+- A new version of a file is inserted with `live=False`, then published and
+  the previous version retired (`live=False`) with a fresh `updated_at`.
+  agents/db/vector_sync.py uses `updated_at` as its watermark.
+- Files whose content hash is already live are skipped.
+
+The collection can be passed in, e.g. a mongomock_motor collection or one on a
+local mongod:
+
+    from mongomock_motor import AsyncMongoMockClient
+    collection = AsyncMongoMockClient().test.chunks
+    asyncio.run(load_pdfs("pdfs/", collection=collection, model=encoder))
+"""
+import argparse
 import asyncio
+import hashlib
+import os
+import sys
+import time
+from typing import Dict, List
+
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from database import public_docs_collection
+
+# Make the repo root importable when run as a script from agents/db
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from utils.document_loader import iter_pdf_pages, iter_chunks
 
 # Path to PDFs
 PDF_FOLDER = "pdfs/"
 EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_DTYPES = ("float32", "float16")
+
+# Retired / never-published chunks older than this are deleted by `prune`.
+PRUNE_AFTER = 7 * 24 * 3600
+
+
+# ---------- Embedding encoding ----------
+def encode_embedding(vector: np.ndarray, dtype: str = "float16") -> bytes:
+    """Raw little-endian bytes of `vector` in `dtype` (stored as BSON binary)."""
+    if dtype not in EMBED_DTYPES:
+        raise ValueError(f"Unknown embedding dtype '{dtype}', expected one of {EMBED_DTYPES}.")
+    return np.asarray(vector, dtype=np.dtype(dtype).newbyteorder("<")).tobytes()
+
+
+def decode_embeddings(docs: List[Dict]) -> np.ndarray:
+    """Stack the embeddings of chunk documents into a float32 matrix."""
+    if not docs:
+        return np.zeros((0, 0), dtype=np.float32)
+    out = np.empty((len(docs), docs[0]["dim"]), dtype=np.float32)
+    for row, doc in zip(out, docs):
+        row[:] = np.frombuffer(doc["embedding"], dtype=np.dtype(doc["dtype"]).newbyteorder("<"))
+    return out
+
+
+# ---------- Collection helpers ----------
+async def ensure_indexes(collection):
+    await collection.create_index([("source", 1), ("live", 1), ("updated_at", -1)])
+    await collection.create_index([("updated_at", 1)])
+
+
+async def prune(collection, older_than: float = PRUNE_AFTER) -> int:
+    """Delete retired or abandoned chunks whose last update is older than `older_than` seconds."""
+    result = await collection.delete_many({"live": False, "updated_at": {"$lt": time.time() - older_than}})
+    return result.deleted_count
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def extract_chunks(path: str, chunk_size: int, overlap: int, tokenizer=None):
+    return list(iter_chunks(iter_pdf_pages(path), chunk_size, overlap, tokenizer))
+
+
+# ---------- Loader ----------
+async def load_file(
+    collection, path: str, model, source: str = None, batch_size: int = 256, dtype: str = "float16",
+    chunk_size: int = None, overlap: int = 32, model_name: str = EMBED_MODEL_NAME,
+) -> int:
+    """Chunk, embed and store one PDF; returns the number of chunks written (0 if unchanged)."""
+    source = source or os.path.basename(path)
+    sha256 = await asyncio.to_thread(file_sha256, path)
+    if await collection.find_one({"source": source, "sha256": sha256, "live": True}, projection={"_id": 1}):
+        return 0
+
+    tokenizer = getattr(model, "tokenizer", None)
+    max_tokens = getattr(model, "max_seq_length", 256) - 2
+    chunk_size = min(chunk_size or max_tokens, max_tokens)
+    chunks = await asyncio.to_thread(extract_chunks, path, chunk_size, overlap, tokenizer)
+
+    # Leftovers of an interrupted load of this same version.
+    await collection.delete_many({"source": source, "sha256": sha256, "live": False})
+
+    for i in range(0, len(chunks), batch_size):
+        batch = chunks[i:i + batch_size]
+        texts = [c.text for c in batch]
+        embeddings = await asyncio.to_thread(model.encode, texts, convert_to_numpy=True, show_progress_bar=False)
+        now = time.time()
+        await collection.insert_many([
+            {
+                "source": source,
+                "sha256": sha256,
+                "chunk": i + j,
+                "text": c.text,
+                "start": c.start,
+                "end": c.end,
+                "embedding": encode_embedding(vec, dtype),
+                "dtype": dtype,
+                "dim": len(vec),
+                "model": model_name,
+                "live": False,
+                "updated_at": now,
+            }
+            for j, (c, vec) in enumerate(zip(batch, embeddings))
+        ], ordered=False)
+
+    # Publish the new version, then retire the old one; readers see the newest live version.
+    await collection.update_many(
+        {"source": source, "sha256": sha256}, {"$set": {"live": True, "updated_at": time.time()}}
+    )
+    await collection.update_many(
+        {"source": source, "sha256": {"$ne": sha256}, "live": True},
+        {"$set": {"live": False, "updated_at": time.time()}},
+    )
+    return len(chunks)
+
+
+async def load_pdfs(
+    folder: str = PDF_FOLDER, collection=None, model=None, concurrency: int = 4,
+    batch_size: int = 256, dtype: str = "float16", chunk_size: int = None, overlap: int = 32,
+) -> Dict[str, int]:
+    """Load every PDF in `folder`, `concurrency` files at a time."""
+    if collection is None:
+        from agents.db.database import public_docs_collection as collection
+    if model is None:
+        from utils.embedding_service import get_encoder
+
+        # Shared embedding model (cached and micro-batched)
+        model = get_encoder(EMBED_MODEL_NAME)
+    if dtype not in EMBED_DTYPES:
+        raise ValueError(f"Unknown embedding dtype '{dtype}', expected one of {EMBED_DTYPES}.")
+
+    await ensure_indexes(collection)
+    paths = [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.lower().endswith(".pdf")]
+    totals = {"files": 0, "unchanged": 0, "failed": 0, "chunks": 0}
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(path):
+        async with limit:
+            try:
+                n = await load_file(collection, path, model, None, batch_size, dtype, chunk_size, overlap)
+            except Exception as e:
+                totals["failed"] += 1
+                print(f"Failed: {path}: {e}")
+                return
+            if n:
+                totals["files"] += 1
+                totals["chunks"] += n
+                print(f"Loaded: {os.path.basename(path)} ({n} chunks)")
+            else:
+                totals["unchanged"] += 1
+
+    await asyncio.gather(*(run(p) for p in paths))
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load PDFs into MongoDB as embedded chunks.")
+    parser.add_argument("--folder", default=PDF_FOLDER)
+    parser.add_argument("--concurrency", type=int, default=4, help="Files processed at once")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per embedding batch / insert_many")
+    parser.add_argument("--dtype", choices=EMBED_DTYPES, default="float16")
+    parser.add_argument("--prune", action="store_true", help=f"Delete chunks retired over {PRUNE_AFTER // 86400} days ago")
+    args = parser.parse_args()
 
-# Load embedding model
-model = SentenceTransformer(EMBED_MODEL_NAME)
+    async def run():
+        totals = await load_pdfs(args.folder, concurrency=args.concurrency, batch_size=args.batch_size, dtype=args.dtype)
+        if args.prune:
+            from agents.db.database import public_docs_collection
 
-async def load_pdfs():
-    for filename in os.listdir(PDF_FOLDER):
-        if filename.endswith(".pdf"):
-            path = os.path.join(PDF_FOLDER, filename)
-            reader = PdfReader(path)
-            text = "\n".join(page.extract_text() or "" for page in reader.pages)
+            totals["pruned"] = await prune(public_docs_collection)
+        return totals
 
-            # Generate embeddings
-            embedding = model.encode([text], convert_to_numpy=True)[0].tolist()
+    start = time.perf_counter()
+    totals = asyncio.run(run())
+    print(f"{totals} in {time.perf_counter() - start:.1f}s")
 
-            # Store in MongoDB
-            await public_docs_collection.insert_one({
-                "doc_type": "pdf",
-                "title": filename,
-                "content": text,
-                "embedding": embedding
-            })
-            print(f"Loaded: {filename}")
 
 if __name__ == "__main__":
-    asyncio.run(load_pdfs())
+    main()
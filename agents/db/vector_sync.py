@@ -0,0 +1,204 @@
+#db/vector_sync.py
+"""
+Keep a FAISS VectorStore in sync with the chunk documents written by
+agents/db/load_pdfs.py, using the stored embeddings (nothing is re-encoded).
+
+    python agents/db/vector_sync.py             # incremental
+    python agents/db/vector_sync.py --rebuild   # reload every source
+
+A VectorStore has a single writer process, so the command line only works
+while the API server is stopped (the store refuses a second writer). With the
+server running, POST /sync-mongo (optionally with rebuild=true) instead; it
+runs the same sync on the server's own store.
+
+The sync state file records a watermark (the newest `updated_at` seen) and the
+content hash loaded for each source. An incremental sync only looks at sources
+with documents updated after the watermark (minus `lag`, which covers
+writers whose clocks or commits run slightly behind); a source whose newest
+live version is already loaded is skipped, so overlapping windows are cheap.
+A changed source is replaced in the store; a source with no live chunks left
+is deleted from it.
+
+Sources in the store that did not come from the collection (uploads,
+bulk_ingest.py) are left alone.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict
+
+# Make the repo root importable when run as a script from agents/db
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from agents.db.load_pdfs import decode_embeddings, ensure_indexes
+from utils.vector_store import VectorStore, chunk_key
+
+_PROJECTION = {"_id": 0, "sha256": 1, "chunk": 1, "text": 1, "start": 1, "end": 1, "embedding": 1, "dtype": 1, "dim": 1}
+
+
+# ---------- State ----------
+class SyncState:
+    """JSON {watermark, sources: {source: sha256}}, rewritten atomically."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.watermark = 0.0
+        self.sources: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.watermark = data.get("watermark", 0.0)
+            self.sources = data.get("sources", {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"watermark": self.watermark, "sources": self.sources}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+# ---------- Sync ----------
+class MongoVectorSync:
+    """Mirror the live chunks of a (motor) collection into a VectorStore."""
+
+    def __init__(
+        self,
+        collection,
+        store: VectorStore,
+        state_path: str = "data/mongo_sync.json",
+        model_name: str = None,
+        lag: float = 5.0,
+        batch_size: int = 1024,
+    ):
+        self.collection = collection
+        self.store = store
+        self.state = SyncState(state_path)
+        self.model_name = model_name  # only load chunks embedded with this model
+        self.lag = lag
+        self.batch_size = batch_size
+        self._lock = asyncio.Lock()
+
+    async def sync(self) -> dict:
+        """Apply the sources changed since the watermark."""
+        async with self._lock:
+            return await self._sync(self.state.watermark - self.lag, force=False)
+
+    async def rebuild(self) -> dict:
+        """Reload every source in the collection and drop synced sources that are gone."""
+        async with self._lock:
+            stats = await self._sync(None, force=True)
+            present = set(await self.collection.distinct("source", self._filter({"live": True})))
+            for source in [s for s in self.state.sources if s not in present]:
+                stats["removed"] += await asyncio.to_thread(self.store.delete_source, source)
+                del self.state.sources[source]
+                stats["sources"] += 1
+            self.state.save()
+            return stats
+
+    def _filter(self, query: dict) -> dict:
+        if self.model_name:
+            query["model"] = self.model_name
+        return query
+
+    async def _sync(self, since, force: bool) -> dict:
+        start = time.perf_counter()
+        await ensure_indexes(self.collection)
+        match = self._filter({} if since is None else {"updated_at": {"$gt": since}})
+        changed = self.collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$source", "updated_at": {"$max": "$updated_at"}}},
+        ])
+        stats = {"sources": 0, "added": 0, "removed": 0, "unchanged": 0}
+        watermark = self.state.watermark
+        async for row in changed:
+            status, added, removed = await self._sync_source(row["_id"], force)
+            if status == "unchanged":
+                stats["unchanged"] += 1
+            else:
+                stats["sources"] += 1
+                stats["added"] += added
+                stats["removed"] += removed
+            watermark = max(watermark, row["updated_at"])
+            # Saved per source so an interrupted sync redoes at most one source.
+            self.state.save()
+        self.state.watermark = watermark
+        self.state.save()
+        stats["watermark"] = watermark
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        return stats
+
+    async def _sync_source(self, source: str, force: bool):
+        """Returns ("unchanged" | "synced", added, removed)."""
+        # The newest live version wins; while a reload is being published two can be live.
+        newest = await self.collection.find_one(
+            self._filter({"source": source, "live": True}), projection={"sha256": 1}, sort=[("updated_at", -1)]
+        )
+        sha256 = newest["sha256"] if newest else None
+        if not force and self.state.sources.get(source) == sha256:
+            return "unchanged", 0, 0
+
+        if sha256 is None:
+            removed = await asyncio.to_thread(self.store.delete_source, source)
+            self.state.sources.pop(source, None)
+            print(f"[vector_sync] {source}: -{removed} chunks")
+            return "synced", 0, removed
+
+        # Add the new version before retiring the old one, so the source is
+        # never empty in the store; chunks unchanged at the same offsets keep their ids (dedup).
+        old_ids = await asyncio.to_thread(self.store.ids_for_source, source)
+        keep = set()
+        added = 0
+        try:
+            cursor = self.collection.find(
+                self._filter({"source": source, "sha256": sha256, "live": True}), projection=_PROJECTION
+            ).sort("chunk", 1)
+            batch = []
+            async for doc in cursor:
+                batch.append(doc)
+                if len(batch) >= self.batch_size:
+                    added += await asyncio.to_thread(self._add, source, batch, keep)
+                    batch = []
+            if batch:
+                added += await asyncio.to_thread(self._add, source, batch, keep)
+        except Exception:
+            new_ids = set(await asyncio.to_thread(self.store.ids_for_source, source)) - set(old_ids)
+            await asyncio.to_thread(self.store.delete_ids, new_ids)
+            raise
+        removed = await asyncio.to_thread(self.store.delete_stale, old_ids, keep)
+        self.state.sources[source] = sha256
+        print(f"[vector_sync] {source}: -{removed} +{added} chunks")
+        return "synced", added, removed
+
+    def _add(self, source: str, docs, keep: set) -> int:
+        texts = [d["text"] for d in docs]
+        keep.update(chunk_key(d["text"], d["start"], d["end"]) for d in docs)
+        offsets = [{"doc": source, "start": d["start"], "end": d["end"]} for d in docs]
+        ids = self.store.add_embeddings(decode_embeddings(docs), texts, [source] * len(docs), extra=offsets)
+        return len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the public FAISS store from MongoDB chunk documents.")
+    parser.add_argument("--rebuild", action="store_true", help="Reload every source instead of changes only")
+    parser.add_argument("--index-path", default="data/public_index.faiss")
+    parser.add_argument("--meta-path", default="data/public_meta.pkl")
+    parser.add_argument("--state", default="data/mongo_sync.json")
+    args = parser.parse_args()
+
+    from agents.db.database import public_docs_collection
+
+    # lexical=True matches PublicAgentRAG's default hybrid retrieval.
+    store = VectorStore(args.index_path, args.meta_path, lexical=True)
+    syncer = MongoVectorSync(public_docs_collection, store, state_path=args.state)
+    stats = asyncio.run(syncer.rebuild() if args.rebuild else syncer.sync())
+    store.compact()
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# agents/intent_router.py
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+LABELS = ("PUBLIC", "PRIVATE", "MENTAL_HEALTH")
+
+# Built-in keyword seeds; data/mental_health_keyword.json extends MENTAL_HEALTH
+# (a JSON list of terms) or any label (a JSON object of label -> terms).
+# A keyword hit skips the other tiers, so only terms that are unambiguous on
+# their own belong here: PRIVATE terms are first-person ("my gpa", not "gpa",
+# which also appears in admission questions), and service words such as
+# "therapy" or "counseling" are left to the centroid tier.
+KEYWORD_SEEDS = {
+    "PRIVATE": [
+        "my grade", "my grades", "my result", "my results", "my cgpa", "my gpa",
+        "my student id", "my id", "my transcript", "my schedule", "my class schedule", "my routine",
+        "my due", "my dues", "my tuition", "my fee", "my fees", "my payment", "my balance",
+        "my scholarship", "my attendance", "my login", "my password", "reset my password", "my account",
+    ],
+    "MENTAL_HEALTH": [
+        "stress", "stressed", "depressed", "depression", "anxiety", "anxious", "panic attack",
+        "lonely", "loneliness", "hopeless", "worthless", "overwhelmed", "burnout", "burned out",
+        "can't sleep", "cannot sleep", "insomnia", "suicidal", "suicide", "kill myself", "self harm",
+        "self-harm", "hurt myself", "want to die", "feel empty", "feeling down", "crying", "grief",
+    ],
+}
+
+# Example messages per label; their mean embeddings are the centroids.
+EXAMPLE_SEEDS = {
+    "PUBLIC": [
+        "What are the admission requirements for the computer science program?",
+        "When does the spring semester start?",
+        "Where is the central library located?",
+        "How do I apply for a scholarship?",
+        "What courses are offered in the business department?",
+        "Explain the difference between supervised and unsupervised learning.",
+        "Who is the head of the electrical engineering department?",
+        "What are the library opening hours?",
+        "What is the minimum CGPA required for admission?",
+        "How is GPA calculated at this university?",
+        "Does the university offer counseling or therapy services?",
+    ],
+    "PRIVATE": [
+        "What is my CGPA this semester?",
+        "Show me my grades for the last term.",
+        "How much tuition do I still owe?",
+        "What is my class schedule for tomorrow?",
+        "Did I pass my data structures exam?",
+        "What is my student ID?",
+        "I can't log in to my student portal account.",
+        "How many credits have I completed so far?",
+    ],
+    "MENTAL_HEALTH": [
+        "I feel so stressed about my exams that I can't sleep.",
+        "I've been feeling really down and lonely lately.",
+        "Everything feels hopeless and I don't know what to do.",
+        "I get panic attacks before presentations.",
+        "I'm overwhelmed and can't focus on anything.",
+        "I don't have motivation to do anything anymore.",
+        "I feel anxious all the time.",
+        "How can I cope with the pressure from my family?",
+    ],
+}
+
+LLM_PROMPT = """
+        You are a router. Classify the user's message into one of these categories:
+        1. PUBLIC: General, casual, or academic questions with no sensitive data.
+        2. PRIVATE: Personal data like grades, ID, result, cgpa, due, financial details, or login info.
+        3. MENTAL_HEALTH: Messages expressing stress, depression, anxiety, or emotional distress.
+
+        User message: "{message}"
+        Answer with only one label: PUBLIC, PRIVATE, or MENTAL_HEALTH.
+        """
+
+
+class RouteDecision(NamedTuple):
+    """A routing decision and which tier made it ("keyword", "embedding", "llm" or "default")."""
+    label: str
+    tier: str
+    confidence: float
+    latency_ms: float
+    detail: str = ""
+
+
+class IntentRouter:
+    """
+    Tiered PUBLIC / PRIVATE / MENTAL_HEALTH router; each tier only runs when
+    the previous one is not confident.
+
+    1. Keywords: word-boundary regexes per label. Decides when exactly one
+       label matches.
+    2. Embeddings: cosine similarity to per-label centroids of example
+       messages, using the shared sentence-transformer. Decides when the
+       best score is >= `min_similarity` and beats the runner-up by `min_margin`.
+    3. LLM: the original classification prompt, if `llm` is given.
+       Otherwise the embedding tier's best guess is used ("default").
+    """
+
+    def __init__(
+        self,
+        llm=None,
+        encoder=None,
+        embed_model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        keyword_file: str = "data/mental_health_keyword.json",
+        keywords: Dict[str, List[str]] = None,
+        examples: Dict[str, List[str]] = None,
+        min_similarity: float = 0.35,
+        min_margin: float = 0.05,
+    ):
+        self.llm = llm
+        self.embed_model_name = embed_model_name
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.counts = {tier: 0 for tier in ("keyword", "embedding", "llm", "default")}
+
+        terms = {label: list(words) for label, words in KEYWORD_SEEDS.items()}
+        for label, words in (keywords or {}).items():
+            terms.setdefault(label, []).extend(words)
+        for label, words in load_keywords(keyword_file).items():
+            terms.setdefault(label, []).extend(words)
+        self.patterns = {label: _compile(words) for label, words in terms.items() if words}
+
+        self.examples = {label: list(texts) for label, texts in EXAMPLE_SEEDS.items()}
+        for label, texts in (examples or {}).items():
+            self.examples.setdefault(label, []).extend(texts)
+
+        self._encoder = encoder
+        self._centroids = None
+        self._lock = threading.Lock()
+
+    # ---------- Public API ----------
+    def route(self, message: str) -> RouteDecision:
+        start = time.perf_counter()
+
+        label, detail = self.match_keywords(message)
+        if label is not None:
+            return self._decide(label, "keyword", 1.0, start, detail)
+
+        scores = self.centroid_scores(message)
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        best, runner_up = ranked[0], ranked[1]
+        margin = scores[best] - scores[runner_up]
+        detail = ", ".join(f"{k}={v:.2f}" for k, v in scores.items())
+        if scores[best] >= self.min_similarity and margin >= self.min_margin:
+            return self._decide(best, "embedding", float(margin), start, detail)
+
+        if self.llm is not None:
+            return self._decide(self.llm_classify(message), "llm", 0.0, start, detail)
+        return self._decide(best, "default", float(margin), start, detail)
+
+    def classify(self, message: str) -> str:
+        return self.route(message).label
+
+    def match_keywords(self, message: str):
+        """(label, matched term) if exactly one label's keywords match, else (None, "")."""
+        hits = {}
+        for label, pattern in self.patterns.items():
+            m = pattern.search(message)
+            if m:
+                hits[label] = m.group(0)
+        if len(hits) == 1:
+            label, term = next(iter(hits.items()))
+            return label, term
+        return None, ""
+
+    def centroid_scores(self, message: str) -> Dict[str, float]:
+        centroids = self._get_centroids()
+        q = _normalize(self._get_encoder().encode([message], convert_to_numpy=True))
+        sims = (centroids @ q[0]).tolist()
+        return dict(zip(self.examples, sims))
+
+    def llm_classify(self, message: str) -> str:
+        classification = self.llm(LLM_PROMPT.format(message=message)).strip().upper()
+        # deepseek-r1 may prepend reasoning; take the last label it names.
+        found = re.findall(r"MENTAL_HEALTH|PRIVATE|PUBLIC", classification)
+        return found[-1] if found else "PUBLIC"
+
+    def stats(self) -> dict:
+        total = sum(self.counts.values())
+        return {"decisions": total, "by_tier": dict(self.counts),
+                "llm_rate": self.counts["llm"] / total if total else 0.0}
+
+    # ---------- Internal helpers ----------
+    def _decide(self, label: str, tier: str, confidence: float, start: float, detail: str) -> RouteDecision:
+        self.counts[tier] += 1
+        return RouteDecision(label, tier, confidence, (time.perf_counter() - start) * 1000, detail)
+
+    def _get_encoder(self):
+        if self._encoder is None:
+            from utils.embedding_service import get_encoder
+
+            self._encoder = get_encoder(self.embed_model_name)
+        return self._encoder
+
+    def _get_centroids(self) -> np.ndarray:
+        with self._lock:
+            if self._centroids is None:
+                rows = []
+                for label in self.examples:
+                    vecs = _normalize(self._get_encoder().encode(self.examples[label], convert_to_numpy=True))
+                    rows.append(vecs.mean(axis=0))
+                self._centroids = _normalize(np.stack(rows))
+            return self._centroids
+
+
+def load_keywords(path: str) -> Dict[str, List[str]]:
+    """Keyword file as label -> terms; a missing or empty file gives no extra terms."""
+    if not path or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return {"MENTAL_HEALTH": [str(w) for w in data]}
+    return {label.upper(): [str(w) for w in words] for label, words in data.items()}
+
+
+def _compile(words: List[str]):
+    alternatives = sorted({re.escape(w.lower()) for w in words if w.strip()}, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE)
+
+
+def _normalize(vecs) -> np.ndarray:
+    vecs = np.asarray(vecs, dtype=np.float32).reshape(-1, np.shape(vecs)[-1])
+    return vecs / (np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12)
@@ -0,0 +1,385 @@
+# agents/llm_client.py
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+import ollama
+
+from utils.context_builder import approx_tokens
+from utils.metrics import counter, gauge, histogram, span
+
+DEFAULT_MODEL = "deepseek-r1:1.5b"
+
+LLM_IN_FLIGHT = gauge("llm_in_flight", "Generations running against Ollama.")
+LLM_TOKENS = counter("llm_tokens", "Prompt (in) and generated (out) tokens, as counted by Ollama.", ("direction",))
+LLM_REQUESTS = counter("llm_requests", "LLM calls by outcome (coalesced calls shared another's generation).",
+                       ("result",))
+LLM_FIRST_TOKEN = histogram("llm_first_token_seconds", "Time from sending a streamed request to its first token.")
+
+
+class ModelGate:
+    """
+    Concurrency cap shared by the sync and async paths: at most `limit`
+    requests to one model run at once, whichever API they come through.
+    Waiters of both kinds queue in one FIFO and `release` hands the slot to
+    the oldest: a sync caller blocks on an event, an async caller awaits a
+    future that is resolved on its own event loop.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiters = deque()  # (None, threading.Event) or (loop, future)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def acquire(self):
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return
+            event = threading.Event()
+            self._waiters.append((None, event))
+        event.wait()  # the slot is handed over by release()
+
+    async def acquire_async(self):
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter  # the slot is handed over by release()
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = (loop, waiter) in self._waiters
+                if queued:
+                    self._waiters.remove((loop, waiter))
+            if not queued and waiter.done() and not waiter.cancelled():
+                # Cancelled after the slot was handed over: pass it on.
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            # Hand the slot straight to the oldest waiter, sync or async.
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if loop is None:
+                    waiter.set()
+                    return
+                if not waiter.done() and not loop.is_closed():
+                    loop.call_soon_threadsafe(self._hand_over, waiter)
+                    return
+            self.in_flight -= 1
+
+    def _hand_over(self, waiter: asyncio.Future):
+        # Runs on the waiter's loop; if it was cancelled meanwhile, pass the slot on.
+        if waiter.done():
+            self.release()
+        else:
+            waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "waiting": self.waiting}
+
+
+_gates: Dict[str, ModelGate] = {}
+_gates_lock = threading.Lock()
+
+
+def model_gate(model: str, limit: int) -> ModelGate:
+    """The process-wide gate for `model`; the first caller sets its limit."""
+    with _gates_lock:
+        if model not in _gates:
+            _gates[model] = ModelGate(limit)
+        return _gates[model]
+
+
+class LLMClient:
+    """
+    Ollama chat client with persistent connections and request coalescing.
+
+    - One sync `ollama.Client` and one `ollama.AsyncClient` per event loop
+      are kept for the client's lifetime, so HTTP connections are reused
+      instead of opened per call. `timeout` (seconds) applies to every request.
+    - `keep_alive` is sent with every request (and `preload` sends it without
+      a prompt), so Ollama keeps the model loaded between bursts; `num_ctx`
+      and any other `options` are passed through as model options.
+    - Identical prompts (same model, options and messages) in flight at the
+      same time share one generation (singleflight). Streams are not coalesced.
+    - At most `max_concurrency` requests per model run at once across all
+      clients in the process (see ModelGate).
+
+    Errors are raised; `agents.llm_interface` turns them into "[LLM Error]" text
+    for whole answers and re-raises them from the streaming helpers.
+    """
+
+    def __init__(
+        self,
+        model: str = DEFAULT_MODEL,
+        host: str = None,
+        keep_alive="30m",
+        num_ctx: int = None,
+        options: dict = None,
+        timeout: float = 120.0,
+        max_concurrency: int = 4,
+        coalesce: bool = True,
+    ):
+        self.model = model
+        self.host = host
+        self.keep_alive = keep_alive
+        self.options = dict(options or {})
+        if num_ctx:
+            self.options["num_ctx"] = int(num_ctx)
+        self.timeout = timeout
+        self.coalesce = coalesce
+        self.gate = model_gate(model, max_concurrency)
+        self.requests = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._client = None
+        # event loop -> AsyncClient, keyed by the loop object rather than id(loop),
+        # which a later loop can reuse after asyncio.run() returns.
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Future] = {}
+        self._async_flights: Dict[tuple, list] = {}  # key -> [task, callers]
+
+    # ---------- Sync API ----------
+    def chat(self, messages) -> str:
+        """Answer text for a chat `messages` list."""
+        key = self._key(messages)
+        with self._lock:
+            flight = self._flights.get(key) if self.coalesce else None
+            leader = flight is None
+            if leader:
+                flight = Future()
+                if self.coalesce:
+                    self._flights[key] = flight
+            else:
+                self.coalesced += 1
+                LLM_REQUESTS.labels("coalesced").inc()
+        if not leader:
+            return flight.result()
+
+        try:
+            flight.set_result(self._chat_once(messages))
+        except Exception as e:
+            flight.set_exception(e)
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+        return flight.result()
+
+    def generate(self, prompt: str) -> str:
+        return self.chat([{"role": "user", "content": prompt}])
+
+    def stream(self, messages):
+        """Yield answer text chunks as Ollama produces them."""
+        with span("llm_gate"):
+            self.gate.acquire()
+        try:
+            self.requests += 1
+            with LLM_IN_FLIGHT.track(), span("llm"):
+                start, first = time.perf_counter(), True
+                for chunk in self._sync_client().chat(
+                    model=self.model, messages=messages, stream=True, options=self.options or None,
+                    keep_alive=self.keep_alive,
+                ):
+                    if first:
+                        LLM_FIRST_TOKEN.observe(time.perf_counter() - start)
+                        first = False
+                    if chunk.get("done"):
+                        _count_tokens(chunk)
+                    if chunk["message"]["content"]:
+                        yield chunk["message"]["content"]
+            LLM_REQUESTS.labels("ok").inc()
+        except Exception:
+            self.errors += 1
+            LLM_REQUESTS.labels("error").inc()
+            raise
+        finally:
+            self.gate.release()
+
+    def preload(self):
+        """Load the model (and reset its keep-alive timer) without generating."""
+        self._sync_client().generate(model=self.model, keep_alive=self.keep_alive)
+
+    # ---------- Async API ----------
+    async def achat(self, messages) -> str:
+        if not self.coalesce:
+            return await self._achat_once(messages)
+        # The generation runs as its own task: a caller that goes away (e.g.
+        # a client disconnect) does not cancel it for the others, and it is
+        # only cancelled once every caller has gone.
+        loop = asyncio.get_running_loop()
+        key = (loop, self._key(messages))
+        flight = self._async_flights.get(key)
+        if flight is None:
+            task = loop.create_task(self._achat_once(messages))
+            flight = self._async_flights[key] = [task, 0]
+            task.add_done_callback(lambda _: self._async_flights.pop(key, None))
+        else:
+            self.coalesced += 1
+            LLM_REQUESTS.labels("coalesced").inc()
+        flight[1] += 1
+        try:
+            return await asyncio.shield(flight[0])
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not flight[0].done():
+                flight[0].cancel()
+
+    async def agenerate(self, prompt: str) -> str:
+        return await self.achat([{"role": "user", "content": prompt}])
+
+    async def astream(self, messages):
+        """Async variant of `stream`."""
+        with span("llm_gate"):
+            await self.gate.acquire_async()
+        try:
+            self.requests += 1
+            with LLM_IN_FLIGHT.track(), span("llm"):
+                start, first = time.perf_counter(), True
+                stream = await self._async_client().chat(
+                    model=self.model, messages=messages, stream=True, options=self.options or None,
+                    keep_alive=self.keep_alive,
+                )
+                async for chunk in stream:
+                    if first:
+                        LLM_FIRST_TOKEN.observe(time.perf_counter() - start)
+                        first = False
+                    if chunk.get("done"):
+                        _count_tokens(chunk)
+                    if chunk["message"]["content"]:
+                        yield chunk["message"]["content"]
+            LLM_REQUESTS.labels("ok").inc()
+        except Exception:
+            self.errors += 1
+            LLM_REQUESTS.labels("error").inc()
+            raise
+        finally:
+            self.gate.release()
+
+    async def apreload(self):
+        await self._async_client().generate(model=self.model, keep_alive=self.keep_alive)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "gate": self.gate.stats(),
+        }
+
+    # ---------- Internal helpers ----------
+    def _chat_once(self, messages) -> str:
+        with span("llm_gate"):
+            self.gate.acquire()
+        try:
+            self.requests += 1
+            with LLM_IN_FLIGHT.track(), span("llm"):
+                response = self._sync_client().chat(
+                    model=self.model, messages=messages, options=self.options or None, keep_alive=self.keep_alive,
+                )
+            _count_tokens(response)
+            LLM_REQUESTS.labels("ok").inc()
+            return response["message"]["content"]
+        except Exception:
+            self.errors += 1
+            LLM_REQUESTS.labels("error").inc()
+            raise
+        finally:
+            self.gate.release()
+
+    async def _achat_once(self, messages) -> str:
+        with span("llm_gate"):
+            await self.gate.acquire_async()
+        try:
+            self.requests += 1
+            with LLM_IN_FLIGHT.track(), span("llm"):
+                response = await self._async_client().chat(
+                    model=self.model, messages=messages, options=self.options or None, keep_alive=self.keep_alive,
+                )
+            _count_tokens(response)
+            LLM_REQUESTS.labels("ok").inc()
+            return response["message"]["content"]
+        except Exception:
+            self.errors += 1
+            LLM_REQUESTS.labels("error").inc()
+            raise
+        finally:
+            self.gate.release()
+
+    def _sync_client(self) -> ollama.Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = ollama.Client(host=self.host, timeout=self.timeout)
+        return self._client
+
+    def _async_client(self) -> ollama.AsyncClient:
+        # httpx async clients are bound to the loop they were first used on.
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            # Open connections keep their loop alive, so also drop clients of closed loops.
+            for stale in [other for other in list(self._async_clients) if other.is_closed()]:
+                self._async_clients.pop(stale, None)
+            client = self._async_clients[loop] = ollama.AsyncClient(host=self.host, timeout=self.timeout)
+        return client
+
+    def _key(self, messages) -> str:
+        payload = json.dumps([self.model, self.options, messages], sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _count_tokens(response):
+    # Ollama reports prompt_eval_count / eval_count on the final response.
+    tokens_in, tokens_out = response.get("prompt_eval_count"), response.get("eval_count")
+    if tokens_in is None and tokens_out is None:
+        # Servers that don't report counts: estimate the generated side only.
+        tokens_out = approx_tokens(response.get("message", {}).get("content", "") or "")
+    if tokens_in:
+        LLM_TOKENS.labels("in").inc(tokens_in)
+    if tokens_out:
+        LLM_TOKENS.labels("out").inc(tokens_out)
+
+
+_default_client: Optional[LLMClient] = None
+_default_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """
+    The process-wide client, configured from the environment:
+    OLLAMA_MODEL, OLLAMA_HOST, OLLAMA_KEEP_ALIVE, OLLAMA_NUM_CTX,
+    OLLAMA_TIMEOUT and LLM_MODEL_CONCURRENCY.
+    """
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+            _default_client = LLMClient(
+                model=os.getenv("OLLAMA_MODEL", DEFAULT_MODEL),
+                host=os.getenv("OLLAMA_HOST") or None,
+                keep_alive=int(keep_alive) if keep_alive.lstrip("-").isdigit() else keep_alive,
+                num_ctx=int(os.getenv("OLLAMA_NUM_CTX", "0")) or None,
+                timeout=float(os.getenv("OLLAMA_TIMEOUT", "120")),
+                max_concurrency=int(os.getenv("LLM_MODEL_CONCURRENCY", "4")),
+            )
+        return _default_client
@@ -1,19 +1,131 @@
 # agents/llm_interface.py
-import ollama
+from .llm_client import get_client
+
 
 def local_llm(prompt: str, memory_manager=None) -> str:
     """
-    Sends the prompt to the Ollama LLM.
+    Sends the prompt to the Ollama LLM (through the shared LLMClient).
     If memory_manager is provided, include conversation context.
     """
     try:
         if memory_manager:
             prompt = memory_manager.get_contexted_prompt(prompt)
 
-        response = ollama.chat(
-            model="deepseek-r1:1.5b",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response['message']['content']
+        return get_client().chat([{"role": "user", "content": prompt}])
     except Exception as e:
         return f"[LLM Error] {str(e)}"
+
+
+async def async_local_llm(prompt: str, memory_manager=None) -> str:
+    """
+    Async variant of local_llm for the FastAPI app.
+    Waits on the Ollama HTTP call without holding a worker thread.
+    """
+    try:
+        if memory_manager:
+            prompt = memory_manager.get_contexted_prompt(prompt)
+
+        return await get_client().achat([{"role": "user", "content": prompt}])
+    except Exception as e:
+        return f"[LLM Error] {str(e)}"
+
+
+class ThinkFilter:
+    """
+    Incrementally removes <think>...</think> blocks from streamed text.
+    Tags split across chunk boundaries are held back until they can be decided.
+    """
+    OPEN, CLOSE = "<think>", "</think>"
+
+    def __init__(self):
+        self.buffer = ""
+        self.in_think = False
+        self.after_think = False
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        out = []
+        while self.buffer:
+            if self.in_think:
+                end = self.buffer.find(self.CLOSE)
+                if end < 0:
+                    keep = self._partial(self.buffer, self.CLOSE)
+                    self.buffer = self.buffer[len(self.buffer) - keep:]
+                    break
+                self.buffer = self.buffer[end + len(self.CLOSE):]
+                self.in_think = False
+                self.after_think = True
+            else:
+                if self.after_think:
+                    # Drop the blank lines the model emits after its reasoning.
+                    self.buffer = self.buffer.lstrip()
+                    if not self.buffer:
+                        break
+                    self.after_think = False
+                start = self.buffer.find(self.OPEN)
+                if start >= 0:
+                    out.append(self.buffer[:start])
+                    self.buffer = self.buffer[start + len(self.OPEN):]
+                    self.in_think = True
+                    continue
+                keep = self._partial(self.buffer, self.OPEN)
+                out.append(self.buffer[:len(self.buffer) - keep])
+                self.buffer = self.buffer[len(self.buffer) - keep:]
+                break
+        return "".join(out)
+
+    def flush(self) -> str:
+        rest = "" if self.in_think else self.buffer
+        self.buffer = ""
+        return rest
+
+    @staticmethod
+    def _partial(text: str, tag: str) -> int:
+        """Length of the longest suffix of `text` that is a proper prefix of `tag`."""
+        for n in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:n]):
+                return n
+        return 0
+
+
+def strip_think(text: str) -> str:
+    """`text` without its <think>...</think> reasoning blocks."""
+    think = ThinkFilter()
+    return (think.feed(text) + think.flush()).strip()
+
+
+def stream_local_llm(prompt: str, memory_manager=None, strip_think: bool = True):
+    """
+    Streaming variant of local_llm: yields answer tokens as Ollama produces them.
+    With strip_think, <think> reasoning blocks are filtered out on the fly.
+    Errors are raised, not yielded: tokens already sent cannot be taken back,
+    so the caller reports the failure (and does not keep the partial answer).
+    """
+    think = ThinkFilter() if strip_think else None
+    if memory_manager:
+        prompt = memory_manager.get_contexted_prompt(prompt)
+
+    for token in get_client().stream([{"role": "user", "content": prompt}]):
+        token = think.feed(token) if think else token
+        if token:
+            yield token
+    if think:
+        rest = think.flush()
+        if rest:
+            yield rest
+
+
+async def astream_local_llm(prompt: str, memory_manager=None, strip_think: bool = True):
+    """Async variant of stream_local_llm; errors are raised as well."""
+    think = ThinkFilter() if strip_think else None
+    if memory_manager:
+        prompt = memory_manager.get_contexted_prompt(prompt)
+
+    async for token in get_client().astream([{"role": "user", "content": prompt}]):
+        token = think.feed(token) if think else token
+        if token:
+            yield token
+    if think:
+        rest = think.flush()
+        if rest:
+            yield rest
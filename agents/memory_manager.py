@@ -1,20 +1,58 @@
 # agents/memory_manager.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+from utils.context_builder import approx_tokens
+
+
 class MemoryManager:
-    def __init__(self, max_history=5):
+    """
+    Recent conversation turns for one session.
+
+    Keeps at most `max_history` messages and, if `max_tokens` is set, drops
+    the oldest ones until the history fits that many tokens. Token counts
+    are kept per message and summed incrementally, and the joined history
+    is cached until the next change.
+    """
+
+    def __init__(self, max_history=5, max_tokens: int = None, count_tokens=approx_tokens):
         self.max_history = max_history
-        self.buffer = []
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.buffer = deque()
+        self.tokens = 0
+        self.last_used = time.time()
+        self._summary = None
 
     def add_message(self, role: str, content: str):
-        self.buffer.append({"role": role, "content": content})
-        if len(self.buffer) > self.max_history:
-            self.buffer.pop(0)  # keep only recent messages
+        line = f"{role}: {content}"
+        tokens = self.count_tokens(line)
+        self.buffer.append({"role": role, "content": content, "tokens": tokens})
+        self.tokens += tokens
+        while len(self.buffer) > self.max_history or (
+            self.max_tokens and self.tokens > self.max_tokens and len(self.buffer) > 1
+        ):
+            self.tokens -= self.buffer.popleft()["tokens"]  # keep only recent messages
+        self.last_used = time.time()
+        self._summary = None
+
+    def clear(self):
+        self.buffer.clear()
+        self.tokens = 0
+        self._summary = None
 
     def get_summary(self) -> str:
         """
         Return conversation history as a single string suitable for LLM prompts.
         """
-        summary_lines = [f"{m['role']}: {m['content']}" for m in self.buffer]
-        return "\n".join(summary_lines)
+        if self._summary is None:
+            self._summary = "\n".join(f"{m['role']}: {m['content']}" for m in self.buffer)
+        return self._summary
 
     def get_contexted_prompt(self, user_prompt: str) -> str:
         """
@@ -25,3 +63,200 @@ class MemoryManager:
             return f"{history}\nUser: {user_prompt}\nAssistant:"
         else:
             return f"User: {user_prompt}\nAssistant:"
+
+    def to_dict(self) -> dict:
+        return {"messages": [{"role": m["role"], "content": m["content"]} for m in self.buffer],
+                "last_used": self.last_used}
+
+    @classmethod
+    def from_dict(cls, data: dict, **kwargs) -> "MemoryManager":
+        memory = cls(**kwargs)
+        for m in data.get("messages", []):
+            memory.add_message(m["role"], m["content"])
+        memory.last_used = data.get("last_used", memory.last_used)
+        return memory
+
+
+class SessionMemory:
+    """
+    MemoryManager per session id, for the API.
+
+    - At most `max_sessions` are kept in memory; the least recently used one
+      is evicted beyond that, and sessions idle for `ttl` seconds are evicted
+      on the next access (or `sweep`).
+    - With `spill_dir`, an evicted session is written there as JSON and read
+      back the next time its id is used; spilled files older than `ttl` are
+      deleted by `sweep`. Without it, evicted history is dropped. File reads
+      and writes happen outside the lock.
+    - Each session keeps at most `max_history` messages and `max_tokens`
+      tokens, so memory stays bounded however many users there are.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10_000,
+        ttl: float = 3600.0,
+        max_history: int = 20,
+        max_tokens: int = 1000,
+        spill_dir: str = None,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_history = max_history
+        self.max_tokens = max_tokens
+        self.spill_dir = spill_dir
+        self.sessions: "OrderedDict[str, MemoryManager]" = OrderedDict()
+        # Evicted sessions whose spill file is not written yet, as a one-tuple
+        # (memory,) per eviction so a writer can tell whether it is still current.
+        self._spilling: Dict[str, tuple] = {}
+        self.created = 0
+        self.evicted = 0
+        self.spilled = 0
+        self.restored = 0
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()  # serializes spill file writes
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    # ---------- Public API ----------
+    def get(self, session_id: str) -> MemoryManager:
+        """The session's memory, restoring it from disk or creating it."""
+        now = time.time()
+        with self._lock:
+            memory = self._lookup(session_id, now)
+            if memory is not None:
+                memory.last_used = now
+                return memory
+
+        # Not in memory: read a spilled copy without holding the lock.
+        data = self._read_spill(session_id, now)
+        with self._lock:
+            memory = self._lookup(session_id, now)  # a concurrent request may have created it
+            if memory is None:
+                if data is not None:
+                    memory = MemoryManager.from_dict(data, max_history=self.max_history, max_tokens=self.max_tokens)
+                    self.restored += 1
+                else:
+                    memory = self._new()
+                    self.created += 1
+                self.sessions[session_id] = memory
+            memory.last_used = now
+            evicted = self._evict_over_capacity()
+        self._spill(evicted)
+        return memory
+
+    def drop(self, session_id: str):
+        with self._lock:
+            self.sessions.pop(session_id, None)
+            self._spilling.pop(session_id, None)
+        if self.spill_dir:
+            _remove(self._spill_path(session_id))
+
+    def sweep(self) -> int:
+        """Evict sessions idle longer than `ttl` and delete expired spill files."""
+        now = time.time()
+        with self._lock:
+            idle = [sid for sid, m in self.sessions.items() if now - m.last_used > self.ttl]
+            for sid in idle:
+                del self.sessions[sid]
+            self.evicted += len(idle)
+        if self.spill_dir:
+            for name in os.listdir(self.spill_dir):
+                path = os.path.join(self.spill_dir, name)
+                try:
+                    expired = now - os.path.getmtime(path) > self.ttl
+                except FileNotFoundError:
+                    continue  # restored meanwhile
+                if expired:
+                    _remove(path)
+        return len(idle)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self.sessions),
+                "tokens": sum(m.tokens for m in self.sessions.values()),
+                "created": self.created,
+                "evicted": self.evicted,
+                "spilled": self.spilled,
+                "restored": self.restored,
+            }
+
+    # ---------- Internal helpers ----------
+    def _new(self) -> MemoryManager:
+        return MemoryManager(max_history=self.max_history, max_tokens=self.max_tokens)
+
+    def _lookup(self, session_id: str, now: float) -> Optional[MemoryManager]:
+        # Caller holds the lock.
+        memory = self.sessions.get(session_id)
+        if memory is not None:
+            if now - memory.last_used > self.ttl:
+                del self.sessions[session_id]
+                return None
+            self.sessions.move_to_end(session_id)
+            return memory
+        # Evicted moments ago and still being written out: take it back as is.
+        entry = self._spilling.pop(session_id, None)
+        if entry is None:
+            return None
+        self.sessions[session_id] = entry[0]
+        return entry[0]
+
+    def _evict_over_capacity(self):
+        """Evict least recently used sessions; returns those to spill (caller holds the lock)."""
+        evicted = []
+        while len(self.sessions) > self.max_sessions:
+            sid, memory = self.sessions.popitem(last=False)
+            self.evicted += 1
+            if self.spill_dir and memory.buffer and time.time() - memory.last_used <= self.ttl:
+                entry = self._spilling[sid] = (memory,)
+                evicted.append((sid, entry))
+        return evicted
+
+    def _spill_path(self, session_id: str) -> str:
+        # Session ids come from clients, so they never become file names directly.
+        name = hashlib.blake2b(session_id.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.spill_dir, name + ".json")
+
+    def _spill(self, evicted):
+        if not evicted:
+            return
+        with self._spill_lock:
+            for session_id, entry in evicted:
+                with self._lock:
+                    if self._spilling.get(session_id) is not entry:
+                        continue  # taken back, dropped or evicted again since
+                    data = dict(entry[0].to_dict(), session_id=session_id)
+                path = self._spill_path(session_id)
+                tmp = path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp, path)
+                with self._lock:
+                    current = self._spilling.get(session_id) is entry
+                    if current:
+                        del self._spilling[session_id]
+                        self.spilled += 1
+                if not current:
+                    _remove(path)  # taken back or dropped while it was being written
+
+    def _read_spill(self, session_id: str, now: float) -> Optional[dict]:
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(session_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.remove(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if data.get("session_id") != session_id or now - data.get("last_used", 0) > self.ttl:
+            return None
+        return data
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
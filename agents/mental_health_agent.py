@@ -1,11 +1,18 @@
 # agents/mental_health_agent.py
+import hashlib
 import os
+import re
 import pickle
 import numpy as np
-import pandas as pd
 import faiss
-from sentence_transformers import SentenceTransformer
 from .llm_interface import local_llm
+from utils.embedding_service import get_encoder
+from utils.index_factory import build_index, train_index, search_params, index_kind
+from utils.metadata_store import MetadataStore, compact_path, TEXT, HASH
+from utils.context_builder import ContextBuilder
+
+PAIR_SCHEMA = {"human": TEXT, "assistant": TEXT, "hash": HASH}
+PAIR_PATTERN = r"<HUMAN>:(.*?)<ASSISTANT>:(.*)"
 
 
 class MentalHealthAgent:
@@ -20,8 +27,12 @@ class MentalHealthAgent:
         * Builds normalized embeddings with SentenceTransformer
         * Saves:
             - FAISS index  -> index_path (e.g. data/mh_index.faiss)
-            - Metadata     -> meta_path  (e.g. data/mh_meta.pkl)
-    - On subsequent runs: loads both files instantly.
+            - Q/A pairs    -> compact_path(meta_path) (e.g. data/mh_meta/),
+              a memory-mapped MetadataStore
+    - On subsequent runs: loads both files instantly. If the CSV, the
+      embedding model or the index type changed since the build (see the
+      fingerprint saved with the pairs), the index is updated: only new
+      pairs are embedded and removed ones are dropped.
 
     - At query time:
         * Encodes the user message (1 vector)
@@ -40,6 +51,15 @@ class MentalHealthAgent:
         threshold: float = 0.55,  # cosine similarity threshold (0..1)
         include_context_in_fallback: bool = True,
         fallback_context_k: int = 3,
+        fallback_context_budget: int = 400,  # LLM tokens of examples in the fallback prompt
+        fallback_min_score: float = 0.3,
+        index_type: str = "flat",  # "flat", "hnsw", "ivf" or "ivfpq"
+        index_options: dict = None,
+        nprobe: int = None,
+        ef_search: int = None,
+        mmap_index: bool = False,
+        encode_batch_size: int = 256,
+        csv_chunk_rows: int = 10_000,
     ):
         self.csv_file = csv_file
         self.index_path = index_path
@@ -48,14 +68,33 @@ class MentalHealthAgent:
         self.threshold = float(threshold)
         self.include_context_in_fallback = include_context_in_fallback
         self.fallback_context_k = max(1, fallback_context_k)
+        self.context_builder = ContextBuilder(
+            token_budget=fallback_context_budget, min_score=fallback_min_score, separator="\n\n"
+        )
+        self.last_context = None
+        self.index_type = index_type
+        self.index_options = index_options or {}
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.mmap_index = mmap_index
+        self.encode_batch_size = encode_batch_size
+        self.csv_chunk_rows = csv_chunk_rows
+        self.embed_model_name = embed_model_name
 
-        # Load embedding model once
-        self.model = SentenceTransformer(embed_model_name)
+        # Shared embedding model (loaded once per process, cached and micro-batched)
+        self.model = get_encoder(embed_model_name)
 
         # Try to load prebuilt index + metadata; otherwise build them.
-        if os.path.exists(self.index_path) and os.path.exists(self.meta_path):
+        self.pairs_path = compact_path(meta_path)
+        if os.path.exists(self.index_path) and (
+            MetadataStore.exists(self.pairs_path) or os.path.isfile(self.meta_path)
+        ):
             self._load_index_and_meta()
             print("MentalHealthAgent: Loaded FAISS index and metadata.")
+            if self._is_stale():
+                print("MentalHealthAgent: Dataset or model changed, updating index...")
+                self._build_index_from_csv(incremental=True)
+                print("MentalHealthAgent: Index updated and saved.")
         else:
             print("MentalHealthAgent: Building index from CSV (first run)...")
             self._build_index_from_csv()
@@ -75,7 +114,8 @@ class MentalHealthAgent:
         q = self._encode_and_normalize([message])  # shape (1, d)
 
         # Search FAISS (inner product on normalized vectors -> cosine similarity)
-        D, I = self.index.search(q, self.top_k)    # D: scores, I: indices
+        params = search_params(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
+        D, I = self.index.search(q, self.top_k, params=params)    # D: scores, I: indices
         scores = D[0]
         idxs = I[0]
 
@@ -83,9 +123,10 @@ class MentalHealthAgent:
         best_score = float(scores[0])
         best_idx = int(idxs[0])
 
-        if best_idx >= 0 and best_score >= self.threshold:
+        answer = self.pairs.field(best_idx, "assistant") if best_idx >= 0 else None
+        if answer is not None and best_score >= self.threshold:
             # High-confidence match from dataset
-            return self.pairs[best_idx]["assistant"]
+            return answer
 
         # Fallback: LLM (optionally give small retrieved context)
         if self.include_context_in_fallback:
@@ -96,57 +137,166 @@ class MentalHealthAgent:
         return local_llm(self._fallback_prompt(message, context_text))
 
     # ---------- Internal helpers ----------
-    def _build_index_from_csv(self):
-        df = pd.read_csv(self.csv_file)
-        if "text" not in df.columns:
-            raise ValueError("MentalHealthAgent: CSV must contain a 'text' column.")
-
-        # Parse Q/A pairs
-        pairs = []
-        for raw in df["text"].dropna().astype(str).tolist():
-            if "<HUMAN>:" in raw and "<ASSISTANT>:" in raw:
-                human_part, rest = raw.split("<ASSISTANT>:", 1)
-                human = human_part.replace("<HUMAN>:", "").strip()
-                assistant = rest.strip()
-                if human and assistant:
-                    pairs.append({"human": human, "assistant": assistant})
-
-        if not pairs:
+    def warm_up(self):
+        """Encode and search once so the first user message is not slowed by lazy loading."""
+        if getattr(self, "index", None) is not None:
+            q = self._encode_and_normalize(["warm up"])
+            self.index.search(q, self.top_k, params=search_params(self.index, nprobe=self.nprobe, ef_search=self.ef_search))
+
+    def _build_index_from_csv(self, incremental: bool = False):
+        """
+        Build the index from the CSV, streaming: pairs are parsed in chunks and
+        questions are encoded in batches that go straight into the index.
+        With `incremental`, the current index is updated in place when the
+        model and index type are unchanged: only pairs not yet indexed are
+        embedded, and pairs gone from the CSV are removed.
+        """
+        pairs = self._read_pairs()
+        if pairs.empty:
             raise ValueError("MentalHealthAgent: No valid <HUMAN>/<ASSISTANT> pairs found.")
 
-        self.pairs = pairs
+        dim = self.model.get_sentence_embedding_dimension()
+        fingerprint = self._fingerprint(dim)
+        update = self._update_index(pairs) if incremental and self._can_update(fingerprint) else None
+        if update is not None:
+            index, store, added, removed = update
+            print(f"MentalHealthAgent: Embedded {added} new pairs, removed {removed}.")
+        else:
+            index = faiss.IndexIDMap2(build_index(self.index_type, dim, n_vectors=len(pairs), **self.index_options))
+            ids = np.arange(len(pairs), dtype=np.int64)
+            self._embed_into(index, ids, pairs["human"].tolist())
+            store = MetadataStore(PAIR_SCHEMA)
+            store.append(ids, pairs.to_dict("records"))
+
+        # Save index, then the pairs with the fingerprint (vectors without a
+        # saved pair are cleaned up by the next update).
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp_index = f"{self.index_path}.tmp"
+        faiss.write_index(index, tmp_index)
+        os.replace(tmp_index, self.index_path)
+        store.save(self.pairs_path, extra={"dim": dim, "fingerprint": fingerprint})
 
-        # Build embeddings (normalized for cosine similarity)
-        questions = [p["human"] for p in self.pairs]
-        emb = self._encode_and_normalize(questions)  # (N, d)
+        # Keep in memory
+        self.index = index
+        self.pairs = store
+
+    def _read_pairs(self):
+        """Parse <HUMAN>/<ASSISTANT> pairs with vectorized string ops, reading the CSV in chunks."""
+        import pandas as pd  # only needed on (re)build
+
+        frames = []
+        try:
+            reader = pd.read_csv(self.csv_file, usecols=["text"], chunksize=self.csv_chunk_rows)
+            for chunk in reader:
+                parts = chunk["text"].dropna().astype(str).str.extract(PAIR_PATTERN, flags=re.DOTALL)
+                parts.columns = ["human", "assistant"]
+                parts = parts.dropna()
+                parts["human"] = parts["human"].str.strip()
+                parts["assistant"] = parts["assistant"].str.strip()
+                frames.append(parts[(parts["human"] != "") & (parts["assistant"] != "")])
+        except ValueError as e:
+            if "text" in str(e):
+                raise ValueError("MentalHealthAgent: CSV must contain a 'text' column.") from e
+            raise
+
+        pairs = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["human", "assistant"])
+        pairs["hash"] = [_pair_hash(h, a) for h, a in zip(pairs["human"], pairs["assistant"])]
+        return pairs.drop_duplicates("hash", ignore_index=True)
+
+    def _embed_into(self, index, ids: np.ndarray, questions):
+        """Encode `questions` in batches and add them to `index` under `ids`."""
+        train_size = self.index_options.get("train_size", 100_000)
+        pending, pending_ids = [], []
+        for start in range(0, len(questions), self.encode_batch_size):
+            vec = self._encode_and_normalize(questions[start:start + self.encode_batch_size])
+            batch_ids = ids[start:start + self.encode_batch_size]
+            if index.is_trained:
+                index.add_with_ids(vec, batch_ids)
+                continue
+            # IVF indexes need training first: hold back vectors until the sample is large enough.
+            pending.append(vec)
+            pending_ids.append(batch_ids)
+            if sum(len(v) for v in pending) >= train_size or start + self.encode_batch_size >= len(questions):
+                sample = np.concatenate(pending)
+                train_index(index, sample, sample_size=train_size)
+                index.add_with_ids(sample, np.concatenate(pending_ids))
+                pending, pending_ids = [], []
 
-        # Build FAISS index: Inner Product (cosine since vectors are normalized)
-        dim = emb.shape[1]
-        index = faiss.IndexFlatIP(dim)
-        index.add(emb.astype(np.float32))
+    def _update_index(self, pairs):
+        """Apply the CSV diff to a writable copy of the index; None if it needs a full rebuild."""
+        index = faiss.read_index(self.index_path)
+        store = self.pairs
+        old_ids = store.ids()
+        by_hash = {h.tobytes().hex(): int(i) for h, i in zip(store.column("hash"), old_ids)}
 
-        # Save index + meta
-        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
-        faiss.write_index(index, self.index_path)
+        current = set(pairs["hash"])
+        removed = np.array([i for h, i in by_hash.items() if h not in current], dtype=np.int64)
+        # Vectors left without a pair by an interrupted update
+        orphans = np.setdiff1d(faiss.vector_to_array(index.id_map), old_ids)
+        doomed = np.concatenate([removed, orphans])
+        if len(doomed):
+            if index_kind(index) != "flat":
+                return None  # HNSW/IVF cannot drop rows in place here
+            index.remove_ids(faiss.IDSelectorBatch(doomed))
+            store.remove(removed)
 
-        meta = {
-            "pairs": self.pairs,
+        fresh = pairs[~pairs["hash"].isin(by_hash)]
+        start = max(store.max_id(), int(orphans.max()) if len(orphans) else -1) + 1
+        ids = np.arange(start, start + len(fresh), dtype=np.int64)
+        self._embed_into(index, ids, fresh["human"].tolist())
+        store.append(ids, fresh.to_dict("records"))
+        return index, store, len(fresh), len(removed)
+
+    def _fingerprint(self, dim: int) -> dict:
+        stat = os.stat(self.csv_file)
+        return {
+            "csv_sha256": _file_sha256(self.csv_file),
+            "csv_size": stat.st_size,
+            "csv_mtime": stat.st_mtime,
+            "model": self.embed_model_name,
             "dim": dim,
-            "embed_model_name": self.model.get_sentence_embedding_dimension()
-            if hasattr(self.model, "get_sentence_embedding_dimension")
-            else dim,
+            "index_type": self.index_type,
         }
-        with open(self.meta_path, "wb") as f:
-            pickle.dump(meta, f)
 
-        # Keep in memory
-        self.index = index
+    def _is_stale(self) -> bool:
+        """True when the saved index no longer matches the CSV, model or index type."""
+        if not os.path.exists(self.csv_file):
+            return False  # nothing to rebuild from; keep serving what we have
+        saved = self.pairs.extra.get("fingerprint")
+        if not saved or saved["model"] != self.embed_model_name or saved["index_type"] != self.index_type:
+            return True
+        stat = os.stat(self.csv_file)
+        if saved["csv_size"] == stat.st_size and saved["csv_mtime"] == stat.st_mtime:
+            return False
+        return _file_sha256(self.csv_file) != saved["csv_sha256"]
+
+    def _can_update(self, fingerprint: dict) -> bool:
+        saved = self.pairs.extra.get("fingerprint") if getattr(self, "pairs", None) is not None else None
+        return (
+            bool(saved)
+            and "hash" in self.pairs.schema
+            and isinstance(self.index, faiss.IndexIDMap2)
+            and all(saved[k] == fingerprint[k] for k in ("model", "dim", "index_type"))
+        )
 
     def _load_index_and_meta(self):
-        self.index = faiss.read_index(self.index_path)
+        flags = 0
+        if self.mmap_index:
+            # Read-only view of the saved index, shared between processes through the OS cache.
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        self.index = faiss.read_index(self.index_path, flags)
+        if MetadataStore.exists(self.pairs_path):
+            self.pairs = MetadataStore.open(self.pairs_path)
+            return
+
+        # Older builds pickled the pairs as a list of dicts; convert once.
         with open(self.meta_path, "rb") as f:
             meta = pickle.load(f)
-        self.pairs = meta["pairs"]
+        pairs = [dict(p, hash=_pair_hash(p["human"], p["assistant"])) for p in meta["pairs"]]
+        self.pairs = MetadataStore(PAIR_SCHEMA)
+        self.pairs.append(range(len(pairs)), pairs)
+        self.pairs.save(self.pairs_path, extra={"dim": meta.get("dim")})
+        print(f"MentalHealthAgent: Migrated {len(self.pairs)} pairs to {self.pairs_path}.")
 
     def _encode_and_normalize(self, texts):
         """
@@ -162,18 +312,28 @@ class MentalHealthAgent:
 
     def _format_context(self, idxs, scores, k=3):
         """
-        Build a compact context block with top-k retrieved Q/A pairs.
+        Build a compact context block with top-k retrieved Q/A pairs:
+        weak matches and near-duplicates are dropped and the rest is cut to
+        the context budget (the packing report is kept in `last_context`).
         """
         items = []
-        for rank in range(min(k, len(self.pairs))):
+        for rank in range(min(k, len(idxs), len(self.pairs))):
             idx = int(idxs[rank])
             if idx < 0:
                 continue
             sim = float(scores[rank])
-            q = self.pairs[idx]["human"]
-            a = self.pairs[idx]["assistant"]
-            items.append(f"[sim={sim:.2f}] Q: {q}\nA: {a}")
-        return "\n\n".join(items) if items else None
+            pair = self.pairs.get(idx)
+            if pair is None:
+                continue
+            q = pair["human"]
+            a = pair["assistant"]
+            items.append({"id": idx, "score": sim, "text": f"[sim={sim:.2f}] Q: {q}\nA: {a}"})
+        if not items:
+            return None
+
+        vectors = self.index.reconstruct_batch(np.array([item["id"] for item in items], dtype=np.int64))
+        pieces, self.last_context = self.context_builder.pack(items, vectors)
+        return self.context_builder.join(pieces) if pieces else None
 
     def _fallback_prompt(self, user_message: str, context_text: str | None):
         """
@@ -192,4 +352,16 @@ class MentalHealthAgent:
                 "You are a supportive, empathetic mental health assistant. "
                 "Respond concisely and kindly. If risk is detected (self-harm, harm to others, or medical emergency), "
                 "advise contacting local professionals.\n\n"
-            )
\ No newline at end of file
+            )
+
+
+def _pair_hash(human: str, assistant: str) -> str:
+    return hashlib.blake2b(f"{human}\0{assistant}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
@@ -1,42 +1,39 @@
 import re
+import time
 from .public_agent import PublicAgent
 from .private_agent import PrivateAgent     
 from .mental_health_agent import MentalHealthAgent
 from utils.logging import log_interaction
 from .memory_manager import MemoryManager
+from .intent_router import IntentRouter
+from utils.metrics import counter, histogram, span
+
+MESSAGES = counter("orchestration_messages", "Messages handled, by routed category and router tier.",
+                   ("category", "tier"))
+HANDLE_SECONDS = histogram("orchestration_handle_seconds", "End-to-end handle_message time by category.",
+                           ("category",))
 
 
 
 class OrchestrationAgent:
-    def __init__(self, llm, public_agent, private_agent, mental_health_agent, memory_manager):
+    def __init__(self, llm, public_agent, private_agent, mental_health_agent, memory_manager, router=None):
         self.llm = llm
+        self.router = router or IntentRouter(llm=llm)
+        self.last_decision = None
         self.public_agent = public_agent
         self.private_agent = private_agent
         self.mental_health_agent = mental_health_agent
         self.memory_manager = memory_manager
 
     def classify_message(self, message: str) -> str:
-        prompt = f"""
-        You are a router. Classify the user's message into one of these categories:
-        1. PUBLIC: General, casual, or academic questions with no sensitive data.
-        2. PRIVATE: Personal data like grades, ID, result, cgpa, due, financial details, or login info.
-        3. MENTAL_HEALTH: Messages expressing stress, depression, anxiety, or emotional distress.
-
-        User message: "{message}"
-        Answer with only one label: PUBLIC, PRIVATE, or MENTAL_HEALTH.
-        """
-        
-        # Call your function directly
-        classification = self.llm(prompt).strip().upper()
-    
-        # Safety check
-        if classification not in ["PUBLIC", "PRIVATE", "MENTAL_HEALTH"]:
-            classification = "PUBLIC"
-        
-        return classification
+        # Keywords and embedding centroids first; the LLM only sees messages they can't settle.
+        self.last_decision = self.router.route(message)
+        return self.last_decision.label
 
     def handle_message(self, message: str) -> str:
-        category = self.classify_message(message)
+        started = time.perf_counter()
+        with span("route"):
+            category = self.classify_message(message)
 
         # Store in memory
         self.memory_manager.add_message("User", f"[{category}] {message}")
@@ -54,5 +51,13 @@ class OrchestrationAgent:
         # Add assistant response to memory
         self.memory_manager.add_message("Assistant", response)
 
+        elapsed = time.perf_counter() - started
+        MESSAGES.labels(category, self.last_decision.tier).inc()
+        HANDLE_SECONDS.labels(category).observe(elapsed)
+
+        # Queued for the background writer; never blocks the reply.
+        log_interaction(category, message, response, tier=self.last_decision.tier,
+                        latency_ms=round(elapsed * 1000, 1))
+
         return response
 
@@ -1,16 +1,19 @@
 # agents/private_agent.py
-import json
+import os
+
+from utils.student_store import StudentStore
+
 
 class PrivateAgent:
-    def __init__(self, json_file=r"C:\Users\Asif\VSCODE\Agentic_AI\data\private_student_data.json"):
-        with open(json_file, "r") as f:
-            self.data = json.load(f)
+    def __init__(self, json_file=os.getenv("PRIVATE_STUDENT_DATA", "data/private_student_data.json"), store=None):
+        # Indexed by student_id in SQLite; reloads when the file changes.
+        self.store = store or StudentStore(json_file)
 
     def generate_prompt(self, message: str, student_id="student_123") -> str:
         """
         Create a prompt for the LLM using private student info.
         """
-        student = next((s for s in self.data if s["student_id"] == student_id), None)
+        student = self.store.get(student_id)
         if not student:
             return "[PrivateAgent] Student not found."
 
@@ -1,8 +1,19 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
-from .llm_interface import local_llm
-from utils.document_loader import pdf_to_text, chunk_text
-from utils.vector_store import VectorStore
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable, Iterator, List
+from .llm_interface import local_llm, stream_local_llm
+from utils.document_loader import Chunk, PdfSource, iter_pdf_pages_parallel, iter_chunks
+from utils.concurrency import prefetch
+from utils.vector_store import VectorStore, chunk_key
+from utils.embedding_service import get_encoder
+from utils.answer_cache import SemanticAnswerCache
+from utils.context_builder import ContextBuilder
+from utils.metrics import counter, span
+
+ANSWER_CACHE = counter("rag_answer_cache_lookups", "Semantic answer cache lookups.", ("result",))
+CHUNKS_RETRIEVED = counter("rag_chunks_retrieved", "Chunks retrieved for prompts (before packing).")
+CONTEXT_TOKENS = counter("rag_context_tokens", "Approximate context tokens put into prompts.")
+INGESTED_CHUNKS = counter("rag_ingested_chunks", "Chunks embedded and stored.")
 
 class PublicAgentRAG:
     """RAG-based public agent for text and PDF ingestion."""
@@ -12,40 +23,336 @@ class PublicAgentRAG:
         index_path="data/public_index.faiss",
         meta_path="data/public_meta.pkl",
         embed_model_name="sentence-transformers/all-MiniLM-L6-v2",
-        chunk_size: int = 300,
-        top_k: int = 5
+        chunk_size: int = None,  # tokens; defaults to the embedding model's limit
+        chunk_overlap: int = 32,
+        top_k: int = 5,
+        ingest_batch_size: int = 64,
+        answer_cache: bool = True,
+        answer_cache_threshold: float = 0.92,
+        answer_cache_ttl: float = 3600.0,
+        mmap_index: bool = False,
+        retrieval: str = "hybrid",  # "hybrid" (dense + BM25, fused by RRF) or "dense"
+        dense_k: int = 20,
+        lexical_k: int = 20,
+        context_budget: int = 800,  # LLM tokens of retrieved context per prompt
+        context_min_score: float = 0.2,  # cosine similarity cutoff for context chunks
     ):
-        self.chunk_size = chunk_size
+        if retrieval not in ("hybrid", "dense"):
+            raise ValueError(f"PublicAgentRAG: unknown retrieval mode '{retrieval}'.")
         self.top_k = top_k
+        self.retrieval = retrieval
+        self.dense_k = dense_k
+        self.lexical_k = lexical_k
+        self.ingest_batch_size = ingest_batch_size
+        self.embed_model_name = embed_model_name
+
+        # Embedding model (process-wide, cached and micro-batched)
+        self.model = get_encoder(embed_model_name)
+
+        # Chunks are measured with the model's own tokenizer so they are never
+        # truncated at encode time ([CLS]/[SEP] take two positions).
+        self.tokenizer = getattr(self.model, "tokenizer", None)
+        max_tokens = getattr(self.model, "max_seq_length", 256) - 2
+        self.chunk_size = min(chunk_size or max_tokens, max_tokens)
+        self.chunk_overlap = chunk_overlap
 
-        # Embedding model
-        self.model = SentenceTransformer(embed_model_name)
+        # Packs retrieved chunks into the prompt: cutoff, dedup, merge, token budget
+        self.context_builder = ContextBuilder(token_budget=context_budget, min_score=context_min_score)
 
         # Vector store
-        self.store = VectorStore(index_path, meta_path)
+        self.store = VectorStore(index_path, meta_path, mmap=mmap_index, lexical=retrieval == "hybrid")
+
+        # Semantic answer cache, invalidated when a cached answer's sources change
+        self.answer_cache = None
+        if answer_cache:
+            self.answer_cache = SemanticAnswerCache(threshold=answer_cache_threshold, ttl=answer_cache_ttl)
+            self.store.add_listener(self.answer_cache.invalidate_sources)
+
+    def warm_up(self):
+        """
+        Run one query end to end (tokenizer, model forward pass, index scan)
+        so the first real request does not pay for lazy initialization.
+        """
+        query_vec = self.model.encode(["warm up"], convert_to_numpy=True)
+        self.retrieve("warm up", query_vec)
 
     # ---------- Ingestion ----------
+    def add_chunks(self, chunks: Iterable[Chunk], source: str) -> int:
+        """Embed and store a stream of chunks in batches; returns the number added."""
+        added = 0
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= self.ingest_batch_size:
+                added += self._add_batch(batch, source)
+                batch = []
+        if batch:
+            added += self._add_batch(batch, source)
+        return added
+
+    def _add_batch(self, chunks: List[Chunk], source: str) -> int:
+        texts = [c.text for c in chunks]
+        with span("ingest_encode"):
+            embeddings = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+        offsets = [{"doc": source, "start": c.start, "end": c.end} for c in chunks]
+        with span("ingest_store"):
+            self.store.add_embeddings(embeddings, texts, [source]*len(chunks), extra=offsets)
+        INGESTED_CHUNKS.inc(len(chunks))
+        return len(chunks)
+
+    def chunk_pages(self, pages: Iterable[str]):
+        """Token-aware, overlapping chunks over a stream of page texts."""
+        return iter_chunks(pages, self.chunk_size, self.chunk_overlap, self.tokenizer)
+
     def add_text(self, text: str, source: str = "manual"):
-        chunks = chunk_text(text, self.chunk_size)
-        embeddings = self.model.encode(chunks, convert_to_numpy=True, show_progress_bar=False)
-        self.store.add_embeddings(embeddings, chunks, [source]*len(chunks))
+        self.add_chunks(self.chunk_pages([text]), source)
+
+    def add_pdf(self, pdf: PdfSource, source: str = None, workers: int = None) -> int:
+        """
+        Ingest a PDF given as a path or in-memory bytes.
+        Pages are extracted lazily (in parallel for large documents) on a
+        background thread while earlier chunks are being embedded.
+        """
+        if source is None:
+            source = pdf if isinstance(pdf, str) else "upload.pdf"
+        return self.add_chunks(self._pdf_chunks(pdf, workers), source)
 
-    def add_pdf(self, pdf_path: str):
-        text = pdf_to_text(pdf_path)
-        self.add_text(text, source=pdf_path)
+    def _pdf_chunks(self, pdf: PdfSource, workers: int = None):
+        pages = iter_pdf_pages_parallel(pdf, workers=workers)
+        return prefetch(self.chunk_pages(pages), max_items=4 * self.ingest_batch_size)
+
+    def delete_source(self, source: str) -> int:
+        """Remove every chunk ingested from `source`; returns the number removed."""
+        return self.store.delete_source(source)
+
+    def replace_text(self, text: str, source: str = "manual") -> int:
+        """Replace the content stored under `source` with `text`."""
+        return self._replace(self.chunk_pages([text]), source)
+
+    def replace_pdf(self, pdf: PdfSource, source: str = None, workers: int = None) -> int:
+        """Replace the content stored under `source` with a new version of the PDF."""
+        if source is None:
+            source = pdf if isinstance(pdf, str) else "upload.pdf"
+        return self._replace(self._pdf_chunks(pdf, workers), source)
+
+    def _replace(self, chunks: Iterable[Chunk], source: str) -> int:
+        """
+        Add the new version first, then drop the old chunks it no longer
+        contains, so the source never goes empty and a failed ingest leaves
+        the old version in place. Chunks unchanged at the same offsets keep
+        their ids (dedup); moved ones are re-added with their new offsets.
+        """
+        old_ids = self.store.ids_for_source(source)
+        keep = set()
+
+        def track(chunks):
+            for chunk in chunks:
+                keep.add(chunk_key(chunk.text, chunk.start, chunk.end))
+                yield chunk
+
+        try:
+            added = self.add_chunks(track(chunks), source)
+        except Exception:
+            # Roll back the part of the new version that was already stored.
+            self.store.delete_ids(set(self.store.ids_for_source(source)) - set(old_ids))
+            raise
+        self.store.delete_stale(old_ids, keep)
+        return added
 
     # ---------- Query ----------
-    def respond(self, query: str) -> str:
-        if not self.store.index or len(self.store.metadata) == 0:
-            return local_llm(query)
+    def retrieve(self, query: str, query_vec: np.ndarray = None) -> List[dict]:
+        """
+        Return the top-k chunks for `query` as dicts with id, text, source,
+        score (retrieval score), similarity (cosine to the query) and offsets.
+        """
+        return self._retrieve(query, query_vec)[0]
+
+    def _retrieve(self, query: str, query_vec: np.ndarray = None):
+        """Top-k hits and their stored embeddings."""
+        if query_vec is None and len(self.store):
+            query_vec = self.model.encode([query], convert_to_numpy=True)
+        return self._retrieve_batch([query], query_vec)[0]
 
-        query_vec = self.model.encode([query], convert_to_numpy=True)
-        _, idxs = self.store.search(query_vec, self.top_k)
-        context_chunks = self.store.get_texts(idxs)
+    def _retrieve_batch(self, queries: List[str], query_vecs: np.ndarray):
+        """(hits, embeddings) per query, from one matrix search over the index."""
+        if len(self.store) == 0:
+            return [([], None) for _ in queries]
 
-        context_text = "\n".join(context_chunks)
-        prompt = (
+        query_vecs = query_vecs / (np.linalg.norm(query_vecs, axis=1, keepdims=True) + 1e-12)
+        if self.retrieval == "hybrid":
+            ranked = self.store.hybrid_search_batch(
+                query_vecs, queries, self.top_k, dense_k=self.dense_k, lexical_k=self.lexical_k
+            )
+        else:
+            ranked = zip(*self.store.search_batch(query_vecs, self.top_k))
+
+        results = []
+        for (scores, idxs), query_vec in zip(ranked, query_vecs):
+            hits = []
+            for score, idx in zip(scores, idxs):
+                for meta in self.store.get_metadata([int(idx)]):
+                    hits.append({
+                        "id": int(idx),
+                        "text": meta["text"],
+                        "source": meta["source"],
+                        "score": float(score),
+                        "doc": meta.get("doc"),
+                        "start": meta.get("start"),
+                        "end": meta.get("end"),
+                    })
+            if not hits:
+                results.append((hits, None))
+                continue
+            vectors = self.store.get_vectors([h["id"] for h in hits])
+            for hit, sim in zip(hits, vectors @ query_vec):
+                hit["similarity"] = float(sim)
+            results.append((hits, vectors))
+        return results
+
+    def build_context(self, query: str, query_vec: np.ndarray = None):
+        """
+        Retrieve and pack the context for `query`.
+        Returns (pieces, report); see ContextBuilder.pack.
+        """
+        hits, vectors = self._retrieve(query, query_vec)
+        return self.context_builder.pack(hits, vectors)
+
+    def format_prompt(self, query: str, hits: List[dict]) -> str:
+        if not hits:
+            return query
+
+        context_text = self.context_builder.join(hits)
+        return (
             "You are a knowledgeable university assistant. Use the context to answer the question:\n\n"
             f"Context:\n{context_text}\n\nQuestion: {query}\nAnswer:"
         )
-        return local_llm(prompt)
+
+    def prepare(self, query: str, use_cache: bool = True) -> dict:
+        """
+        CPU-bound half of `respond`: encode the query, check the answer cache
+        and, on a miss, retrieve context and build the prompt.
+        Returns a dict with `cached_answer` (or None), `hits` (the packed
+        context pieces), `prompt`, `query_vec` and `context` (the packing report).
+        Pass `use_cache=False` when the answer depends on more than the query
+        (e.g. earlier turns of a conversation).
+        """
+        return self.prepare_batch([query], use_cache)[0]
+
+    def prepare_batch(self, queries: List[str], use_cache: bool = True) -> List[dict]:
+        """`prepare` for many queries: one encode call and one matrix search for the cache misses."""
+        if not queries:
+            return []
+        with span("encode"):
+            query_vecs = self.model.encode(list(queries), convert_to_numpy=True)
+        query_vecs = query_vecs / (np.linalg.norm(query_vecs, axis=1, keepdims=True) + 1e-12)
+
+        plans: List[dict] = [None] * len(queries)
+        misses = []
+        # Taken before retrieval: `remember` skips answers whose sources change meanwhile.
+        cache_version = self.answer_cache.version() if self.answer_cache is not None else None
+        for i, query_vec in enumerate(query_vecs):
+            entry = None
+            if use_cache and self.answer_cache is not None:
+                with span("answer_cache"):
+                    entry = self.answer_cache.lookup(query_vec[None, :])
+                ANSWER_CACHE.labels("miss" if entry is None else "hit").inc()
+            if entry is not None:
+                hits = [{"id": c, "source": s} for c, s in zip(entry["chunk_ids"], entry["sources"])]
+                plans[i] = {
+                    "cached_answer": entry["answer"], "hits": hits, "prompt": None,
+                    "query_vec": query_vec[None, :], "context": None,
+                }
+            else:
+                misses.append(i)
+
+        if misses:
+            with span("retrieve"):
+                retrieved = self._retrieve_batch([queries[i] for i in misses], query_vecs[misses])
+            for i, (hits, vectors) in zip(misses, retrieved):
+                with span("pack"):
+                    pieces, report = self.context_builder.pack(hits, vectors)
+                CHUNKS_RETRIEVED.inc(len(hits))
+                CONTEXT_TOKENS.inc(report["tokens_after"])
+                plans[i] = {
+                    "cached_answer": None,
+                    "hits": pieces,
+                    "prompt": self.format_prompt(queries[i], pieces),
+                    "query_vec": query_vecs[i][None, :],
+                    "context": report,
+                    "cache_version": cache_version,
+                }
+        return plans
+
+    def remember(self, query: str, plan: dict, answer: str):
+        """Store a freshly generated answer in the semantic cache."""
+        if self.answer_cache is None or plan["cached_answer"] is not None:
+            return
+        if answer.startswith("[LLM Error]"):
+            return
+        hits = plan["hits"]
+        used = [(i, h["source"]) for h in hits for i in h.get("ids", [h["id"]])]
+        self.answer_cache.insert(
+            query, plan["query_vec"], [i for i, _ in used], [s for _, s in used], answer,
+            version=plan.get("cache_version"),
+        )
+
+    def build_prompt(self, query: str) -> str:
+        """
+        Encode the query, retrieve and pack context and assemble the LLM prompt.
+        """
+        return self.format_prompt(query, self.build_context(query)[0])
+
+    def respond(self, query: str) -> str:
+        with span("respond"):
+            plan = self.prepare(query)
+            if plan["cached_answer"] is not None:
+                return plan["cached_answer"]
+            answer = local_llm(plan["prompt"])
+            self.remember(query, plan, answer)
+            return answer
+
+    def respond_batch(
+        self,
+        queries: List[str],
+        concurrency: int = 4,
+        ordered: bool = True,
+        batch_size: int = 256,
+        llm=None,
+    ) -> Iterator[dict]:
+        """
+        Answer many queries: retrieval runs `batch_size` queries per encode
+        call and matrix search, then generation runs on up to `concurrency`
+        threads. Yields {"index", "query", "answer", "cached", "context"}
+        in input order, or as each answer is ready if `ordered` is False.
+        """
+        llm = llm or local_llm
+        pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="rag-batch")
+        try:
+            futures = []
+            for start in range(0, len(queries), batch_size):
+                chunk = list(queries[start:start + batch_size])
+                for offset, plan in enumerate(self.prepare_batch(chunk)):
+                    futures.append(pool.submit(self._answer, start + offset, chunk[offset], plan, llm))
+            for future in (futures if ordered else as_completed(futures)):
+                yield future.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _answer(self, index: int, query: str, plan: dict, llm) -> dict:
+        cached = plan["cached_answer"] is not None
+        answer = plan["cached_answer"] if cached else llm(plan["prompt"])
+        if not cached:
+            self.remember(query, plan, answer)
+        return {"index": index, "query": query, "answer": answer, "cached": cached, "context": plan["context"]}
+
+    def respond_stream(self, query: str, strip_think: bool = True):
+        """Yield answer tokens as they are generated."""
+        plan = self.prepare(query)
+        if plan["cached_answer"] is not None:
+            yield plan["cached_answer"]
+            return
+        tokens = []
+        for token in stream_local_llm(plan["prompt"], strip_think=strip_think):
+            tokens.append(token)
+            yield token
+        self.remember(query, plan, "".join(tokens))
@@ -0,0 +1,190 @@
+#agents/test/fake_ollama_server.py
+"""
+A local stand-in for the Ollama HTTP API, for exercising LLMClient (and
+the API) without a model.
+
+    python agents/test/fake_ollama_server.py --port 11435 --delay 0.5
+    OLLAMA_HOST=http://127.0.0.1:11435 uvicorn main:app
+
+Or in-process:
+
+    with FakeOllamaServer(delay=0.2) as server:
+        client = LLMClient(host=server.url)
+        ...
+        server.requests, server.max_concurrent, server.last_body
+
+Supports POST /api/chat and /api/generate (streaming and not) and
+GET /api/tags and /api/ps. Every chat answer is "<think>...</think>"
+followed by an echo of the last message, after `delay` seconds, streamed
+`token_delay` seconds apart.
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOllamaServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0, token_delay: float = 0.0,
+                 think: bool = True):
+        self.delay = delay
+        self.token_delay = token_delay
+        self.think = think
+        self.requests = 0
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self.last_body = None
+        self.loaded = {}  # model -> keep_alive of its last request
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def answer(self, body: dict) -> str:
+        messages = body.get("messages") or [{"content": body.get("prompt", "")}]
+        text = f"Echo: {messages[-1].get('content', '')}"
+        return f"<think>fake reasoning</think>\n\n{text}" if self.think else text
+
+    # ---------- Request handling ----------
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/":
+                    return self._send(200, b"Ollama is running", "text/plain")
+                if self.path == "/api/tags":
+                    models = [{"name": m, "model": m} for m in server.loaded]
+                    return self._json(200, {"models": models})
+                if self.path == "/api/ps":
+                    models = [{"name": m, "model": m, "keep_alive": k} for m, k in server.loaded.items()]
+                    return self._json(200, {"models": models})
+                self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path not in ("/api/chat", "/api/generate"):
+                    return self._json(404, {"error": "not found"})
+
+                with server._lock:
+                    server.requests += 1
+                    server.concurrent += 1
+                    server.max_concurrent = max(server.max_concurrent, server.concurrent)
+                    server.last_body = body
+                    server.loaded[body.get("model", "")] = body.get("keep_alive")
+                try:
+                    preload = self.path == "/api/generate" and not body.get("prompt")
+                    if not preload:
+                        time.sleep(server.delay)
+                    text = "" if preload else server.answer(body)
+                    if body.get("stream", True) and not preload:
+                        self._stream(body, text)
+                    else:
+                        self._json(200, self._message(body, text, done=True))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timeout or cancellation)
+                finally:
+                    with server._lock:
+                        server.concurrent -= 1
+
+            def _message(self, body: dict, text: str, done: bool) -> dict:
+                out = {"model": body.get("model", ""), "created_at": _now(), "done": done}
+                if self.path == "/api/chat":
+                    out["message"] = {"role": "assistant", "content": text}
+                else:
+                    out["response"] = text
+                if done:
+                    out.update(done_reason="stop", total_duration=int(server.delay * 1e9), eval_count=len(text.split()))
+                return out
+
+            def _stream(self, body: dict, text: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in _tokens(text):
+                    self._chunk(json.dumps(self._message(body, token, done=False)).encode() + b"\n")
+                    time.sleep(server.token_delay)
+                self._chunk(json.dumps(self._message(body, "", done=True)).encode() + b"\n")
+                self._chunk(b"")
+
+            def _chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _json(self, status: int, payload: dict):
+                self._send(status, json.dumps(payload).encode(), "application/json")
+
+            def _send(self, status: int, data: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def _tokens(text: str):
+    """Split text into word-ish pieces, keeping whitespace attached."""
+    piece = ""
+    for ch in text:
+        piece += ch
+        if ch in " \n>":
+            yield piece
+            piece = ""
+    if piece:
+        yield piece
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--delay", type=float, default=0.2, help="seconds before each answer")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument("--no-think", action="store_true", help="omit the <think> block")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, args.delay, args.token_delay, think=not args.no_think)
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,94 @@
+"""
+Synthetic private student records.
+
+    python agents/test/privat_data_creation.py                          # 50 records, JSON
+    python agents/test/privat_data_creation.py --count 40000 --out data/students_40k.json
+    python agents/test/privat_data_creation.py --count 1000000 --format sqlite --out data/students_1m.db
+
+Records are written as they are generated, so large datasets don't have
+to fit in memory. `--format sqlite` writes a database StudentStore can
+open directly.
+"""
+import argparse
 import json
+import os
 import random
+import sys
+import time
+
 from faker import Faker
 
-fake = Faker()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from utils.student_store import build_database  # noqa: E402
 
 subjects = ["Math", "CS", "Physics", "Chemistry", "English", "History"]
 grades = ["A", "A-", "B+", "B", "B-", "C+", "C", "C-"]
 
-data = []
-
-for i in range(1, 51):  # 50 entries
-    student_id = f"student_{1000 + i}"
-    name = fake.first_name()
-    email = fake.email()
-    # Random grades for subjects
-    student_grades = {subj: random.choice(grades) for subj in subjects}
-    # Random schedule
-    schedule_days = random.sample(["Mon", "Tue", "Wed", "Thu", "Fri"], k=3)
-    schedule_time = f"{random.randint(8, 16)}:00 - {random.randint(9, 18)}:00"
-    schedule = f"{', '.join(schedule_days)} {schedule_time}"
-    
-    entry = {
-        "student_id": student_id,
-        "name": name,
-        "grades": student_grades,
-        "schedule": schedule,
-        "student_email": email
-    }
-    data.append(entry)
-
-# Save to JSON
-with open(r"C:\Users\Asif\VSCODE\University Chatbot\data\private_student_data.json", "w") as f:
-    json.dump(data, f, indent=4)
-
-print("Private dataset with 50 entries created: data/private_data.json")
+
+def generate_students(count: int, seed: int = None, start: int = 1001):
+    """Yield `count` records with ids student_<start> upwards."""
+    fake = Faker()
+    rng = random.Random(seed)
+    if seed is not None:
+        Faker.seed(seed)
+    # Faker is the slow part; draw from a pool of names instead of calling it per record.
+    pool = min(count, 5000)
+    names = [fake.first_name() for _ in range(pool)]
+    domains = [fake.free_email_domain() for _ in range(20)]
+
+    for i in range(count):
+        name = rng.choice(names)
+        # Random grades for subjects
+        student_grades = {subj: rng.choice(grades) for subj in subjects}
+        # Random schedule
+        schedule_days = rng.sample(["Mon", "Tue", "Wed", "Thu", "Fri"], k=3)
+        schedule_time = f"{rng.randint(8, 16)}:00 - {rng.randint(9, 18)}:00"
+        yield {
+            "student_id": f"student_{start + i}",
+            "name": name,
+            "grades": student_grades,
+            "schedule": f"{', '.join(schedule_days)} {schedule_time}",
+            "student_email": f"{name.lower()}{start + i}@{rng.choice(domains)}",
+        }
+
+
+def write_json(records, path: str, lines: bool = False) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        if not lines:
+            f.write("[\n")
+        for record in records:
+            if count and not lines:
+                f.write(",\n")
+            f.write(json.dumps(record, ensure_ascii=False))
+            if lines:
+                f.write("\n")
+            count += 1
+        if not lines:
+            f.write("\n]\n")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic private student records.")
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--out", default="data/private_student_data.json")
+    parser.add_argument("--format", choices=["json", "jsonl", "sqlite"], default="json")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    directory = os.path.dirname(args.out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    records = generate_students(args.count, args.seed)
+    if args.format == "sqlite":
+        count = build_database(records, args.out)
+    else:
+        count = write_json(records, args.out, lines=args.format == "jsonl")
+    print(f"Private dataset with {count} entries created: {args.out} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
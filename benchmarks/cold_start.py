@@ -0,0 +1,122 @@
+#benchmarks/cold_start.py
+"""
+Cold-start cost of an API worker: time to import main.py, time until the
+RAG agent is loaded and warmed up, and memory per worker, with the index
+read into memory vs memory-mapped.
+
+    python benchmarks/cold_start.py --vectors 200000 --workers 4
+
+A synthetic index of `--vectors` rows is built in a temp directory. Every
+measurement runs in fresh processes; with `--workers` > 1 that many
+workers start at once, as after a restart or scale-out. Prints JSON.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def build_store(workdir: str, n: int, dim: int):
+    import numpy as np
+    from utils.vector_store import VectorStore
+
+    store = VectorStore(os.path.join(workdir, "index.faiss"), os.path.join(workdir, "meta.pkl"))
+    rng = np.random.default_rng(0)
+    for start in range(0, n, 50_000):
+        rows = min(50_000, n - start)
+        texts = [f"chunk {i}" for i in range(start, start + rows)]
+        store.add_embeddings(rng.standard_normal((rows, dim), dtype=np.float32), texts, ["bench"] * rows)
+    store.compact()
+
+
+def measure_import() -> dict:
+    """Runs in a subprocess: import the API module only."""
+    start = time.perf_counter()
+    import main  # noqa: F401
+
+    return {"import_main_s": round(time.perf_counter() - start, 3), "heavy_modules_loaded": sorted(
+        m for m in ("faiss", "torch", "sentence_transformers", "pandas") if m in sys.modules
+    )}
+
+
+def measure_ready(workdir: str, mmap: bool) -> dict:
+    """Runs in a subprocess: build and warm up the agent the way the API does."""
+    from benchmarks.common import memory_mb, delta
+
+    before = memory_mb()
+    start = time.perf_counter()
+    from agents.public_agent_rag import PublicAgentRAG
+    imported = time.perf_counter()
+    agent = PublicAgentRAG(
+        index_path=os.path.join(workdir, "index.faiss"),
+        meta_path=os.path.join(workdir, "meta.pkl"),
+        embed_model_name=EMBED_MODEL,
+        mmap_index=mmap,
+    )
+    built = time.perf_counter()
+    agent.warm_up()
+    ready = time.perf_counter()
+    return {
+        "import_s": round(imported - start, 3),
+        "load_s": round(built - imported, 3),
+        "warm_up_s": round(ready - built, 3),
+        "time_to_ready_s": round(ready - start, 3),
+        "memory": delta(memory_mb(), before),
+    }
+
+
+def run_workers(args, mode: str, workers: int, extra=()):
+    cmd = [sys.executable, os.path.abspath(__file__), "--measure", mode, *extra]
+    procs = [subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.PIPE, text=True) for _ in range(workers)]
+    results = []
+    for p in procs:
+        out, _ = p.communicate()
+        if p.returncode != 0:
+            raise RuntimeError(f"{mode} worker failed")
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+def summarize(results):
+    keys = ("import_s", "load_s", "warm_up_s", "time_to_ready_s")
+    summary = {k: round(max(r[k] for r in results), 3) for k in keys}
+    summary["rss_mb_per_worker"] = round(sum(r["memory"]["rss_mb"] for r in results) / len(results), 1)
+    summary["anon_mb_per_worker"] = round(sum(r["memory"]["anon_mb"] for r in results) / len(results), 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API worker cold start.")
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--measure", choices=("import", "ready", "ready-mmap"), help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure == "import":
+        print(json.dumps(measure_import()))
+        return
+    if args.measure:
+        print(json.dumps(measure_ready(args.workdir, mmap=args.measure == "ready-mmap")))
+        return
+
+    results = {"vectors": args.vectors, "dim": args.dim, "workers": args.workers}
+    results["import_main"] = run_workers(args, "import", 1)[0]
+    with tempfile.TemporaryDirectory() as workdir:
+        build_store(workdir, args.vectors, args.dim)
+        for mode in ("ready", "ready-mmap"):
+            results[mode] = summarize(run_workers(args, mode, args.workers, ("--workdir", workdir)))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
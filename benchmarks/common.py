@@ -0,0 +1,32 @@
+# benchmarks/common.py
+
+
+def memory_mb() -> dict:
+    """Resident set size and its anonymous (private, non file-backed) part."""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return {"rss": int(fields["VmRSS"].split()[0]) / 1024, "anon": int(fields["RssAnon"].split()[0]) / 1024}
+    except (OSError, KeyError):
+        import resource
+
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return {"rss": rss, "anon": rss}
+
+
+def delta(after: dict, before: dict) -> dict:
+    return {f"{k}_mb": round(after[k] - before[k], 1) for k in after}
+
+
+
+def latency_summary(seconds) -> dict:
+    """p50/p95/p99/mean/max in milliseconds for a list of durations in seconds."""
+    ms = sorted(s * 1000 for s in seconds)
+    if not ms:
+        return {}
+
+    def pick(q: float) -> float:
+        return round(ms[min(len(ms) - 1, int(q * len(ms)))], 3)
+
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+            "mean_ms": round(sum(ms) / len(ms), 3), "max_ms": round(ms[-1], 3)}
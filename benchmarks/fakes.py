@@ -0,0 +1,92 @@
+# benchmarks/fakes.py
+"""
+Deterministic stand-ins for the embedding model and the LLM, so benchmarks
+measure this code rather than a model.
+
+    from benchmarks.fakes import install_fake_embedder, FakeLLM
+    install_fake_embedder(ms_per_batch=2.0)   # before any agent is built
+    llm = FakeLLM(latency_ms=200)
+
+For the HTTP side of the LLM, agents/test/fake_ollama_server.py serves the
+Ollama API with a configurable delay.
+"""
+import random
+import re
+import time
+import zlib
+
+import numpy as np
+
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+_WORD = re.compile(r"\w+")
+
+
+class FakeEmbedder:
+    """
+    Hashed bag-of-words vectors: texts that share words get similar
+    vectors, so retrieval still ranks sensibly. Each `encode` call sleeps
+    `ms_per_batch` plus `us_per_text` per text to stand in for the model.
+    """
+
+    max_seq_length = 256
+    tokenizer = None
+
+    def __init__(self, dim: int = 384, ms_per_batch: float = 0.0, us_per_text: float = 0.0):
+        self.dim = dim
+        self.ms_per_batch = ms_per_batch
+        self.us_per_text = us_per_text
+        self.calls = 0
+        self.texts = 0
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, convert_to_numpy: bool = True, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in zip(out, texts):
+            words = _WORD.findall(text.lower()) or [text]
+            for w in words:
+                h = zlib.crc32(w.encode("utf-8"))
+                row[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-12
+        delay = self.ms_per_batch / 1000 + self.us_per_text * len(texts) / 1e6
+        if delay:
+            time.sleep(delay)
+        self.calls += 1
+        self.texts += len(texts)
+        return out[0] if single else out
+
+
+class FakeLLM:
+    """Callable with `local_llm`'s signature that sleeps `latency_ms` (+- jitter)."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, answer: str = "ok", seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.answer = answer
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def __call__(self, prompt: str, memory_manager=None) -> str:
+        self.calls += 1
+        delay = self.latency_ms + (self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return self.answer
+
+
+def install_fake_embedder(model_name: str = EMBED_MODEL, **kwargs) -> FakeEmbedder:
+    """
+    Make `get_encoder(model_name)` use a FakeEmbedder. Must run before the
+    encoder is first requested. Note the embedding disk cache under
+    ./data/embedding_cache is still used, so run from a scratch directory.
+    """
+    from utils.embedding_service import get_embedding_service
+
+    fake = FakeEmbedder(**kwargs)
+    service = get_embedding_service(model_name, model=fake)
+    if service.model is not fake:
+        raise RuntimeError(f"The encoder for {model_name} was already loaded.")
+    return fake
@@ -0,0 +1,140 @@
+#benchmarks/intent_router.py
+"""
+Accuracy and latency of the tiered IntentRouter against the LLM-only router.
+
+    python benchmarks/intent_router.py                # tiered router, no LLM
+    python benchmarks/intent_router.py --llm          # also the LLM router (needs Ollama)
+    python benchmarks/intent_router.py --data labelled.jsonl
+
+The labelled set is built in (kept apart from the router's seed examples)
+or read from a JSONL file of {"message": ..., "label": ...}. Reports
+accuracy, latency percentiles, which tier decided and how many LLM calls
+were made. Prints JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.intent_router import IntentRouter, LABELS  # noqa: E402
+
+LABELLED = [
+    ("Hi, what can you help me with?", "PUBLIC"),
+    ("What is the deadline for course registration?", "PUBLIC"),
+    ("How many credits does the MSc in data science require?", "PUBLIC"),
+    ("Is there a shuttle bus from the dormitory to campus?", "PUBLIC"),
+    ("Can you explain what a binary search tree is?", "PUBLIC"),
+    ("Which clubs can first-year students join?", "PUBLIC"),
+    ("When are the final exams scheduled this year?", "PUBLIC"),
+    ("What is the tuition fee for international students?", "PUBLIC"),
+    ("Does the university offer evening classes?", "PUBLIC"),
+    ("How do I get a library card?", "PUBLIC"),
+    ("What programming languages are taught in the first semester?", "PUBLIC"),
+    ("Tell me about the university's research labs.", "PUBLIC"),
+    ("What did I get in my physics midterm?", "PRIVATE"),
+    ("Tell me my CGPA.", "PRIVATE"),
+    ("How much money is due on my account?", "PRIVATE"),
+    ("When is my next class?", "PRIVATE"),
+    ("Which courses am I registered for this term?", "PRIVATE"),
+    ("Have I been marked absent in any lecture?", "PRIVATE"),
+    ("Show my result of the last semester.", "PRIVATE"),
+    ("I forgot my portal password.", "PRIVATE"),
+    ("Did my scholarship payment go through?", "PRIVATE"),
+    ("What is my advisor's name?", "PRIVATE"),
+    ("How many credits do I still need to graduate?", "PRIVATE"),
+    ("What grade did I get in calculus?", "PRIVATE"),
+    ("I feel like nobody understands me.", "MENTAL_HEALTH"),
+    ("I'm so stressed I can't eat.", "MENTAL_HEALTH"),
+    ("I've been crying every night this week.", "MENTAL_HEALTH"),
+    ("I think I'm going to fail and I can't handle it.", "MENTAL_HEALTH"),
+    ("I feel anxious whenever I enter the classroom.", "MENTAL_HEALTH"),
+    ("I have no energy and everything feels pointless.", "MENTAL_HEALTH"),
+    ("My parents' expectations are crushing me.", "MENTAL_HEALTH"),
+    ("I can't stop worrying about the future.", "MENTAL_HEALTH"),
+    ("I feel isolated since I moved to the dorm.", "MENTAL_HEALTH"),
+    ("I am having trouble sleeping because of exam stress.", "MENTAL_HEALTH"),
+    ("Sometimes I feel like giving up on everything.", "MENTAL_HEALTH"),
+    ("How can I deal with constant pressure at university?", "MENTAL_HEALTH"),
+]
+
+
+def load_labelled(path: str):
+    if not path:
+        return LABELLED
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(r["message"], r["label"].upper()) for r in rows]
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def evaluate(name: str, classify, labelled) -> dict:
+    """`classify(message)` returns (label, tier)."""
+    latencies, tiers, correct = [], {}, 0
+    per_label = {label: [0, 0] for label in LABELS}
+    for message, expected in labelled:
+        start = time.perf_counter()
+        label, tier = classify(message)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hit = label == expected
+        correct += hit
+        stats = tiers.setdefault(tier, {"decisions": 0, "correct": 0})
+        stats["decisions"] += 1
+        stats["correct"] += hit
+        per_label.setdefault(expected, [0, 0])
+        per_label[expected][0] += hit
+        per_label[expected][1] += 1
+    return {
+        "router": name,
+        "messages": len(labelled),
+        "accuracy": round(correct / len(labelled), 4),
+        "accuracy_by_label": {k: round(c / n, 4) for k, (c, n) in per_label.items() if n},
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3),
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "max": round(max(latencies), 3),
+        },
+        "llm_calls": tiers.get("llm", {}).get("decisions", 0),
+        "tiers": tiers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tiered intent router.")
+    parser.add_argument("--data", help="JSONL file of {message, label}")
+    parser.add_argument("--llm", action="store_true", help="also run the LLM router and LLM fallback (needs Ollama)")
+    parser.add_argument("--min-similarity", type=float, default=0.35)
+    parser.add_argument("--min-margin", type=float, default=0.05)
+    args = parser.parse_args()
+
+    labelled = load_labelled(args.data)
+    llm = None
+    if args.llm:
+        from agents.llm_interface import local_llm
+
+        llm = local_llm
+
+    router = IntentRouter(llm=llm, min_similarity=args.min_similarity, min_margin=args.min_margin)
+    start = time.perf_counter()
+    router.centroid_scores("warm up")  # load the encoder and build the centroids
+    results = {"setup_s": round(time.perf_counter() - start, 3), "runs": []}
+
+    def tiered(message):
+        decision = router.route(message)
+        return decision.label, decision.tier
+
+    results["runs"].append(evaluate("tiered" + ("+llm" if llm else ""), tiered, labelled))
+    if llm is not None:
+        results["runs"].append(evaluate("llm", lambda m: (router.llm_classify(m), "llm"), labelled))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#benchmarks/lexical_search.py
+"""
+Latency of BM25 lookups in LexicalIndex.
+
+    python benchmarks/lexical_search.py --chunks 1000000
+
+Synthetic chunks draw words from a Zipf-like vocabulary, and some of them
+mention a course code. Queries mix common words with a code. The index is
+saved and reopened, so the postings are memory-mapped as in the API. It
+reports build time and p50/p95 latency, before and after new chunks land in
+the unsaved tail, as JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.lexical_index import LexicalIndex  # noqa: E402
+
+
+def word(rank: int) -> str:
+    # Letters only, like real prose: "a", "b", ..., "ba", "bb", ...
+    letters = ""
+    while True:
+        letters = chr(97 + rank % 26) + letters
+        rank //= 26
+        if not rank:
+            return letters
+
+
+def make_texts(start: int, n: int, words: int, vocab: int, rng):
+    ranks = np.minimum(rng.zipf(1.3, size=(n, words)), vocab) - 1
+    for row, i in zip(ranks, range(start, start + n)):
+        text = " ".join(word(r) for r in row)
+        if i % 50 == 0:
+            text += f" See CSE-{i % 9000 + 1000} in room B-{i % 700}."
+        yield text
+
+
+def time_queries(index: LexicalIndex, queries, top_k: int) -> dict:
+    times = []
+    for q in queries:
+        start = time.perf_counter()
+        index.search(q, top_k)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        "p50_ms": round(times[len(times) // 2], 3),
+        "p95_ms": round(times[int(len(times) * 0.95)], 3),
+        "mean_ms": round(sum(times) / len(times), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BM25 lookups.")
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--words", type=int, default=120)
+    parser.add_argument("--vocab", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    index = LexicalIndex()
+    start = time.perf_counter()
+    for lo in range(0, args.chunks, 50_000):
+        n = min(50_000, args.chunks - lo)
+        index.add(range(lo, lo + n), make_texts(lo, n, args.words, args.vocab, rng))
+    results = {"chunks": args.chunks, "build_s": round(time.perf_counter() - start, 2)}
+
+    queries = [
+        f"{word(rng.integers(0, 50))} {word(rng.integers(50, 5000))} CSE-{rng.integers(1000, 10000)}"
+        for _ in range(args.queries)
+    ]
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        index.save(workdir)
+        results["save_s"] = round(time.perf_counter() - start, 2)
+        index = LexicalIndex.open(workdir)
+        results["postings"] = int(index._offsets[-1])
+        results["terms"] = len(index.terms)
+
+        time_queries(index, queries[:20], args.top_k)  # page in
+        results["saved"] = time_queries(index, queries, args.top_k)
+        tail = max(1, args.chunks // 20)
+        index.add(range(args.chunks, args.chunks + tail), make_texts(args.chunks, tail, args.words, args.vocab, rng))
+        results["with_5pct_tail"] = time_queries(index, queries, args.top_k)
+        del index
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
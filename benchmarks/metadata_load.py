@@ -0,0 +1,108 @@
+#benchmarks/metadata_load.py
+"""
+Load time and memory of chunk metadata: pickled list of dicts vs MetadataStore.
+
+    python benchmarks/metadata_load.py --rows 300000
+
+Each format is loaded in a fresh subprocess. Memory is reported after the
+load and after the random lookups, as total RSS and its anonymous part
+(memory-mapped pages are file-backed: shared between workers and
+reclaimable by the OS). Prints one JSON object with the results.
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import memory_mb, delta  # noqa: E402
+from utils.metadata_store import MetadataStore  # noqa: E402
+from utils.vector_store import ROW_SCHEMA, content_hash  # noqa: E402
+
+
+def make_rows(n: int, text_chars: int, n_sources: int):
+    rng = random.Random(0)
+    words = [f"word{i}" for i in range(5000)]
+    for i in range(n):
+        text = " ".join(rng.choice(words) for _ in range(text_chars // 8))[:text_chars]
+        source = f"docs/file_{i % n_sources}.pdf"
+        yield {"text": text, "source": source, "doc": source, "start": i * 100, "end": i * 100 + len(text),
+               "hash": content_hash(text)}
+
+
+def write_formats(workdir: str, n: int, text_chars: int, n_sources: int):
+    rows = list(make_rows(n, text_chars, n_sources))
+    with open(os.path.join(workdir, "meta.pkl"), "wb") as f:
+        pickle.dump(rows, f)
+    store = MetadataStore(ROW_SCHEMA)
+    store.append(range(n), rows)
+    store.save(os.path.join(workdir, "meta"))
+
+
+def measure(fmt: str, workdir: str, n: int, lookups: int) -> dict:
+    """Runs in a subprocess: load one format, then read a few random rows."""
+    before = memory_mb()
+    start = time.perf_counter()
+    if fmt == "pickle":
+        with open(os.path.join(workdir, "meta.pkl"), "rb") as f:
+            rows = pickle.load(f)
+
+        def get_text(i):
+            return rows[i]["text"]
+    else:
+        store = MetadataStore.open(os.path.join(workdir, "meta"), ROW_SCHEMA)
+
+        def get_text(i):
+            return store.field(i, "text")
+    load_s = time.perf_counter() - start
+    loaded = memory_mb()
+
+    rng = random.Random(1)
+    ids = [rng.randrange(n) for _ in range(lookups)]
+    start = time.perf_counter()
+    for i in ids:
+        get_text(i)
+    lookup_us = (time.perf_counter() - start) / lookups * 1e6
+    return {
+        "load_s": round(load_s, 4),
+        "after_load": delta(loaded, before),
+        "after_lookups": delta(memory_mb(), before),
+        "lookup_us": round(lookup_us, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--text-chars", type=int, default=1000)
+    parser.add_argument("--sources", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--measure", choices=("pickle", "compact"), help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.workdir, args.rows, args.lookups)))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        write_formats(workdir, args.rows, args.text_chars, args.sources)
+        results = {"rows": args.rows, "text_chars": args.text_chars}
+        for fmt in ("pickle", "compact"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--measure", fmt, "--workdir", workdir,
+                 "--rows", str(args.rows), "--lookups", str(args.lookups)],
+                check=True, capture_output=True, text=True,
+            )
+            results[fmt] = json.loads(out.stdout.strip().splitlines()[-1])
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
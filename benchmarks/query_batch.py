@@ -0,0 +1,96 @@
+#benchmarks/query_batch.py
+"""
+Throughput of PublicAgentRAG.respond_batch against a sequential respond loop.
+
+    python benchmarks/query_batch.py --questions 1000 --llm-ms 200 --concurrency 8
+
+A temporary store is filled with `--docs` synthetic documents. The LLM
+is replaced by a sleep of `--llm-ms`, so the numbers show what batching
+and concurrency remove: per-query encode/search overhead and serialized
+generation. The answer cache is off. Prints JSON.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.public_agent_rag import PublicAgentRAG  # noqa: E402
+
+TOPICS = ["admission", "library", "exam", "scholarship", "hostel", "course", "fee", "transport", "lab", "club"]
+
+
+def make_doc(i: int, rng: random.Random) -> str:
+    topic = rng.choice(TOPICS)
+    return " ".join(
+        f"The {topic} office handles request {i}-{j} for course CSE-{rng.randint(100, 499)} in room {rng.randint(1, 40)}."
+        for j in range(12)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched vs sequential RAG queries.")
+    parser.add_argument("--questions", type=int, default=1000)
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--llm-ms", type=float, default=200.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sequential", type=int, default=None, help="questions for the sequential loop (default: all)")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    questions = [f"Which office handles {rng.choice(TOPICS)} for CSE-{rng.randint(100, 499)}?" for _ in range(args.questions)]
+
+    def llm(prompt: str) -> str:
+        time.sleep(args.llm_ms / 1000)
+        return "ok"
+
+    with tempfile.TemporaryDirectory() as workdir:
+        agent = PublicAgentRAG(
+            index_path=os.path.join(workdir, "index.faiss"),
+            meta_path=os.path.join(workdir, "meta.pkl"),
+            answer_cache=False,
+        )
+        for i in range(args.docs):
+            agent.add_text(make_doc(i, rng), source=f"doc{i}")
+        agent.warm_up()
+
+        results = {"questions": args.questions, "llm_ms": args.llm_ms, "concurrency": args.concurrency}
+        n_seq = args.sequential or args.questions
+        start = time.perf_counter()
+        for q in questions[:n_seq]:
+            plan = agent.prepare(q)
+            agent.remember(q, plan, llm(plan["prompt"]))
+        elapsed = time.perf_counter() - start
+        results["sequential"] = {"questions": n_seq, "seconds": round(elapsed, 2), "qps": round(n_seq / elapsed, 2)}
+
+        start = time.perf_counter()
+        first = None
+        for _ in agent.respond_batch(questions, concurrency=args.concurrency, ordered=False, llm=llm):
+            first = first or time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+        results["batch"] = {
+            "seconds": round(elapsed, 2),
+            "qps": round(args.questions / elapsed, 2),
+            "first_result_s": round(first or 0.0, 3),
+        }
+        results["speedup"] = round(results["batch"]["qps"] / results["sequential"]["qps"], 2)
+
+        # Retrieval alone: one row per call vs one matrix search per 256 queries.
+        start = time.perf_counter()
+        for q in questions[:n_seq]:
+            agent.prepare(q)
+        single = (time.perf_counter() - start) / n_seq
+        start = time.perf_counter()
+        for lo in range(0, args.questions, 256):
+            agent.prepare_batch(questions[lo:lo + 256])
+        batched = (time.perf_counter() - start) / args.questions
+        results["retrieval_ms_per_query"] = {"single": round(single * 1000, 3), "batched": round(batched * 1000, 3)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
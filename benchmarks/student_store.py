@@ -0,0 +1,104 @@
+#benchmarks/student_store.py
+"""
+Student record lookups: StudentStore against the old load-and-scan.
+
+    python benchmarks/student_store.py --students 40000
+
+Records come from agents/test/privat_data_creation.py and are written to a
+temporary JSON file. It reports the one-off SQLite build, cold lookups
+(random ids, empty cache), hot lookups (a small set of repeating ids), a
+linear `next(...)` scan over the parsed list as PrivateAgent used to do, and
+how long a changed file takes to be picked up (and lookup latency meanwhile).
+Prints JSON.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.test.privat_data_creation import generate_students, write_json  # noqa: E402
+from utils.student_store import StudentStore  # noqa: E402
+
+
+def percentiles(times) -> dict:
+    times = sorted(t * 1e6 for t in times)
+    return {
+        "p50_us": round(times[len(times) // 2], 1),
+        "p95_us": round(times[int(len(times) * 0.95)], 1),
+        "mean_us": round(sum(times) / len(times), 1),
+    }
+
+
+def time_lookups(fn, ids) -> dict:
+    times = []
+    for student_id in ids:
+        start = time.perf_counter()
+        fn(student_id)
+        times.append(time.perf_counter() - start)
+    return percentiles(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark student record lookups.")
+    parser.add_argument("--students", type=int, default=40_000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--scan-lookups", type=int, default=200)
+    parser.add_argument("--hot", type=int, default=100, help="distinct ids in the hot set")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    ids = [f"student_{1001 + rng.randrange(args.students)}" for _ in range(args.lookups)]
+    hot = [f"student_{1001 + i}" for i in range(args.hot)]
+    hot_ids = [rng.choice(hot) for _ in range(args.lookups)]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "students.json")
+        write_json(generate_students(args.students, seed=0), path)
+        results = {"students": args.students, "json_mb": round(os.path.getsize(path) / 1e6, 1)}
+
+        start = time.perf_counter()
+        store = StudentStore(path, cache_size=1024, check_interval=0.0)
+        results["build_s"] = round(time.perf_counter() - start, 2)
+        start = time.perf_counter()
+        StudentStore(path)
+        results["reopen_s"] = round(time.perf_counter() - start, 3)
+
+        store._cache.clear()
+        store.cache_size = 0
+        results["cold"] = time_lookups(store.get, ids)
+        store.cache_size = 1024
+        results["hot"] = time_lookups(store.get, hot_ids)
+
+        start = time.perf_counter()
+        with open(path, "r") as f:
+            data = json.load(f)
+        results["json_load_s"] = round(time.perf_counter() - start, 2)
+        results["linear_scan"] = time_lookups(
+            lambda sid: next((s for s in data if s["student_id"] == sid), None), ids[:args.scan_lookups]
+        )
+
+        # Change one record and time until a lookup sees it (the rebuild runs in the background).
+        data[0]["name"] = "Changed"
+        write_json(data, path)
+        start = time.perf_counter()
+        lookups = []
+        while True:
+            t = time.perf_counter()
+            record = store.get(data[0]["student_id"])
+            lookups.append(time.perf_counter() - t)
+            if record["name"] == "Changed":
+                break
+            time.sleep(0.001)
+        results["reload_s"] = round(time.perf_counter() - start, 2)
+        results["during_reload"] = percentiles(lookups)
+        results["store"] = store.stats()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
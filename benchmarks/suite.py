@@ -0,0 +1,348 @@
+#benchmarks/suite.py
+"""
+End-to-end benchmark suite with a fake embedder and a fake LLM.
+
+    python benchmarks/suite.py --out bench.json
+    python benchmarks/suite.py --only search --sizes 1000,10000,100000,1000000
+    python benchmarks/suite.py --out new.json --compare bench.json
+
+Sections (all by default, or pick with --only):
+
+- ingest: add_text, add_pdf and bulk_ingest throughput.
+- search: VectorStore.search latency and search_batch throughput per corpus size.
+- query: /query p50/p95/p99 through the FastAPI app at each --concurrency,
+  with the LLM served by agents/test/fake_ollama_server.py.
+- router: OrchestrationAgent.classify_message latency and tier mix.
+- cold_start: importing main.py and loading + warming up the agent, in fresh
+  processes.
+
+Everything runs in a scratch directory (main.py's data/ paths and the
+embedding cache resolve there), so the real data is never touched. The
+result is JSON with the commit and settings; --compare adds the relative
+change of every number against an earlier result file.
+"""
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.common import latency_summary  # noqa: E402
+from benchmarks.fakes import EMBED_MODEL, FakeLLM, install_fake_embedder  # noqa: E402
+
+SECTIONS = ("ingest", "search", "query", "router", "cold_start")
+TOPICS = ["admission", "library", "exam", "scholarship", "hostel", "course", "fee", "transport", "lab", "club"]
+
+
+def make_doc(i: int, rng: random.Random, sentences: int = 12) -> str:
+    topic = rng.choice(TOPICS)
+    return " ".join(
+        f"The {topic} office handles request {i}-{j} for course CSE-{rng.randint(100, 499)} in room {rng.randint(1, 40)}."
+        for j in range(sentences)
+    )
+
+
+def make_questions(n: int, rng: random.Random):
+    return [f"Which office handles {rng.choice(TOPICS)} for CSE-{rng.randint(100, 499)}?" for _ in range(n)]
+
+
+def rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds else 0.0
+
+
+# ---------- Ingestion ----------
+def bench_ingest(args) -> dict:
+    from agents.public_agent_rag import PublicAgentRAG
+
+    rng = random.Random(0)
+    os.makedirs("ingest", exist_ok=True)
+    agent = PublicAgentRAG(index_path="ingest/index.faiss", meta_path="ingest/meta.pkl", answer_cache=False)
+    results = {}
+
+    docs = [make_doc(i, rng) for i in range(args.docs)]
+    before = len(agent.store)
+    start = time.perf_counter()
+    for i, doc in enumerate(docs):
+        agent.add_text(doc, source=f"doc{i}")
+    elapsed = time.perf_counter() - start
+    chunks = len(agent.store) - before
+    results["add_text"] = {"docs": len(docs), "chunks": chunks, "seconds": round(elapsed, 3),
+                           "docs_per_s": rate(len(docs), elapsed), "chunks_per_s": rate(chunks, elapsed)}
+
+    try:
+        import fitz
+    except ImportError:
+        results["add_pdf"] = {"skipped": "PyMuPDF is not installed"}
+    else:
+        pdf = fitz.open()
+        for p in range(args.pdf_pages):
+            page = pdf.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 550, 800), make_doc(100_000 + p, rng, sentences=20), fontsize=9)
+        pdf.save("ingest/bench.pdf")
+        pdf.close()
+        before = len(agent.store)
+        start = time.perf_counter()
+        agent.add_pdf("ingest/bench.pdf", source="bench.pdf")
+        elapsed = time.perf_counter() - start
+        chunks = len(agent.store) - before
+        results["add_pdf"] = {"pages": args.pdf_pages, "chunks": chunks, "seconds": round(elapsed, 3),
+                              "pages_per_s": rate(args.pdf_pages, elapsed), "chunks_per_s": rate(chunks, elapsed)}
+
+    from bulk_ingest import ingest
+
+    os.makedirs("ingest/corpus", exist_ok=True)
+    for i in range(args.bulk_files):
+        with open(f"ingest/corpus/file{i}.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(make_doc(i * 10 + k, rng) for k in range(10)))
+    bulk_agent = PublicAgentRAG(index_path="ingest/bulk.faiss", meta_path="ingest/bulk.pkl", answer_cache=False)
+    totals = ingest("ingest/corpus", "ingest/manifest.json", args.workers, 256, 4096, bulk_agent)
+    results["bulk"] = {k: totals[k] for k in ("files", "chunks", "seconds", "chunks_per_s")}
+    return results
+
+
+# ---------- Search ----------
+def bench_search(args) -> dict:
+    import numpy as np
+    from utils.vector_store import VectorStore
+
+    results = {}
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.search_queries, args.dim), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    for size in args.sizes:
+        path = f"search/{size}"
+        os.makedirs(path, exist_ok=True)
+        store = VectorStore(f"{path}/index.faiss", f"{path}/meta.pkl", dedup=False)
+        start = time.perf_counter()
+        for lo in range(0, size, 50_000):
+            rows = min(50_000, size - lo)
+            store.add_embeddings(rng.standard_normal((rows, args.dim), dtype=np.float32),
+                                 [f"chunk {i}" for i in range(lo, lo + rows)], ["bench"] * rows)
+        built = time.perf_counter() - start
+
+        store.search(queries[:1], args.top_k)
+        times = []
+        for q in queries:
+            start = time.perf_counter()
+            store.search(q[None, :], args.top_k)
+            times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        store.search_batch(queries, args.top_k)
+        batch = time.perf_counter() - start
+        results[str(size)] = dict(
+            latency_summary(times),
+            build_s=round(built, 2),
+            batch_qps=rate(len(queries), batch),
+            index=type(store.index).__name__,
+        )
+        del store
+    return results
+
+
+# ---------- /query through the API ----------
+def bench_query(args) -> dict:
+    from agents.test.fake_ollama_server import FakeOllamaServer
+
+    server = FakeOllamaServer(delay=args.llm_ms / 1000, think=True).start()
+    os.environ["OLLAMA_HOST"] = server.url
+    os.environ["WARMUP_ON_STARTUP"] = "0"
+    try:
+        import httpx
+        import main
+
+        rng = random.Random(1)
+        agent = main.rag_agent()
+        for i in range(args.docs):
+            agent.add_text(make_doc(i, rng), source=f"doc{i}")
+        agent.warm_up()
+        results = {"llm_ms": args.llm_ms, "docs": args.docs}
+        levels = [(c, make_questions(args.requests, rng)) for c in args.concurrency]
+        # One event loop for every level: the stages' semaphores bind to the first loop they run on.
+        results.update(asyncio.run(run_levels(main.app, levels, httpx)))
+        results["llm_server"] = {"requests": server.requests, "max_concurrent": server.max_concurrent}
+        main.shutdown_stages()
+        return results
+    finally:
+        server.stop()
+
+
+async def run_levels(app, levels, httpx) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        return {f"c{c}": await run_queries(client, questions, c) for c, questions in levels}
+
+
+async def run_queries(client, questions, concurrency: int) -> dict:
+    gate = asyncio.Semaphore(concurrency)
+    times, statuses = [], {}
+
+    async def one(client, question):
+        async with gate:
+            start = time.perf_counter()
+            response = await client.post("/query", data={"query": question})
+            times.append(time.perf_counter() - start)
+            status = response.json().get("status") if response.status_code == 200 else str(response.status_code)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(client, q) for q in questions))
+    elapsed = time.perf_counter() - start
+    return dict(latency_summary(times), requests=len(questions), qps=rate(len(questions), elapsed), statuses=statuses)
+
+
+# ---------- Router ----------
+def bench_router(args) -> dict:
+    from agents.intent_router import IntentRouter
+    from agents.memory_manager import MemoryManager
+    from agents.orchestration_agent import OrchestrationAgent
+    from benchmarks.intent_router import LABELLED
+    from utils.embedding_service import get_encoder
+
+    llm = FakeLLM(latency_ms=args.llm_ms, answer="PUBLIC")
+    router = IntentRouter(llm=llm, encoder=get_encoder(EMBED_MODEL))
+    orchestrator = OrchestrationAgent(llm, None, None, None, MemoryManager(), router=router)
+    messages = [m for m, _ in LABELLED] * max(1, args.router_rounds)
+    orchestrator.classify_message(messages[0])  # builds the centroids
+    times, tiers = [], {}
+    for message in messages:
+        start = time.perf_counter()
+        orchestrator.classify_message(message)
+        times.append(time.perf_counter() - start)
+        tier = orchestrator.last_decision.tier
+        tiers[tier] = tiers.get(tier, 0) + 1
+    return dict(latency_summary(times), messages=len(messages), tiers=tiers, llm_calls=llm.calls)
+
+
+# ---------- Cold start ----------
+def bench_cold_start(args) -> dict:
+    from agents.public_agent_rag import PublicAgentRAG
+
+    rng = random.Random(2)
+    os.makedirs("cold/data", exist_ok=True)
+    agent = PublicAgentRAG(index_path="cold/data/public_index.faiss", meta_path="cold/data/public_meta.pkl")
+    for i in range(args.docs):
+        agent.add_text(make_doc(i, rng), source=f"doc{i}")
+    agent.store.compact()
+    del agent
+
+    runs = []
+    for _ in range(args.cold_runs):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--measure", "cold-start"],
+            cwd=os.path.abspath("cold"), capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    return {k: round(sorted(r[k] for r in runs)[len(runs) // 2], 3) for k in runs[0]}
+
+
+def measure_cold_start() -> dict:
+    """Runs in a fresh process, in the scratch directory: import main, then load and warm up."""
+    start = time.perf_counter()
+    install_fake_embedder()
+    os.environ["WARMUP_ON_STARTUP"] = "0"
+    import main
+
+    imported = time.perf_counter()
+    main.rag.get()
+    ready = time.perf_counter()
+    return {"import_main_s": imported - start, "load_and_warm_up_s": ready - imported, "time_to_ready_s": ready - start}
+
+
+# ---------- Results ----------
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(new, old, prefix: str = "") -> dict:
+    """Relative change of every number present in both results, keyed by dotted path."""
+    out = {}
+    if isinstance(new, dict) and isinstance(old, dict):
+        for key in sorted(new.keys() & old.keys()):
+            if key != "meta":
+                out.update(compare(new[key], old[key], f"{prefix}{key}."))
+    elif isinstance(new, (int, float)) and isinstance(old, (int, float)) and not isinstance(new, bool):
+        change = round((new - old) / old * 100, 1) if old else None
+        out[prefix[:-1]] = {"old": old, "new": new, "change_pct": change}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the end-to-end benchmark suite.")
+    parser.add_argument("--only", default=",".join(SECTIONS), help="comma-separated sections")
+    parser.add_argument("--out", help="write the JSON result here")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--pdf-pages", type=int, default=50)
+    parser.add_argument("--bulk-files", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--sizes", default="1000,10000,100000", help="corpus sizes for the search section")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--search-queries", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=200, help="/query requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--llm-ms", type=float, default=50.0, help="fake LLM latency")
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="fake embedder latency per encode call")
+    parser.add_argument("--router-rounds", type=int, default=20)
+    parser.add_argument("--cold-runs", type=int, default=3)
+    parser.add_argument("--measure", choices=("cold-start",), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure_cold_start()))
+        return
+
+    sections = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+    args.sizes = [int(s) for s in args.sizes.split(",")]
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    out_path = os.path.abspath(args.out) if args.out else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    results = {"meta": {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "measure")},
+    }}
+    # Stay in the scratch directory until exit: the embedding cache and the
+    # interaction log flush there from atexit hooks, which run before this one.
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    atexit.register(shutil.rmtree, workdir, True)
+    os.chdir(workdir)
+    install_fake_embedder(ms_per_batch=args.embed_ms)
+    for section in sections:
+        print(f"Running {section}...", file=sys.stderr)
+        start = time.perf_counter()
+        results[section] = globals()[f"bench_{section}"](args)
+        results[section]["section_s"] = round(time.perf_counter() - start, 2)
+
+    if compare_path:
+        with open(compare_path, "r", encoding="utf-8") as f:
+            results["comparison"] = compare(results, json.load(f))
+    text = json.dumps(results, indent=2)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
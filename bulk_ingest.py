@@ -0,0 +1,201 @@
+#bulk_ingest.py
+"""
+Bulk-ingest a directory tree of PDFs / text files into the public RAG store.
+
+    python bulk_ingest.py path/to/corpus --workers 8 --batch-size 256
+
+- Files are extracted and chunked on a process pool.
+- Chunks are embedded in large batches and committed to the VectorStore in bulk.
+- A manifest of (path, mtime, size, content hash) is updated after every
+  commit, so reruns skip unchanged files and resume after a crash.
+- Files whose content changed replace their previously stored chunks.
+
+Stop the API server first: it holds the same store, and a VectorStore has a
+single writer process (a second one is refused).
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from agents.public_agent_rag import PublicAgentRAG
+from utils.document_loader import iter_pdf_pages, iter_chunks, load_tokenizer
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+
+# ---------- Manifest ----------
+class Manifest:
+    """JSON map of path -> {mtime, size, sha256, chunks}, rewritten atomically."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def is_current(self, path: str, stat) -> bool:
+        entry = self.entries.get(path)
+        return bool(entry) and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size
+
+    def record(self, path: str, stat, sha256: str, chunks: int):
+        self.entries[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": sha256, "chunks": chunks}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+# ---------- Worker ----------
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def extract_file(path: str, chunk_size: int, overlap: int, model_name: str, known_sha256: str = None):
+    """
+    Runs in a worker process. Returns (path, sha256, pages, chunks);
+    chunks is None when the content hash matches `known_sha256`.
+    Chunks are token-measured with the embedding model's tokenizer (by
+    whitespace-separated words if `model_name` is None).
+    """
+    sha256 = file_sha256(path)
+    if sha256 == known_sha256:
+        return path, sha256, 0, None
+
+    if path.lower().endswith(".pdf"):
+        pages = list(iter_pdf_pages(path))
+    else:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            pages = [f.read()]
+    tokenizer = load_tokenizer(model_name) if model_name else None
+    return path, sha256, len(pages), list(iter_chunks(pages, chunk_size, overlap, tokenizer))
+
+
+def walk(root: str):
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield os.path.join(dirpath, name)
+
+
+# ---------- Driver ----------
+def ingest(root: str, manifest_path: str, workers: int, batch_size: int, commit_rows: int, agent: PublicAgentRAG):
+    manifest = Manifest(manifest_path)
+    todo = []
+    skipped = 0
+    for path in walk(root):
+        stat = os.stat(path)
+        if manifest.is_current(path, stat):
+            skipped += 1
+        else:
+            todo.append((path, stat))
+
+    print(f"Found {len(todo)} new/changed files ({skipped} unchanged, skipped).")
+    totals = {"files": 0, "pages": 0, "chunks": 0}
+    pending_chunks, pending_sources, pending_files = [], [], []
+
+    def commit():
+        # Changed files: drop the chunks of the previous version first.
+        for path, _, sha256, _ in pending_files:
+            known = manifest.entries.get(path, {}).get("sha256")
+            if known is not None and known != sha256:
+                agent.store.delete_source(path)
+        if pending_chunks:
+            texts = [c.text for c in pending_chunks]
+            offsets = [{"doc": s, "start": c.start, "end": c.end} for c, s in zip(pending_chunks, pending_sources)]
+            embeddings = agent.model.encode(texts, convert_to_numpy=True, batch_size=batch_size)
+            agent.store.add_embeddings(embeddings, texts, pending_sources, extra=offsets)
+        # Only now are these files durable in the store.
+        for path, stat, sha256, n_chunks in pending_files:
+            manifest.record(path, stat, sha256, n_chunks)
+        manifest.save()
+        pending_chunks.clear()
+        pending_sources.clear()
+        pending_files.clear()
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep a bounded window of files in flight so memory stays flat.
+        queue = iter(todo)
+        window = []
+
+        def submit_next():
+            item = next(queue, None)
+            if item is not None:
+                path, stat = item
+                known = manifest.entries.get(path, {}).get("sha256")
+                # Workers chunk the way the agent does: by words if it has no tokenizer.
+                tokenizer_name = agent.embed_model_name if agent.tokenizer is not None else None
+                window.append((stat, pool.submit(
+                    extract_file, path, agent.chunk_size, agent.chunk_overlap, tokenizer_name, known
+                )))
+
+        for _ in range(2 * workers):
+            submit_next()
+
+        while window:
+            stat, future = window.pop(0)
+            submit_next()
+            try:
+                path, sha256, pages, chunks = future.result()
+            except Exception as e:
+                print(f"  ! failed: {e}")
+                continue
+
+            if chunks is None:
+                # Touched but unchanged: refresh mtime only.
+                pending_files.append((path, stat, sha256, manifest.entries[path]["chunks"]))
+                continue
+
+            pending_chunks.extend(chunks)
+            pending_sources.extend([path] * len(chunks))
+            pending_files.append((path, stat, sha256, len(chunks)))
+            totals["files"] += 1
+            totals["pages"] += pages
+            totals["chunks"] += len(chunks)
+            if len(pending_chunks) >= commit_rows:
+                commit()
+                print(f"  committed {totals['files']}/{len(todo)} files, {totals['chunks']} chunks")
+        commit()
+
+    elapsed = time.perf_counter() - start
+    totals["seconds"] = round(elapsed, 2)
+    totals["pages_per_s"] = round(totals["pages"] / elapsed, 1) if elapsed else 0.0
+    totals["chunks_per_s"] = round(totals["chunks"] / elapsed, 1) if elapsed else 0.0
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory into the public RAG store.")
+    parser.add_argument("root", help="Directory to ingest (searched recursively)")
+    parser.add_argument("--manifest", default="data/ingest_manifest.json")
+    parser.add_argument("--index-path", default="data/public_index.faiss")
+    parser.add_argument("--meta-path", default="data/public_meta.pkl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=256, help="Embedding batch size")
+    parser.add_argument("--commit-rows", type=int, default=4096, help="Chunks per bulk store commit")
+    args = parser.parse_args()
+
+    agent = PublicAgentRAG(index_path=args.index_path, meta_path=args.meta_path, answer_cache=False)
+    totals = ingest(args.root, args.manifest, args.workers, args.batch_size, args.commit_rows, agent)
+    agent.store.compact()
+    print(
+        f"Ingested {totals['files']} files, {totals['pages']} pages, {totals['chunks']} chunks "
+        f"in {totals['seconds']}s ({totals['pages_per_s']} pages/s, {totals['chunks_per_s']} chunks/s)."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,145 @@
 #main.py
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
-from agents.public_agent_rag import PublicAgentRAG
-import shutil
+from fastapi import FastAPI, UploadFile, File, Form, Request
+from pydantic import BaseModel
+from typing import List, Optional
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from agents.llm_interface import async_local_llm, astream_local_llm, strip_think
+from utils.concurrency import Stage, Overloaded, LazyResource
+from utils.embedding_cache import cache_stats
+from utils.embedding_service import service_stats
+from utils.logging import get_logger, log_interaction
+from agents.memory_manager import SessionMemory
+from utils import metrics
+from contextlib import AsyncExitStack
+import asyncio
+import json
 import os
+import time
 
 app = FastAPI(title="University Public RAG Agent")
 
-# Initialize the RAG agent
-rag_agent = PublicAgentRAG(
-    index_path="data/public_index.faiss",
-    meta_path="data/public_meta.pkl",
+# ---------------- Concurrency ----------------
+# Each stage has its own concurrency limit and wait queue; when the queue is
+# full the request is rejected with 503 instead of piling up.
+# Encoding and FAISS search release the GIL, so a thread pool scales with cores.
+CPU_COUNT = os.cpu_count() or 1
+retrieval_stage = Stage("retrieval", max_concurrency=CPU_COUNT, max_queue=64, threads=CPU_COUNT)
+llm_stage = Stage("llm", max_concurrency=int(os.getenv("LLM_CONCURRENCY", "4")), max_queue=32)
+ingest_stage = Stage("ingest", max_concurrency=2, max_queue=8, threads=2)
+
+
+def overloaded_response(e: Overloaded):
+    return JSONResponse({"status": "error", "message": str(e)}, status_code=503)
+
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+# ---------------- Metrics ----------------
+# /metrics serves every counter, gauge and histogram in the Prometheus text
+# format. Each request is timed by route and status; with TRACE_HEADERS=1
+# (or an `X-Trace: 1` request header) the response also carries a
+# Server-Timing header with the time spent in each step (encode,
+# vector_search, pack, llm_queue, llm_gate, llm, ...). METRICS_ENABLED=0 turns it off.
+TRACE_HEADERS = os.getenv("TRACE_HEADERS", "0") == "1"
+HTTP_SECONDS = metrics.histogram(
+    "http_request_seconds", "Time until response headers, by route and status.", ("route", "status")
 )
+HTTP_IN_FLIGHT = metrics.gauge("http_in_flight", "Requests being handled.")
+STAGE_REQUESTS = metrics.gauge("stage_requests", "Requests per stage, running or queued.", ("stage", "state"))
+EMBEDDING_CACHE = metrics.counter("embedding_cache_lookups", "Embedding cache lookups.", ("model", "result"))
+SESSIONS = metrics.gauge("sessions_active", "Conversation sessions held in memory.")
+LOG_DROPPED = metrics.counter("interaction_log_dropped", "Interaction log records dropped on a full queue.")
+
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    if not metrics.ENABLED or request.url.path == "/metrics":
+        return await call_next(request)
+    token = metrics.start_trace() if TRACE_HEADERS or request.headers.get("x-trace") == "1" else None
+    started = time.perf_counter()
+    status = 500
+    try:
+        with HTTP_IN_FLIGHT.track():
+            response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_SECONDS.labels(route, str(status)).observe(elapsed)
+        spans = metrics.end_trace(token) if token is not None else None
+    if spans is not None:
+        response.headers["Server-Timing"] = metrics.server_timing(spans + [("total", elapsed)])
+    return response
+
+
+def collect_metrics():
+    """Copy counts kept elsewhere (stages, caches, sessions, log) into the registry before a scrape."""
+    for stage in (retrieval_stage, llm_stage, ingest_stage):
+        STAGE_REQUESTS.labels(stage.name, "running").set(stage.in_flight)
+        STAGE_REQUESTS.labels(stage.name, "queued").set(stage.waiting)
+    for cache in cache_stats():
+        EMBEDDING_CACHE.labels(cache["model"], "hit_memory").set(cache["hits_memory"])
+        EMBEDDING_CACHE.labels(cache["model"], "hit_disk").set(cache["hits_disk"])
+        EMBEDDING_CACHE.labels(cache["model"], "miss").set(cache["misses"])
+    SESSIONS.set(len(sessions.sessions))
+    LOG_DROPPED.labels().set(get_logger().dropped)
+
+
+metrics.REGISTRY.on_collect(collect_metrics)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.on_event("shutdown")
+def shutdown_stages():
+    for stage in (retrieval_stage, llm_stage, ingest_stage):
+        stage.shutdown()
+    get_logger().close()
+
+# ---------------- RAG agent (lazy) ----------------
+# Importing this module stays cheap: faiss, torch and the embedding model are
+# only loaded when the agent is first needed. On startup it is built and
+# warmed up in the background; /ready reports when that has finished.
+# INDEX_MMAP=1 memory-maps the saved index so workers share its pages.
+# RETRIEVAL_MODE=dense turns off the BM25 side of hybrid retrieval.
+def build_rag_agent():
+    from agents.public_agent_rag import PublicAgentRAG
+
+    return PublicAgentRAG(
+        index_path="data/public_index.faiss",
+        meta_path="data/public_meta.pkl",
+        mmap_index=os.getenv("INDEX_MMAP", "0") == "1",
+        retrieval=os.getenv("RETRIEVAL_MODE", "hybrid"),
+    )
+
+
+rag = LazyResource(build_rag_agent, warm_up=lambda agent: agent.warm_up(), name="public_rag")
+
+
+def rag_agent():
+    """The RAG agent, loading it on first use."""
+    return rag.get()
+
+
+@app.on_event("startup")
+def warm_up_agents():
+    if os.getenv("WARMUP_ON_STARTUP", "1") == "1":
+        rag.start()
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the model and index are loaded and warmed up, 503 before.
+    """
+    status = rag.status()
+    return JSONResponse({"status": status["state"], "agents": [status]}, status_code=200 if rag.ready else 503)
 
 # ---------------- Add text ----------------
 @app.post("/add-text")
@@ -20,8 +148,10 @@ async def add_text(text: str = Form(...), source: str = Form("manual")):
     Add plain text to the RAG database.
     """
     try:
-        rag_agent.add_text(text, source)
+        await ingest_stage.run(lambda: rag_agent().add_text(text, source))
         return JSONResponse({"status": "success", "message": f"Text added from source '{source}'."})
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return JSONResponse({"status": "error", "message": str(e)})
 
@@ -32,29 +162,356 @@ async def add_pdf(file: UploadFile = File(...)):
     Upload a PDF and add its content to the RAG database.
     """
     try:
-        temp_path = f"temp_uploads/{file.filename}"
-        os.makedirs("temp_uploads", exist_ok=True)
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        rag_agent.add_pdf(temp_path)
-        os.remove(temp_path)
+        # Parse straight from memory instead of copying to a temp file.
+        data = await file.read()
+        await ingest_stage.run(lambda: rag_agent().add_pdf(data, file.filename))
         return JSONResponse({"status": "success", "message": f"PDF '{file.filename}' added successfully."})
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)})
+
+# ---------------- Manage documents ----------------
+@app.get("/documents")
+async def list_documents():
+    """
+    List ingested sources with their live chunk counts.
+    """
+    try:
+        documents = await retrieval_stage.run(lambda: rag_agent().store.sources())
+        return JSONResponse({"status": "success", "documents": documents})
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)})
+
+
+@app.delete("/documents")
+async def delete_document(source: str):
+    """
+    Remove every chunk ingested from `source`.
+    """
+    try:
+        removed = await ingest_stage.run(lambda: rag_agent().delete_source(source))
+        return JSONResponse({"status": "success", "message": f"Removed {removed} chunks from source '{source}'."})
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return JSONResponse({"status": "error", "message": str(e)})
 
+
+@app.post("/replace-text")
+async def replace_text(text: str = Form(...), source: str = Form("manual")):
+    """
+    Replace the content stored under `source` with new text.
+    """
+    try:
+        await ingest_stage.run(lambda: rag_agent().replace_text(text, source))
+        return JSONResponse({"status": "success", "message": f"Text replaced for source '{source}'."})
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)})
+
+
+@app.post("/replace-pdf")
+async def replace_pdf(file: UploadFile = File(...)):
+    """
+    Upload a new version of a PDF, replacing the chunks of the previous one.
+    """
+    try:
+        data = await file.read()
+        await ingest_stage.run(lambda: rag_agent().replace_pdf(data, file.filename))
+        return JSONResponse({"status": "success", "message": f"PDF '{file.filename}' replaced successfully."})
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)})
+
+# ---------------- MongoDB sync ----------------
+# Chunks loaded into MongoDB by agents/db/load_pdfs.py are applied to the
+# store here, in the process that owns it (a VectorStore has one writer).
+mongo_syncer = None
+
+
+@app.post("/sync-mongo")
+async def sync_mongo(rebuild: bool = Form(False)):
+    """
+    Apply the chunk documents changed since the last sync (all of them with
+    `rebuild`) to the RAG database; see agents/db/vector_sync.py.
+    """
+    global mongo_syncer
+    try:
+        async with ingest_stage.slot():
+            if mongo_syncer is None:
+                from agents.db.database import public_docs_collection
+                from agents.db.vector_sync import MongoVectorSync
+
+                agent = await asyncio.to_thread(rag_agent)
+                mongo_syncer = MongoVectorSync(public_docs_collection, agent.store, model_name=agent.embed_model_name)
+            stats = await (mongo_syncer.rebuild() if rebuild else mongo_syncer.sync())
+        return JSONResponse({"status": "success", "stats": stats})
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)})
+
+# ---------------- Sessions ----------------
+# Conversation history per `session_id`, bounded in sessions and tokens.
+# SESSION_SPILL_DIR keeps evicted sessions on disk instead of dropping them;
+# idle sessions and expired spill files are swept every SESSION_SWEEP_INTERVAL seconds.
+sessions = SessionMemory(
+    max_sessions=int(os.getenv("MAX_SESSIONS", "10000")),
+    ttl=float(os.getenv("SESSION_TTL", "3600")),
+    max_history=int(os.getenv("SESSION_MAX_HISTORY", "20")),
+    max_tokens=int(os.getenv("SESSION_MAX_TOKENS", "1000")),
+    spill_dir=os.getenv("SESSION_SPILL_DIR") or None,
+)
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+
+async def get_session(session_id: Optional[str]):
+    """The session's memory (None without an id); spill file I/O runs off the event loop."""
+    if not session_id:
+        return None
+    if sessions.spill_dir:
+        return await asyncio.to_thread(sessions.get, session_id)
+    return sessions.get(session_id)
+
+
+async def sweep_sessions():
+    # Idle sessions and expired spill files are otherwise only removed when their id comes back.
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        try:
+            removed = await asyncio.to_thread(sessions.sweep)
+            if removed:
+                print(f"[sessions] Swept {removed} idle sessions.")
+        except Exception as e:
+            print(f"[sessions] Sweep failed: {e}")
+
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    app.state.session_sweeper = asyncio.create_task(sweep_sessions())
+
+
+@app.on_event("shutdown")
+async def stop_session_sweeper():
+    task = getattr(app.state, "session_sweeper", None)
+    if task is not None:
+        task.cancel()
+
+
+def record_turn(memory, query: str, plan: dict, answer: str):
+    """
+    Add the exchange to the session; answers that saw earlier turns are not cached.
+    Failed answers are not recorded, and <think> reasoning is kept out of the
+    history (it would crowd the real turns out of the token budget).
+    """
+    if answer.startswith("[LLM Error]"):
+        return
+    if memory is None or not memory.buffer:
+        rag_agent().remember(query, plan, answer)
+    if memory is not None:
+        memory.add_message("User", query)
+        memory.add_message("Assistant", strip_think(answer))
+
 # ---------------- Query ----------------
 @app.post("/query")
-async def query_rag(query: str = Form(...)):
+async def query_rag(query: str = Form(...), session_id: Optional[str] = Form(None)):
     """
-    Query the RAG agent and get an answer.
+    Query the RAG agent and get an answer. With `session_id`, earlier turns
+    of that session are included in the prompt.
     """
+    started = time.perf_counter()
     try:
-        response = rag_agent.respond(query)
-        return JSONResponse({"status": "success", "answer": response})
+        memory = await get_session(session_id)
+        # A follow-up depends on earlier turns, so a cached answer to the bare query can be wrong.
+        use_cache = memory is None or not memory.buffer
+        plan = await retrieval_stage.run(lambda: rag_agent().prepare(query, use_cache))
+        if plan["cached_answer"] is not None:
+            if memory is not None:
+                record_turn(memory, query, plan, plan["cached_answer"])
+            log_interaction("PUBLIC_RAG", query, plan["cached_answer"], endpoint="/query", cached=True,
+                            session_id=session_id, latency_ms=elapsed_ms(started))
+            return JSONResponse({"status": "success", "answer": plan["cached_answer"], "cached": True})
+        response = await llm_stage.run_async(async_local_llm, plan["prompt"], memory)
+        record_turn(memory, query, plan, response)
+        log_interaction("PUBLIC_RAG", query, response, endpoint="/query", cached=False,
+                        session_id=session_id, latency_ms=elapsed_ms(started))
+        return JSONResponse({"status": "success", "answer": response, "context": plan["context"]})
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return JSONResponse({"status": "error", "message": str(e)})
 
+# ---------------- Query (batch) ----------------
+# Retrieval runs BATCH_RETRIEVAL_SIZE questions per encode call and matrix
+# search; generation for one batch request uses at most `concurrency` LLM
+# slots (capped by BATCH_LLM_CONCURRENCY) and still goes through llm_stage.
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "5000"))
+BATCH_RETRIEVAL_SIZE = int(os.getenv("BATCH_RETRIEVAL_SIZE", "128"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", str(llm_stage.max_concurrency)))
+
+
+class BatchQuery(BaseModel):
+    queries: List[str]
+    ordered: bool = True
+    concurrency: Optional[int] = None
+
+
+@app.post("/query-batch")
+async def query_rag_batch(batch: BatchQuery):
+    """
+    Answer many questions in one call. The response is NDJSON: one line per
+    question ({"index", "query", "status", "answer" | "message", "cached",
+    "context"}), in input order or, with "ordered": false, as each answer
+    is ready, followed by a {"status": "done"} summary line.
+    """
+    if len(batch.queries) > MAX_BATCH_QUERIES:
+        return JSONResponse({"status": "error", "message": f"At most {MAX_BATCH_QUERIES} queries per batch."})
+    concurrency = max(1, min(batch.concurrency or BATCH_LLM_CONCURRENCY, BATCH_LLM_CONCURRENCY))
+    queries = batch.queries
+    started = time.perf_counter()
+    try:
+        # Retrieve the first chunk before responding so overload is still a 503.
+        first = await retrieval_stage.run(lambda: rag_agent().prepare_batch(queries[:BATCH_RETRIEVAL_SIZE]))
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)})
+
+    async def answer(index: int, plan: dict, gate: asyncio.Semaphore) -> dict:
+        result = {"index": index, "query": queries[index], "cached": plan["cached_answer"] is not None,
+                  "context": plan["context"]}
+        try:
+            if result["cached"]:
+                text = plan["cached_answer"]
+            else:
+                async with gate:
+                    text = await llm_stage.run_async(async_local_llm, plan["prompt"])
+                rag_agent().remember(queries[index], plan, text)
+            result.update(status="success", answer=text)
+            log_interaction("PUBLIC_RAG", queries[index], text, endpoint="/query-batch", cached=result["cached"],
+                            latency_ms=elapsed_ms(started))
+        except Overloaded as e:
+            result.update(status="overloaded", message=str(e))
+        except Exception as e:
+            result.update(status="error", message=str(e))
+        return result
+
+    async def results():
+        gate = asyncio.Semaphore(concurrency)
+        tasks = []
+        try:
+            for start in range(0, len(queries), BATCH_RETRIEVAL_SIZE):
+                chunk = queries[start:start + BATCH_RETRIEVAL_SIZE]
+                if start == 0:
+                    plans = first
+                else:
+                    plans = await retrieval_stage.run(lambda: rag_agent().prepare_batch(chunk))
+                tasks.extend(asyncio.create_task(answer(start + i, plan, gate)) for i, plan in enumerate(plans))
+                # Stream what is already finished while the next chunk is retrieved.
+                if batch.ordered:
+                    while tasks and tasks[0].done():
+                        yield json.dumps(tasks.pop(0).result()) + "\n"
+                else:
+                    for task in [t for t in tasks if t.done()]:
+                        tasks.remove(task)
+                        yield json.dumps(task.result()) + "\n"
+            for task in (tasks if batch.ordered else asyncio.as_completed(tasks)):
+                yield json.dumps(await task) + "\n"
+            yield json.dumps({"status": "done", "count": len(queries),
+                              "seconds": round(time.perf_counter() - started, 3)}) + "\n"
+        except Exception as e:
+            yield json.dumps({"status": "error", "message": str(e)}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+# ---------------- Stats ----------------
+@app.get("/stats")
+async def stats():
+    """
+    Embedding/answer cache hit/miss counters, micro-batch sizes, prompt tokens
+    saved by context packing, per-stage load, interaction log and session counters.
+    """
+    agent = rag.peek()
+    return JSONResponse({
+        "embedding_cache": cache_stats(),
+        "embedding_service": service_stats(),
+        "answer_cache": agent.answer_cache.stats() if agent and agent.answer_cache else None,
+        "context": agent.context_builder.stats() if agent else None,
+        "startup": rag.status(),
+        "stages": {s.name: s.stats() for s in (retrieval_stage, llm_stage, ingest_stage)},
+        "interaction_log": get_logger().stats(),
+        "sessions": sessions.stats(),
+    })
+
+# ---------------- Query (streaming) ----------------
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/query-stream")
+async def query_rag_stream(query: str = Form(...), strip_think: bool = Form(True),
+                           session_id: Optional[str] = Form(None)):
+    """
+    Query the RAG agent and stream the answer as Server-Sent Events:
+    one `sources` event with the retrieved chunks, then `token` events
+    as the LLM generates, then `done` (or `error`). `session_id` works as
+    in /query.
+    """
+    started = time.perf_counter()
+    stack = AsyncExitStack()
+    try:
+        memory = await get_session(session_id)
+        use_cache = memory is None or not memory.buffer
+        plan = await retrieval_stage.run(lambda: rag_agent().prepare(query, use_cache))
+        if plan["cached_answer"] is None:
+            # Reserve the LLM slot before responding so overload is still a 503.
+            await stack.enter_async_context(llm_stage.slot())
+    except Overloaded as e:
+        await stack.aclose()
+        return overloaded_response(e)
+    except Exception as e:
+        await stack.aclose()
+        return JSONResponse({"status": "error", "message": str(e)})
+
+    async def events():
+        async with stack:
+            yield sse_event("sources", [
+                {"source": h["source"], "score": h.get("score"), "text": h.get("text")} for h in plan["hits"]
+            ])
+            try:
+                if plan["cached_answer"] is not None:
+                    yield sse_event("token", plan["cached_answer"])
+                    yield sse_event("done", {"cached": True})
+                    if memory is not None:
+                        record_turn(memory, query, plan, plan["cached_answer"])
+                    log_interaction("PUBLIC_RAG", query, plan["cached_answer"], endpoint="/query-stream",
+                                    cached=True, session_id=session_id, latency_ms=elapsed_ms(started))
+                    return
+                tokens = []
+                async for token in astream_local_llm(plan["prompt"], memory, strip_think=strip_think):
+                    tokens.append(token)
+                    yield sse_event("token", token)
+                record_turn(memory, query, plan, "".join(tokens))
+                log_interaction("PUBLIC_RAG", query, "".join(tokens), endpoint="/query-stream", cached=False,
+                                session_id=session_id, latency_ms=elapsed_ms(started))
+                yield sse_event("done", {"context": plan["context"]})
+            except Exception as e:
+                yield sse_event("error", str(e))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 
 
@@ -1,6 +1,7 @@
 #streamlit_app.py
 import streamlit as st
 import requests
+import json
 
 API_URL = "http://127.0.0.1:8000"  # FastAPI backend URL
 
@@ -30,17 +31,48 @@ if uploaded_file:
     st.success(resp.json().get("message"))
 
 # ---------------- Query ----------------
+def stream_answer(query: str):
+    """
+    Call the SSE endpoint and yield (event, data) pairs as they arrive.
+    """
+    with requests.post(f"{API_URL}/query-stream", data={"query": query}, stream=True) as resp:
+        if resp.headers.get("content-type", "").startswith("application/json"):
+            yield "error", resp.json().get("message")
+            return
+        event = None
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                yield event, json.loads(line[len("data: "):])
+
+
 st.header("Query RAG Agent")
 with st.form("query_form"):
     user_query = st.text_input("Ask a question:")
+    stream = st.checkbox("Stream answer", value=True)
     submitted_query = st.form_submit_button("Get Answer")
     if submitted_query:
         if user_query.strip():
-            resp = requests.post(f"{API_URL}/query", data={"query": user_query})
-            data = resp.json()
-            if data.get("status") == "success":
-                st.markdown(f"**Answer:** {data.get('answer')}")
+            if stream:
+                sources_box = st.empty()
+                answer_box = st.empty()
+                answer = ""
+                for event, data in stream_answer(user_query):
+                    if event == "sources":
+                        names = sorted({d["source"] for d in data})
+                        sources_box.caption("Sources: " + ", ".join(names) if names else "No sources found.")
+                    elif event == "token":
+                        answer += data
+                        answer_box.markdown(f"**Answer:** {answer}")
+                    elif event == "error":
+                        st.error(data)
             else:
-                st.error(data.get("message"))
+                resp = requests.post(f"{API_URL}/query", data={"query": user_query})
+                data = resp.json()
+                if data.get("status") == "success":
+                    st.markdown(f"**Answer:** {data.get('answer')}")
+                else:
+                    st.error(data.get("message"))
         else:
             st.warning("Please type a query.")
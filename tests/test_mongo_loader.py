@@ -0,0 +1,187 @@
+# tests/test_mongo_loader.py
+"""
+agents/db/load_pdfs.py and agents/db/vector_sync.py against a mongomock_motor
+collection. To run against a local mongod instead, set MONGO_TEST_URI
+(e.g. mongodb://localhost:27017); a throwaway database is used and dropped.
+
+    pip install mongomock-motor pytest
+    python -m pytest tests/test_mongo_loader.py
+"""
+import asyncio
+import os
+import sys
+import uuid
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+fitz = pytest.importorskip("fitz")
+
+from agents.db.load_pdfs import EMBED_DTYPES, decode_embeddings, encode_embedding, load_pdfs, prune  # noqa: E402
+from agents.db.vector_sync import MongoVectorSync  # noqa: E402
+from benchmarks.fakes import FakeEmbedder  # noqa: E402
+from utils.vector_store import VectorStore  # noqa: E402
+
+SENTENCES = [
+    "The library opens at nine and closes at five.",
+    "CSE 101 meets in room 204 on Mondays.",
+    "Tuition for the spring term is due in March.",
+    "Scholarship applications open in May.",
+    "The registrar office handles transcript requests.",
+    "Exam schedules are posted two weeks before finals.",
+]
+
+
+def write_pdf(path, sentences):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(50, 50, 550, 800), " ".join(sentences))
+    doc.save(str(path))
+    doc.close()
+
+
+@pytest.fixture
+def run():
+    # One loop per test: a motor client stays bound to the loop it first ran on.
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture
+def collection(run):
+    uri = os.getenv("MONGO_TEST_URI")
+    if uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        client = AsyncIOMotorClient(uri)
+        db = client[f"test_{uuid.uuid4().hex[:8]}"]
+        yield db.chunks
+        run(client.drop_database(db.name))
+        return
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    yield mongomock_motor.AsyncMongoMockClient()["test"]["chunks"]
+
+
+@pytest.fixture
+def model():
+    fake = FakeEmbedder(dim=32)
+    fake.max_seq_length = 16  # a few chunks per PDF
+    return fake
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    folder = tmp_path / "pdfs"
+    folder.mkdir()
+    write_pdf(folder / "a.pdf", SENTENCES[:3])
+    write_pdf(folder / "b.pdf", SENTENCES[3:])
+    return folder
+
+
+def make_sync(tmp_path, collection):
+    store = VectorStore(str(tmp_path / "index.faiss"), str(tmp_path / "meta.pkl"))
+    return MongoVectorSync(collection, store, state_path=str(tmp_path / "sync.json"), lag=0.0)
+
+
+# ---------- Embedding encoding ----------
+@pytest.mark.parametrize("dtype", EMBED_DTYPES)
+def test_embedding_round_trip(dtype):
+    vectors = np.random.default_rng(0).standard_normal((3, 32)).astype(np.float32)
+    docs = [{"embedding": encode_embedding(v, dtype), "dtype": dtype, "dim": 32} for v in vectors]
+    assert all(len(d["embedding"]) == 32 * np.dtype(dtype).itemsize for d in docs)
+    decoded = decode_embeddings(docs)
+    assert decoded.dtype == np.float32
+    tolerance = 1e-3 if dtype == "float16" else 0
+    np.testing.assert_allclose(decoded, vectors, rtol=tolerance, atol=tolerance)
+
+
+def test_unknown_dtype_rejected():
+    with pytest.raises(ValueError):
+        encode_embedding(np.zeros(4), "int8")
+
+
+# ---------- Loader ----------
+def test_unchanged_files_are_skipped(run, pdfs, collection, model):
+    first = run(load_pdfs(str(pdfs), collection=collection, model=model))
+    assert first["files"] == 2 and first["chunks"] > 2
+    count = run(collection.count_documents({}))
+    assert count == first["chunks"]
+
+    encodes = model.calls
+    second = run(load_pdfs(str(pdfs), collection=collection, model=model))
+    assert second == {"files": 0, "unchanged": 2, "failed": 0, "chunks": 0}
+    assert model.calls == encodes
+    assert run(collection.count_documents({})) == count
+
+
+def test_new_version_is_published_and_old_retired(run, pdfs, collection, model):
+    run(load_pdfs(str(pdfs), collection=collection, model=model))
+    old_sha = run(collection.find_one({"source": "a.pdf"}))["sha256"]
+
+    write_pdf(pdfs / "a.pdf", SENTENCES[:2] + ["Parking permits are sold at the front desk."])
+    totals = run(load_pdfs(str(pdfs), collection=collection, model=model))
+    assert totals["files"] == 1 and totals["unchanged"] == 1
+
+    live = run(collection.find({"source": "a.pdf", "live": True}).to_list(None))
+    assert live and {d["sha256"] for d in live} != {old_sha}
+    assert len({d["sha256"] for d in live}) == 1
+    retired = run(collection.count_documents({"source": "a.pdf", "sha256": old_sha, "live": False}))
+    assert retired > 0
+    assert run(prune(collection, older_than=0)) == retired
+
+
+# ---------- Sync ----------
+def test_incremental_sync_uses_watermark(run, tmp_path, pdfs, collection, model):
+    run(load_pdfs(str(pdfs), collection=collection, model=model))
+    syncer = make_sync(tmp_path, collection)
+
+    stats = run(syncer.sync())
+    assert stats["sources"] == 2
+    assert set(syncer.store.sources()) == {"a.pdf", "b.pdf"}
+    watermark = stats["watermark"]
+    assert watermark > 0
+
+    # Nothing changed: nothing is read past the watermark.
+    stats = run(syncer.sync())
+    assert stats["sources"] == 0 and stats["unchanged"] == 0
+
+    write_pdf(pdfs / "b.pdf", SENTENCES[3:5] + ["Lab hours are extended during finals."])
+    run(load_pdfs(str(pdfs), collection=collection, model=model))
+    b_ids = set(syncer.store.ids_for_source("b.pdf"))
+    a_ids = syncer.store.ids_for_source("a.pdf")
+
+    stats = run(syncer.sync())
+    assert stats["sources"] == 1 and stats["watermark"] > watermark
+    assert syncer.store.ids_for_source("a.pdf") == a_ids
+    texts = " ".join(syncer.store.get_texts(syncer.store.ids_for_source("b.pdf")))
+    assert "Lab hours" in texts and "Exam schedules" not in texts
+    # Chunks the new version still contains keep their ids.
+    assert b_ids & set(syncer.store.ids_for_source("b.pdf"))
+
+    # Chunks that moved are stored with the new version's offsets.
+    write_pdf(pdfs / "b.pdf", ["Office hours move online."] + SENTENCES[3:5] + ["Lab hours are extended during finals."])
+    run(load_pdfs(str(pdfs), collection=collection, model=model))
+    stats = run(syncer.sync())
+    docs = run(collection.find({"source": "b.pdf", "live": True}).to_list(None))
+    rows = syncer.store.get_metadata(syncer.store.ids_for_source("b.pdf"))
+    assert {(r["text"], r["start"], r["end"]) for r in rows} == {(d["text"], d["start"], d["end"]) for d in docs}
+
+    # The state survives a restart.
+    again = make_sync(tmp_path, collection)
+    assert again.state.watermark == stats["watermark"]
+    assert again.state.sources == syncer.state.sources
+
+
+def test_rebuild_removes_sources_that_are_gone(run, tmp_path, pdfs, collection, model):
+    run(load_pdfs(str(pdfs), collection=collection, model=model))
+    syncer = make_sync(tmp_path, collection)
+    run(syncer.sync())
+
+    run(collection.delete_many({"source": "a.pdf"}))
+    stats = run(syncer.rebuild())
+    assert stats["removed"] > 0
+    assert set(syncer.store.sources()) == {"b.pdf"}
+    assert set(syncer.state.sources) == {"b.pdf"}
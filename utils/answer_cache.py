@@ -0,0 +1,138 @@
+# utils/answer_cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+import faiss
+import numpy as np
+
+# Bucket for entries that were answered without any retrieved chunk.
+_NO_SOURCE = "\0none"
+
+
+class SemanticAnswerCache:
+    """
+    Cache of past (query, retrieved chunk ids, answer) entries looked up by
+    query embedding similarity.
+
+    - A hit needs cosine similarity >= `threshold` with a stored query.
+    - Entries expire after `ttl` seconds; beyond `max_entries` the least
+      recently used entry is evicted.
+    - `invalidate_sources` drops every entry built from a source whose content
+      changed (VectorStore calls it on add/delete). Entries answered without
+      context are dropped on any change, since new content may now match.
+    - An answer is generated after retrieval, so a change can land in
+      between: take `version()` before retrieving and pass it to `insert`,
+      which then refuses answers built from sources changed since.
+    """
+
+    def __init__(self, threshold: float = 0.92, ttl: float = 3600.0, max_entries: int = 2000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.index = None
+        self.entries: "OrderedDict[int, dict]" = OrderedDict()
+        self.by_source: Dict[str, Set[int]] = {}
+        self.changed_at: Dict[str, int] = {}  # source -> version of its last change
+        self._version = 0  # bumped by every invalidate_sources call
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, query_vec: np.ndarray) -> Optional[dict]:
+        """Return the cached entry for a normalized (1, d) query vector, or None."""
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                self.misses += 1
+                return None
+            D, I = self.index.search(np.ascontiguousarray(query_vec, dtype=np.float32), 1)
+            score, entry_id = float(D[0][0]), int(I[0][0])
+            entry = self.entries.get(entry_id)
+            if entry is not None and time.time() - entry["created"] > self.ttl:
+                self._remove(entry_id)
+                entry = None
+            if entry is None or score < self.threshold:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(entry_id)
+            self.hits += 1
+            return entry
+
+    def version(self) -> int:
+        """Current content version; take it before retrieving the context for an answer."""
+        with self._lock:
+            return self._version
+
+    def insert(
+        self, query: str, query_vec: np.ndarray, chunk_ids: List[int], sources: List[str], answer: str,
+        version: int = None,
+    ):
+        """Store an answer; with `version`, skip it if any of its sources changed since."""
+        with self._lock:
+            if version is not None and self._changed_since(sources, version):
+                return
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(query_vec.shape[1]))
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(
+                np.ascontiguousarray(query_vec, dtype=np.float32), np.array([entry_id], dtype=np.int64)
+            )
+            self.entries[entry_id] = {
+                "query": query,
+                "chunk_ids": list(chunk_ids),
+                "sources": list(sources),
+                "answer": answer,
+                "created": time.time(),
+            }
+            for source in set(sources) or {_NO_SOURCE}:
+                self.by_source.setdefault(source, set()).add(entry_id)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate_sources(self, sources):
+        """Drop entries that used any of `sources` (and entries that had no context)."""
+        with self._lock:
+            self._version += 1
+            for source in sources:
+                self.changed_at[source] = self._version
+            stale = set()
+            for source in set(sources) | {_NO_SOURCE}:
+                stale |= self.by_source.get(source, set())
+            for entry_id in stale:
+                self._remove(entry_id)
+
+    def clear(self):
+        with self._lock:
+            self.index = None
+            self.entries.clear()
+            self.by_source.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+        }
+
+    def _changed_since(self, sources: List[str], version: int) -> bool:
+        if not sources:
+            # Answered without context: any new content may now match.
+            return self._version > version
+        return any(self.changed_at.get(source, 0) > version for source in sources)
+
+    def _remove(self, entry_id: int):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self.index.remove_ids(np.array([entry_id], dtype=np.int64))
+        for source in set(entry["sources"]) or {_NO_SOURCE}:
+            ids = self.by_source.get(source)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self.by_source[source]
@@ -0,0 +1,242 @@
+# utils/concurrency.py
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager
+
+from utils.metrics import span
+
+
+class Overloaded(Exception):
+    """Raised when a stage's wait queue is full; the API maps it to HTTP 503."""
+
+
+class RWLock:
+    """
+    Readers-writer lock with writer preference.
+
+    Any number of readers may hold the lock together; a writer waits for
+    active readers to drain and blocks new readers while it waits.
+    The writing thread may re-enter (as reader or writer).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writers_waiting = 0
+        self._writer = None
+        self._write_depth = 0
+
+    @contextmanager
+    def read_locked(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            yield
+            return
+        with self._cond:
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write_locked(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+            else:
+                self._writers_waiting += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._writers_waiting -= 1
+                self._writer = me
+                self._write_depth = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+class Stage:
+    """
+    A bounded pipeline stage for the async API.
+
+    At most `max_concurrency` calls run at once and at most `max_queue` more
+    may wait; beyond that `Overloaded` is raised immediately (backpressure).
+    Blocking callables run on the stage's thread pool so the event loop stays free.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, threads: int = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=name) if threads else None
+        self.in_flight = 0
+        self.waiting = 0
+        self._sem = None
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking callable on the stage's executor."""
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            # Carry the request's context (e.g. its metrics trace) into the worker thread.
+            ctx = contextvars.copy_context()
+            return await loop.run_in_executor(self.executor, lambda: ctx.run(fn, *args, **kwargs))
+
+    async def run_async(self, coro_fn, *args, **kwargs):
+        """Run a coroutine function under the stage's concurrency limit."""
+        async with self.slot():
+            return await coro_fn(*args, **kwargs)
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "waiting": self.waiting,
+                "max_concurrency": self.max_concurrency, "max_queue": self.max_queue}
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the stage's concurrency slots (raises Overloaded if the queue is full)."""
+        if self._sem is None:
+            # Created lazily so it binds to the running event loop.
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        if self._sem.locked() and self.waiting >= self.max_queue:
+            raise Overloaded(f"Stage '{self.name}' is overloaded, try again later.")
+        self.waiting += 1
+        try:
+            with span(f"{self.name}_queue"):
+                await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._sem.release()
+
+
+class LazyResource:
+    """
+    A heavy object (model, index, agent) built at most once, on first use
+    or by `start()` in the background, so the server can accept connections
+    before it is loaded. `warm_up` is called once after building.
+    """
+
+    def __init__(self, factory, warm_up=None, name: str = "resource"):
+        self.factory = factory
+        self.warm_up = warm_up
+        self.name = name
+        self.error = None
+        self.seconds = None
+        self._value = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The resource, building (and warming) it first if needed."""
+        if self._ready.is_set():
+            return self._value
+        with self._lock:
+            if not self._ready.is_set():
+                start = time.perf_counter()
+                try:
+                    value = self.factory()
+                    if self.warm_up is not None:
+                        self.warm_up(value)
+                except BaseException as e:
+                    self.error = e
+                    raise
+                self._value = value
+                self.error = None
+                self.seconds = time.perf_counter() - start
+                self._ready.set()
+                print(f"{self.name}: ready in {self.seconds:.2f}s.")
+        return self._value
+
+    def peek(self):
+        """The resource if it is already built, else None (never blocks)."""
+        return self._value if self._ready.is_set() else None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self):
+        """Build and warm up on a background thread."""
+        def run():
+            try:
+                self.get()
+            except BaseException as e:
+                print(f"{self.name}: warm-up failed: {e}")
+
+        threading.Thread(target=run, name=f"warmup-{self.name}", daemon=True).start()
+
+    def status(self) -> dict:
+        if self.ready:
+            state = "ready"
+        elif self.error is not None:
+            state = "failed"
+        elif self._lock.locked():
+            state = "loading"
+        else:
+            state = "cold"
+        return {"name": self.name, "state": state, "seconds": self.seconds,
+                "error": None if self.error is None else str(self.error)}
+
+
+def prefetch(iterable, max_items: int):
+    """
+    Run `iterable` on a background thread, buffering at most `max_items`
+    results, so a producer (e.g. PDF extraction) overlaps with the consumer.
+    """
+    buffer = queue.Queue(maxsize=max_items)
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                buffer.put(item)
+            buffer.put(done)
+        except BaseException as e:
+            buffer.put(e)
+        finally:
+            # A generator can only be closed by the thread running it; this
+            # releases what it holds (e.g. a process pool) when the consumer stops early.
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Unblock a producer waiting on a full buffer.
+        while not buffer.empty():
+            buffer.get_nowait()
@@ -0,0 +1,197 @@
+# utils/context_builder.py
+import re
+import threading
+from typing import Callable, Dict, List
+
+import numpy as np
+
+_SENTENCE_END = re.compile(r"[.!?](?=\s)|\n")
+
+
+def approx_tokens(text: str) -> int:
+    """Rough LLM token count (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+class ContextBuilder:
+    """
+    Packs retrieved chunks into a prompt context within a token budget.
+
+    Steps, in order:
+    1. Drop hits whose `similarity` (cosine to the query, falling back to
+       `score`) is below `min_score`.
+    2. Pick the rest by maximal marginal relevance: relevance is the hit's
+       retrieval score scaled to the best one, minus `1 - mmr_lambda` times its
+       highest similarity to an already picked chunk. A chunk whose similarity
+       to a picked one is at least `dedup_threshold` is dropped as a near-duplicate.
+    3. Merge picked chunks from the same document whose character ranges
+       overlap or touch (consecutive chunks share `chunk_overlap` tokens),
+       so the shared text is sent once.
+    4. Add pieces in that order until `token_budget`. The first piece that
+       does not fit is cut at a sentence end if at least `min_piece_tokens`
+       are left; everything after it is dropped.
+
+    `pack` returns the packed pieces and a report comparing the token count
+    against joining every hit verbatim.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 800,
+        min_score: float = 0.2,
+        mmr_lambda: float = 0.7,
+        dedup_threshold: float = 0.92,
+        merge_gap: int = 2,
+        min_piece_tokens: int = 48,
+        count_tokens: Callable[[str], int] = approx_tokens,
+        separator: str = "\n",
+    ):
+        self.token_budget = token_budget
+        self.min_score = min_score
+        self.mmr_lambda = mmr_lambda
+        self.dedup_threshold = dedup_threshold
+        self.merge_gap = merge_gap
+        self.min_piece_tokens = min_piece_tokens
+        self.count_tokens = count_tokens
+        self.separator = separator
+        self.requests = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self._lock = threading.Lock()
+
+    # ---------- Public API ----------
+    def pack(self, hits: List[Dict], vectors: np.ndarray = None):
+        """
+        `hits` are dicts with "text" and "score" (best first), optionally
+        "similarity", "id", "source" and "doc"/"start"/"end" character offsets;
+        `vectors` holds their normalized embeddings (enables step 2).
+        Returns (pieces, report); each piece is a hit dict with the packed
+        "text" and the "ids" of the chunks it covers.
+        """
+        sep = self.count_tokens(self.separator)
+        before = sum(self.count_tokens(h["text"]) + sep for h in hits)
+        report = {"hits": len(hits), "below_cutoff": 0, "duplicates": 0, "merged": 0, "trimmed": 0}
+
+        keep = [i for i, h in enumerate(hits) if h.get("similarity", h.get("score", 0.0)) >= self.min_score]
+        report["below_cutoff"] = len(hits) - len(keep)
+        if vectors is not None and len(keep) > 1:
+            picked = self._mmr([hits[i] for i in keep], np.asarray(vectors, dtype=np.float32)[keep])
+            report["duplicates"] = len(keep) - len(picked)
+            keep = [keep[i] for i in picked]
+
+        pieces = self._merge_adjacent([hits[i] for i in keep])
+        report["merged"] = len(keep) - len(pieces)
+        pieces, report["trimmed"] = self._fit(pieces)
+
+        after = sum(p["tokens"] + sep for p in pieces)
+        report.update({
+            "pieces": len(pieces),
+            "tokens_before": before,
+            "tokens_after": after,
+            "tokens_saved": before - after,
+        })
+        with self._lock:
+            self.requests += 1
+            self.tokens_in += before
+            self.tokens_out += after
+        return pieces, report
+
+    def join(self, pieces: List[Dict]) -> str:
+        return self.separator.join(p["text"] for p in pieces)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tokens_before": self.tokens_in,
+                "tokens_after": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "avg_saved": (self.tokens_in - self.tokens_out) / self.requests if self.requests else 0.0,
+            }
+
+    # ---------- Internal helpers ----------
+    def _mmr(self, hits: List[Dict], vectors: np.ndarray) -> List[int]:
+        scores = np.array([h.get("score", 0.0) for h in hits], dtype=np.float32)
+        relevance = scores / scores.max() if scores.max() > 0 else np.ones(len(hits), dtype=np.float32)
+        sims = vectors @ vectors.T
+        picked = [int(np.argmax(relevance))]
+        left = [i for i in range(len(hits)) if i != picked[0]]
+        while left:
+            redundancy = sims[np.ix_(left, picked)].max(axis=1)
+            left = [i for i, r in zip(left, redundancy) if r < self.dedup_threshold]
+            if not left:
+                break
+            redundancy = sims[np.ix_(left, picked)].max(axis=1)
+            mmr = self.mmr_lambda * relevance[left] - (1.0 - self.mmr_lambda) * redundancy
+            best = left[int(np.argmax(mmr))]
+            picked.append(best)
+            left.remove(best)
+        return picked
+
+    def _merge_adjacent(self, hits: List[Dict]) -> List[Dict]:
+        pieces: List[Dict] = []
+        by_doc: Dict[str, List[Dict]] = {}
+        for hit in hits:
+            piece = dict(hit, ids=[hit["id"]] if "id" in hit else [])
+            doc = hit.get("doc")
+            if doc is None or hit.get("start") is None or hit.get("end") is None:
+                pieces.append(piece)
+                continue
+            for other in by_doc.get(doc, []):
+                if self._try_merge(other, piece):
+                    break
+            else:
+                by_doc.setdefault(doc, []).append(piece)
+                pieces.append(piece)
+        return pieces
+
+    def _try_merge(self, a: Dict, b: Dict) -> bool:
+        """Fold `b` into `a` (kept at `a`'s rank) if their ranges overlap or touch."""
+        first, second = (a, b) if a["start"] <= b["start"] else (b, a)
+        gap = second["start"] - first["end"]
+        if gap > self.merge_gap:
+            return False
+        if second["end"] <= first["end"]:
+            text = first["text"]
+        elif gap > 0:
+            text = first["text"] + " " + second["text"]
+        else:
+            text = first["text"] + second["text"][first["end"] - second["start"]:]
+        a["text"], a["start"], a["end"] = text, first["start"], max(first["end"], second["end"])
+        a["ids"] = a["ids"] + b["ids"]
+        return True
+
+    def _fit(self, pieces: List[Dict]):
+        sep = self.count_tokens(self.separator)
+        used, out = 0, []
+        for n, piece in enumerate(pieces):
+            tokens = self.count_tokens(piece["text"])
+            if used + tokens + sep <= self.token_budget:
+                piece["tokens"] = tokens
+                out.append(piece)
+                used += tokens + sep
+                continue
+            room = self.token_budget - used - sep
+            if room >= self.min_piece_tokens:
+                text = self._truncate(piece["text"], room)
+                if text:
+                    out.append(dict(piece, text=text, tokens=self.count_tokens(text)))
+            return out, len(pieces) - n
+        return out, 0
+
+    def _truncate(self, text: str, tokens: int) -> str:
+        """Longest prefix within `tokens`, cut at a sentence end (else a word break)."""
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.count_tokens(text[:mid]) <= tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        prefix = text[:lo]
+        if lo == len(text):
+            return prefix
+        ends = [m.end() for m in _SENTENCE_END.finditer(prefix)]
+        if ends and ends[-1] >= len(prefix) // 2:
+            return prefix[:ends[-1]].rstrip()
+        return prefix.rsplit(None, 1)[0] if " " in prefix else prefix
@@ -1,21 +1,209 @@
 #utils/document_loader.py
 
+import multiprocessing
+import os
+import re
 import fitz  # PyMuPDF
-from typing import List
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Iterable, Iterator, List, NamedTuple, Union
 
-def pdf_to_text(pdf_path: str) -> str:
+# A PDF is either a file path or the raw bytes of an upload.
+PdfSource = Union[str, bytes, bytearray, memoryview]
+
+
+def open_pdf(pdf: PdfSource):
+    """Open a PDF from a path or from an in-memory buffer."""
+    if isinstance(pdf, str):
+        return fitz.open(pdf)
+    return fitz.open(stream=pdf, filetype="pdf")
+
+
+def iter_pdf_pages(pdf: PdfSource, start: int = 0, end: int = None) -> Iterator[str]:
+    """Lazily yield the text of pages [start, end)."""
+    doc = open_pdf(pdf)
+    try:
+        end = doc.page_count if end is None else min(end, doc.page_count)
+        for i in range(start, end):
+            yield doc[i].get_text()
+    finally:
+        doc.close()
+
+
+def pdf_to_text(pdf: PdfSource) -> str:
     """Extract full text from a PDF file."""
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
-
-def chunk_text(text: str, chunk_size: int = 300) -> List[str]:
-    """Split text into chunks of approximately `chunk_size` words."""
-    words = text.split()
+    return "".join(iter_pdf_pages(pdf))
+
+
+# ---------- Parallel extraction ----------
+_worker_doc = None
+
+# Workers are not forked from the caller: the pool is created from a
+# background thread of a server whose torch/tokenizer and embedding threads
+# may hold locks that a forked child would inherit in the locked state.
+# A forkserver (a clean single-threaded process with this module preloaded)
+# starts workers almost as fast as fork; spawn is the portable fallback.
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _MP_CONTEXT = multiprocessing.get_context("forkserver")
+    _MP_CONTEXT.set_forkserver_preload([__name__])
+else:
+    _MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def _init_worker(pdf: PdfSource):
+    # Each worker process opens the document once and serves many page ranges.
+    global _worker_doc
+    _worker_doc = open_pdf(pdf)
+
+
+def _extract_range(start: int, end: int) -> List[str]:
+    return [_worker_doc[i].get_text() for i in range(start, end)]
+
+
+def iter_pdf_pages_parallel(
+    pdf: PdfSource,
+    workers: int = None,
+    pages_per_task: int = 16,
+    parallel_min_pages: int = 64,
+) -> Iterator[str]:
+    """
+    Yield page texts in order, extracting page ranges on a process pool for
+    large documents. At most 2 * workers ranges are in flight, so memory
+    stays bounded regardless of document size.
+    """
+    with open_pdf(pdf) as doc:
+        page_count = doc.page_count
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or page_count < parallel_min_pages:
+        yield from iter_pdf_pages(pdf)
+        return
+
+    ranges = [(s, min(s + pages_per_task, page_count)) for s in range(0, page_count, pages_per_task)]
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=_MP_CONTEXT, initializer=_init_worker, initargs=(pdf,)
+    ) as pool:
+        pending = []
+        next_range = 0
+        try:
+            while next_range < len(ranges) or pending:
+                while next_range < len(ranges) and len(pending) < 2 * workers:
+                    pending.append(pool.submit(_extract_range, *ranges[next_range]))
+                    next_range += 1
+                yield from pending.pop(0).result()
+        finally:
+            # Closed early (consumer gone): don't extract ranges nobody will read.
+            for future in pending:
+                future.cancel()
+
+
+# ---------- Chunking ----------
+class Chunk(NamedTuple):
+    """A chunk as character offsets [start, end) into its document, plus its token count."""
+    start: int
+    end: int
+    tokens: int
+    text: str = None
+
+
+# Sentence ends and paragraph breaks; a boundary is the start of the next sentence.
+_BOUNDARY = re.compile(r"(?<=[.!?;:])[\"')\]]*\s+|\n\s*\n")
+_WORD = re.compile(r"\S+")
+
+
+@lru_cache(maxsize=4)
+def load_tokenizer(model_name: str):
+    """Fast HF tokenizer for `model_name` (for worker processes that have no model loaded)."""
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def token_spans(text: str, tokenizer=None) -> np.ndarray:
+    """
+    (n_tokens, 2) array of character offsets, from one tokenizer pass over
+    the whole text. Without a tokenizer, whitespace-separated words are used.
+    """
+    if tokenizer is None:
+        spans = [m.span() for m in _WORD.finditer(text)]
+    else:
+        enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        spans = enc["offset_mapping"]
+    return np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+
+
+def chunk_spans(text: str, chunk_size: int = 254, overlap: int = 0, tokenizer=None) -> List[Chunk]:
+    """
+    Split `text` into chunks of at most `chunk_size` tokens, returned as offsets.
+
+    Chunks end at sentence/paragraph boundaries where possible (a single
+    sentence longer than `chunk_size` is split at a token boundary), and each
+    chunk after the first starts at the earliest sentence boundary within
+    the last `overlap` tokens of its predecessor.
+    """
+    spans = token_spans(text, tokenizer)
+    n = len(spans)
+    if n == 0:
+        return []
+
+    # Token index at which each sentence starts (always includes 0).
+    bounds = np.fromiter((m.end() for m in _BOUNDARY.finditer(text)), dtype=np.int64)
+    sentence_starts = np.unique(np.concatenate(([0], np.searchsorted(spans[:, 0], bounds))))
+    sentence_starts = sentence_starts[sentence_starts < n]
+
     chunks = []
-    for i in range(0, len(words), chunk_size):
-        chunk = " ".join(words[i:i+chunk_size])
-        chunks.append(chunk)
+    i = 0
+    while i < n:
+        limit = i + chunk_size
+        if limit >= n:
+            end = n
+        else:
+            b = sentence_starts[np.searchsorted(sentence_starts, limit, side="right") - 1]
+            end = int(b) if b > i else limit
+        chunks.append(Chunk(int(spans[i, 0]), int(spans[end - 1, 1]), end - i))
+        if end >= n:
+            break
+
+        next_i = end
+        if overlap > 0:
+            target = max(end - overlap, i + 1)
+            k = np.searchsorted(sentence_starts, target, side="left")
+            if k < len(sentence_starts) and sentence_starts[k] < end:
+                next_i = int(sentence_starts[k])
+            else:
+                next_i = target
+        i = next_i
     return chunks
+
+
+def iter_chunks(pages: Iterable[str], chunk_size: int = 254, overlap: int = 0, tokenizer=None) -> Iterator[Chunk]:
+    """
+    Chunk a stream of page texts without holding the whole document.
+
+    Pages are appended to a rolling buffer; every chunk except the last
+    (possibly incomplete) one is emitted, and the buffer is trimmed to where
+    that last chunk starts. Offsets are relative to the concatenated pages.
+    """
+    buffer = ""
+    base = 0
+    for page in pages:
+        buffer += page
+        chunks = chunk_spans(buffer, chunk_size, overlap, tokenizer)
+        if len(chunks) < 2:
+            continue
+        for c in chunks[:-1]:
+            yield Chunk(base + c.start, base + c.end, c.tokens, buffer[c.start:c.end])
+        cut = chunks[-1].start
+        buffer = buffer[cut:]
+        base += cut
+    for c in chunk_spans(buffer, chunk_size, overlap, tokenizer):
+        yield Chunk(base + c.start, base + c.end, c.tokens, buffer[c.start:c.end])
+
+
+def chunk_text(text: str, chunk_size: int = 300, overlap: int = 0, tokenizer=None) -> List[str]:
+    """
+    Split text into chunks of at most `chunk_size` tokens (words when no
+    tokenizer is given), preferring sentence boundaries.
+    """
+    return [text[c.start:c.end] for c in chunk_spans(text, chunk_size, overlap, tokenizer)]
@@ -0,0 +1,275 @@
+# utils/embedding_cache.py
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = "data/embedding_cache"
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize and collapse whitespace; the tokenizer ignores both."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_key(model_name: str, text: str, options: str = "") -> bytes:
+    """Content address of `text` under `model_name` and encode `options` (16-byte blake2b digest)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    if options:
+        h.update(options.encode("utf-8"))
+        h.update(b"\0")
+    h.update(normalize_text(text).encode("utf-8"))
+    return h.digest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (model name, normalized text hash).
+
+    - Memory tier: LRU of the most recently used vectors.
+    - Disk tier: a fixed-capacity memory-mapped float32 matrix plus a key
+      array, evicted with the CLOCK algorithm (an LRU approximation that
+      needs one reference bit per slot). A crc32 per slot guards against
+      torn writes. One writer process per cache directory is assumed.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        dim: int,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        memory_items: int = 10_000,
+        disk_items: int = 100_000,
+    ):
+        self.model_name = model_name
+        self.dim = dim
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+
+        self.path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        self._slots: Dict[bytes, int] = {}
+        self._hand = 0
+        if disk_items > 0:
+            self._open_disk()
+
+    # ---------- Public API ----------
+    def get_many(self, keys: List[bytes]) -> List[np.ndarray]:
+        """Return the cached vector for each key, or None on a miss."""
+        out = []
+        with self._lock:
+            for key in keys:
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                else:
+                    vec = self._read_disk(key)
+                    if vec is not None:
+                        self.hits_disk += 1
+                        self._remember(key, vec)
+                    else:
+                        self.misses += 1
+                out.append(vec)
+        return out
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            for key, vec in zip(keys, vectors):
+                self._remember(key, vec)
+                if self.disk_items > 0 and key not in self._slots:
+                    self._write_disk(key, vec)
+
+    def stats(self) -> dict:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "model": self.model_name,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "disk_items": len(self._slots),
+        }
+
+    def flush(self):
+        """Push dirty memory-mapped pages and the CLOCK hand to disk."""
+        if self.disk_items <= 0:
+            return
+        with self._lock:
+            self._vectors.flush()
+            self._keys.flush()
+            self._crc.flush()
+            self._ref.flush()
+            tmp = os.path.join(self.path, "state.json.tmp")
+            with open(tmp, "w") as f:
+                json.dump({"dim": self.dim, "capacity": self.disk_items, "hand": self._hand}, f)
+            os.replace(tmp, os.path.join(self.path, "state.json"))
+
+    # ---------- Internal helpers ----------
+    def _remember(self, key: bytes, vec: np.ndarray):
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _open_disk(self):
+        os.makedirs(self.path, exist_ok=True)
+        state_path = os.path.join(self.path, "state.json")
+        state = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+        if state.get("dim") != self.dim or state.get("capacity") != self.disk_items:
+            # Layout changed (or fresh cache): start over.
+            for name in ("vectors.f32", "keys.bin", "crc.bin", "ref.bin"):
+                p = os.path.join(self.path, name)
+                if os.path.exists(p):
+                    os.remove(p)
+            state = {"dim": self.dim, "capacity": self.disk_items, "hand": 0}
+
+        n = self.disk_items
+        self._vectors = self._memmap("vectors.f32", np.float32, (n, self.dim))
+        self._keys = self._memmap("keys.bin", np.uint8, (n, 16))
+        self._crc = self._memmap("crc.bin", np.uint32, (n,))
+        self._ref = self._memmap("ref.bin", np.uint8, (n,))
+        self._hand = int(state.get("hand", 0)) % n
+
+        used = np.flatnonzero(self._keys.any(axis=1))
+        self._slots = {self._keys[i].tobytes(): int(i) for i in used}
+
+    def _memmap(self, name: str, dtype, shape):
+        path = os.path.join(self.path, name)
+        mode = "r+" if os.path.exists(path) else "w+"
+        return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+    def _read_disk(self, key: bytes):
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        vec = np.array(self._vectors[slot])
+        if zlib.crc32(vec.tobytes()) != int(self._crc[slot]):
+            del self._slots[key]
+            self._keys[slot] = 0
+            return None
+        self._ref[slot] = 1
+        return vec
+
+    def _write_disk(self, key: bytes, vec: np.ndarray):
+        slot = self._next_victim()
+        old = self._keys[slot].tobytes()
+        if old in self._slots:
+            del self._slots[old]
+        self._vectors[slot] = vec
+        self._crc[slot] = zlib.crc32(np.ascontiguousarray(vec, dtype=np.float32).tobytes())
+        self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+        self._ref[slot] = 1
+        self._slots[key] = slot
+
+    def _next_victim(self) -> int:
+        # CLOCK: skip (and clear) recently referenced slots.
+        n = self.disk_items
+        while True:
+            slot = self._hand
+            self._hand = (self._hand + 1) % n
+            if self._ref[slot] == 0:
+                return slot
+            self._ref[slot] = 0
+
+
+# Encode options that don't change the vectors.
+_NEUTRAL_OPTIONS = {"batch_size", "device"}
+# Encode options whose output is not a float32 sentence vector; these bypass the cache.
+_UNCACHEABLE_OPTIONS = {"precision", "output_value", "convert_to_tensor"}
+
+
+class CachedEncoder:
+    """
+    Drop-in wrapper around a SentenceTransformer-like model: `encode` serves
+    cached vectors and only runs the model on the texts it has not seen.
+    Other attributes (tokenizer, get_sentence_embedding_dimension, ...) pass through.
+    """
+
+    def __init__(self, model, model_name: str, cache: EmbeddingCache):
+        self.model = model
+        self.model_name = model_name
+        self.cache = cache
+
+    def encode(self, texts, convert_to_numpy: bool = True, show_progress_bar: bool = False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if not texts:
+            return np.zeros((0, self.cache.dim), dtype=np.float32)
+        if _UNCACHEABLE_OPTIONS.intersection(kwargs):
+            # The cache only holds one float32 sentence vector per text.
+            out = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=show_progress_bar, **kwargs)
+            return out[0] if single else out
+
+        # Options that change the vectors (normalize_embeddings, prompt, ...) are part of the key.
+        options = json.dumps(
+            {k: v for k, v in kwargs.items() if k not in _NEUTRAL_OPTIONS}, sort_keys=True, default=repr
+        )
+        options = "" if options == "{}" else options
+        keys = [text_key(self.model_name, t, options) for t in texts]
+        cached = self.cache.get_many(keys)
+        missing = [i for i, v in enumerate(cached) if v is None]
+
+        if missing:
+            # Encode each distinct missing text once.
+            first = {}
+            for i in missing:
+                first.setdefault(keys[i], i)
+            order = list(first.values())
+            fresh = self.model.encode(
+                [texts[i] for i in order], convert_to_numpy=True, show_progress_bar=show_progress_bar, **kwargs
+            )
+            fresh = np.asarray(fresh, dtype=np.float32).reshape(len(order), -1)
+            self.cache.put_many([keys[i] for i in order], fresh)
+            by_key = {keys[i]: vec for i, vec in zip(order, fresh)}
+            for i in missing:
+                cached[i] = by_key[keys[i]]
+
+        out = np.stack(cached).astype(np.float32, copy=False)
+        return out[0] if single else out
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+_caches: Dict[tuple, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str, dim: int, cache_dir: str = DEFAULT_CACHE_DIR, **kwargs) -> EmbeddingCache:
+    """Process-wide cache per (model, directory), shared by every agent."""
+    key = (model_name, os.path.abspath(cache_dir))
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = EmbeddingCache(model_name, dim, cache_dir=cache_dir, **kwargs)
+            atexit.register(_caches[key].flush)
+        return _caches[key]
+
+
+def cached_encoder(model, model_name: str, cache_dir: str = DEFAULT_CACHE_DIR) -> CachedEncoder:
+    """Wrap `model` with the shared embedding cache for `model_name`."""
+    cache = get_embedding_cache(model_name, model.get_sentence_embedding_dimension(), cache_dir=cache_dir)
+    return CachedEncoder(model, model_name, cache)
+
+
+def cache_stats() -> List[dict]:
+    return [cache.stats() for cache in _caches.values()]
@@ -0,0 +1,131 @@
+# utils/embedding_service.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict
+
+import numpy as np
+
+from utils.embedding_cache import cached_encoder
+
+
+class EmbeddingService:
+    """
+    One shared SentenceTransformer per model, with dynamic micro-batching.
+
+    Small encode calls from concurrent threads are queued; a worker thread
+    collects them until `max_batch_size` texts are waiting or `max_wait_ms`
+    has passed since the first one, runs a single model.encode and hands
+    each caller its slice. Calls that already fill a batch skip the queue.
+
+    `model` replaces the SentenceTransformer with any object that has the
+    same `encode` (e.g. the fake embedder in benchmarks/fakes.py).
+    """
+
+    def __init__(self, model_name: str, max_batch_size: int = 64, max_wait_ms: float = 5.0, model=None):
+        self.model_name = model_name
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+
+            model = SentenceTransformer(model_name)
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.batched_texts = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name=f"embed-{model_name}", daemon=True)
+        self._worker.start()
+
+    def encode(self, texts, convert_to_numpy: bool = True, show_progress_bar: bool = False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+
+        if kwargs or len(texts) >= self.max_batch_size:
+            # Custom encode options can't share a batch; big requests are a batch already.
+            out = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=show_progress_bar, **kwargs)
+        else:
+            future = Future()
+            self._queue.put((texts, future))
+            out = future.result()
+        return out[0] if single else out
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "batches": self.batches,
+            "avg_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    def __getattr__(self, name):
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    # ---------- Worker ----------
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        texts = [t for item_texts, _ in batch for t in item_texts]
+        try:
+            vectors = np.asarray(
+                self.model.encode(texts, convert_to_numpy=True, show_progress_bar=False), dtype=np.float32
+            )
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.batched_texts += len(texts)
+        start = 0
+        for item_texts, future in batch:
+            future.set_result(vectors[start:start + len(item_texts)])
+            start += len(item_texts)
+
+
+_services: Dict[str, EmbeddingService] = {}
+_encoders: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def get_embedding_service(model_name: str, **kwargs) -> EmbeddingService:
+    """
+    Process-wide EmbeddingService for `model_name`; the model is loaded once.
+    `kwargs` only apply to the first call (pass `model=` before any agent
+    is built to swap the model out).
+    """
+    with _lock:
+        if model_name not in _services:
+            _services[model_name] = EmbeddingService(model_name, **kwargs)
+        return _services[model_name]
+
+
+def get_encoder(model_name: str):
+    """Shared, cached, micro-batched encoder for `model_name`, used by every agent."""
+    service = get_embedding_service(model_name)
+    with _lock:
+        if model_name not in _encoders:
+            _encoders[model_name] = cached_encoder(service, model_name)
+        return _encoders[model_name]
+
+
+def service_stats():
+    return [service.stats() for service in _services.values()]
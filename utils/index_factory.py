@@ -0,0 +1,119 @@
+# utils/index_factory.py
+import math
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+
+def build_index(index_type: str, dim: int, n_vectors: int = 0, **options):
+    """
+    Create an (untrained) inner-product FAISS index.
+
+    :param index_type: One of "flat", "hnsw", "ivf", "ivfpq"
+    :param dim: Vector dimension
+    :param n_vectors: Expected corpus size, used to pick a default nlist
+    :param options: hnsw_m, ef_construction, ef_search, nlist, nprobe, pq_m, pq_bits
+    """
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, options.get("hnsw_m", 32), metric)
+        index.hnsw.efConstruction = options.get("ef_construction", 80)
+        index.hnsw.efSearch = options.get("ef_search", 64)
+        return index
+
+    if index_type in ("ivf", "ivfpq"):
+        nlist = options.get("nlist") or default_nlist(n_vectors)
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            pq_m = options.get("pq_m") or _default_pq_m(dim)
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, options.get("pq_bits", 8), metric)
+        index.nprobe = options.get("nprobe", max(1, nlist // 16))
+        # Direct map so stored vectors can be reconstructed when the index is rebuilt.
+        index.make_direct_map()
+        return index
+
+    raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+
+
+def train_index(index, vectors: np.ndarray, sample_size: int = 100_000, seed: int = 0):
+    """Train the index on a random sample of `vectors` if it needs training."""
+    if index.is_trained:
+        return
+    if len(vectors) > sample_size:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+
+
+def base_index(index):
+    """The index wrapped by an IndexIDMap/IndexIDMap2 (or `index` itself)."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def search_params(index, nprobe: int = None, ef_search: int = None, selector=None):
+    """
+    Per-query search parameters for `index`, or None to use its defaults.
+    `selector` (a faiss.IDSelector) restricts the search to the ids it accepts.
+    """
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF) and (nprobe is not None or selector is not None):
+        params = faiss.SearchParametersIVF(nprobe=int(nprobe if nprobe is not None else base.nprobe))
+    elif isinstance(base, faiss.IndexHNSW) and (ef_search is not None or selector is not None):
+        params = faiss.SearchParametersHNSW(efSearch=int(ef_search if ef_search is not None else base.hnsw.efSearch))
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def index_kind(index) -> str:
+    """Name of the index family, matching INDEX_TYPES."""
+    index = base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def recall_at_k(index, vectors: np.ndarray, queries: np.ndarray, k: int = 10, **knobs) -> float:
+    """
+    Fraction of the exact (flat) top-k neighbours that `index` also returns.
+
+    `vectors` must be the same rows, in the same order, that were added to `index`.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(vectors))
+    _, truth = faiss.knn(queries, np.ascontiguousarray(vectors, dtype=np.float32), k, faiss.METRIC_INNER_PRODUCT)
+    params = search_params(index, **knobs)
+    _, found = index.search(queries, k, params=params)
+
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / float(truth.size)
+
+
+def default_nlist(n_vectors: int) -> int:
+    # ~4*sqrt(N) lists, keeping at least ~39 training points per centroid.
+    nlist = int(4 * math.sqrt(max(n_vectors, 1)))
+    return max(1, min(nlist, n_vectors // 39 or 1))
+
+
+def _default_pq_m(dim: int) -> int:
+    for m in (48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dim % m == 0 and m <= dim:
+            return m
+    return 1
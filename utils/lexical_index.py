@@ -0,0 +1,305 @@
+# utils/lexical_index.py
+import json
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+_WORD = re.compile(r"[^\W_]+(?:[-_./:][^\W_]+)*")
+_SEPARATOR = re.compile(r"[-_./:]")
+_ALPHA_DIGIT = re.compile(r"\d+|[^\W\d_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word tokens. Codes are indexed whole and in parts, so
+    "CSE-101", "cse101" and "CSE 101" all share the terms "cse" and "101"
+    and the first two also match on "cse101".
+    """
+    tokens = []
+    for match in _WORD.finditer(text.lower()):
+        word = match.group(0)
+        if word.isalpha() or word.isdigit():
+            tokens.append(word)
+            continue
+        parts = _SEPARATOR.split(word)
+        for part in parts:
+            pieces = _ALPHA_DIGIT.findall(part)
+            tokens.extend(pieces)
+            if len(pieces) > 1:
+                tokens.append(part)
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    In-process BM25 inverted index keyed by the same chunk ids as VectorStore.
+
+    Saved postings are CSR arrays (term offsets, int32 chunk ids, uint16 term
+    frequencies) memory-mapped from disk. Chunks added since the last save go
+    to small per-term tail arrays and are merged in by `save`; removed chunks
+    are masked out at once and dropped from the postings at the next save.
+
+    Query terms found in more than `max_df_ratio` of the chunks (and in at
+    least `min_skip_df` chunks) are skipped: their BM25 weight is small and
+    their postings are the long ones. If every query term is that common,
+    only the rarest is scored.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_df_ratio: float = 0.1, min_skip_df: int = 10_000):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.min_skip_df = min_skip_df
+        self.terms: List[str] = []
+        self.vocab: Dict[str, int] = {}
+        self.doc_len = np.full(0, -1, dtype=np.int32)  # by chunk id; -1 = absent or removed
+        self.n_docs = 0
+        self.total_len = 0
+        self.max_id = -1
+        self._path = None
+        self._generation = 0
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._docs = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.uint16)
+        self._tail: Dict[int, Tuple[array, array]] = {}
+
+    # ---------- Writes ----------
+    def add(self, ids: Iterable[int], texts: Iterable[str]):
+        """Index chunks; ids must be larger than every id already indexed."""
+        for i, text in zip(ids, texts):
+            i = int(i)
+            tokens = tokenize(text)
+            self._grow(i)
+            self.doc_len[i] = len(tokens)
+            self.n_docs += 1
+            self.total_len += len(tokens)
+            self.max_id = max(self.max_id, i)
+            for term, tf in Counter(tokens).items():
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    term_id = self.vocab[term] = len(self.terms)
+                    self.terms.append(term)
+                postings = self._tail.get(term_id)
+                if postings is None:
+                    postings = self._tail[term_id] = (array("i"), array("H"))
+                postings[0].append(i)
+                postings[1].append(min(tf, 65535))
+
+    def remove(self, ids: Iterable[int]):
+        """Stop returning these chunks; idempotent."""
+        for i in ids:
+            i = int(i)
+            if 0 <= i < len(self.doc_len) and self.doc_len[i] >= 0:
+                self.n_docs -= 1
+                self.total_len -= int(self.doc_len[i])
+                self.doc_len[i] = -1
+
+    # ---------- Reads ----------
+    def __len__(self):
+        return self.n_docs
+
+    def search(self, query: str, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25 scores and chunk ids of the best `top_k` live chunks, best first."""
+        empty = (np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64))
+        if self.n_docs == 0:
+            return empty
+
+        postings = []
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is not None:
+                docs, tfs = self._postings(term_id)
+                if len(docs):
+                    postings.append((docs, tfs))
+        if not postings:
+            return empty
+        common = max(self.max_df_ratio * self.n_docs, self.min_skip_df)
+        rare = [p for p in postings if len(p[0]) <= common]
+        postings = rare or [min(postings, key=lambda p: len(p[0]))]
+
+        avg_len = self.total_len / self.n_docs if self.n_docs else 1.0
+        all_docs, all_scores = [], []
+        for docs, tfs in postings:
+            df = len(docs)
+            idf = np.log1p((self.n_docs - df + 0.5) / (df + 0.5))
+            lengths = self.doc_len[docs]
+            live = lengths >= 0
+            docs, tfs, lengths = docs[live], tfs[live].astype(np.float32), lengths[live]
+            norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_len)
+            all_docs.append(docs)
+            all_scores.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+
+        docs = np.concatenate(all_docs)
+        if not len(docs):
+            return empty
+        scores = np.concatenate(all_scores)
+        if len(postings) > 1:
+            # Total per chunk from a dense accumulator over the matched id range,
+            # read back per posting: a chunk then repeats at most once per term,
+            # so the best top_k * terms postings hold the best top_k chunks.
+            lo = int(docs.min())
+            scores = np.bincount(docs - lo, weights=scores)[docs - lo]
+
+        k = min(top_k * len(postings), len(docs))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        docs, scores = docs[top], scores[top]
+        first = np.sort(np.unique(docs, return_index=True)[1])[:top_k]
+        return scores[first].astype(np.float32), docs[first].astype(np.int64)
+
+    # ---------- Persistence ----------
+    @classmethod
+    def open(cls, path: str) -> "LexicalIndex":
+        """Load a saved index; postings are memory-mapped."""
+        with open(os.path.join(path, "lexical.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        index = cls(**manifest["params"])
+        g = manifest["generation"]
+        index._path, index._generation = path, g
+        with open(index._file(path, "terms", g, "json"), "r", encoding="utf-8") as f:
+            index.terms = json.load(f)
+        index.vocab = {term: i for i, term in enumerate(index.terms)}
+        index.doc_len = np.load(index._file(path, "doc_len", g, "npy"))
+        index.n_docs, index.total_len, index.max_id = manifest["n_docs"], manifest["total_len"], manifest["max_id"]
+        if len(index.terms):
+            index._offsets = np.load(index._file(path, "offsets", g, "npy"), mmap_mode="r")
+            if index._offsets[-1] > 0:
+                index._docs = np.load(index._file(path, "docs", g, "npy"), mmap_mode="r")
+                index._tfs = np.load(index._file(path, "tfs", g, "npy"), mmap_mode="r")
+        return index
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "lexical.json"))
+
+    def save(self, path: str):
+        """Merge the tail into the postings, drop removed chunks and write a new generation."""
+        self.switch(self.write(path))
+
+    def write(self, path: str) -> tuple:
+        """
+        Write the merged postings as a new generation under `path` and return
+        it for `switch`. Only reads the index, so searches can run meanwhile;
+        chunks must not be added or removed until the switch.
+        """
+        os.makedirs(path, exist_ok=True)
+        old_generation = self._generation if path == self._path else self._saved_generation(path)
+        generation = old_generation + 1
+        offsets, docs, tfs = self._merged()
+
+        with open(self._file(path, "terms", generation, "json"), "w", encoding="utf-8") as f:
+            json.dump(self.terms, f)
+        for name, values in (("offsets", offsets), ("docs", docs), ("tfs", tfs), ("doc_len", self.doc_len)):
+            with open(self._file(path, name, generation, "npy"), "wb") as f:
+                np.save(f, np.ascontiguousarray(values))
+                f.flush()
+                os.fsync(f.fileno())
+
+        manifest = {
+            "version": 1,
+            "generation": generation,
+            "n_docs": self.n_docs,
+            "total_len": self.total_len,
+            "max_id": self.max_id,
+            "params": {"k1": self.k1, "b": self.b, "max_df_ratio": self.max_df_ratio, "min_skip_df": self.min_skip_df},
+        }
+        tmp = os.path.join(path, "lexical.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(path, "lexical.json"))
+        return path, generation, old_generation, offsets, docs, tfs
+
+    def switch(self, written: tuple):
+        """Serve the postings of a generation returned by `write` and drop the previous one."""
+        path, generation, old_generation, offsets, docs, tfs = written
+        self._path, self._generation = path, generation
+        self._offsets, self._docs, self._tfs = offsets, docs, tfs
+        self._tail = {}
+        if old_generation:
+            suffix = f".{old_generation}."
+            for filename in os.listdir(path):
+                if suffix in filename:
+                    try:
+                        os.remove(os.path.join(path, filename))
+                    except OSError:
+                        pass
+
+    # ---------- Internal helpers ----------
+    def _postings(self, term_id: int):
+        docs = tfs = None
+        if term_id + 1 < len(self._offsets):
+            lo, hi = self._offsets[term_id], self._offsets[term_id + 1]
+            docs, tfs = self._docs[lo:hi], self._tfs[lo:hi]
+        tail = self._tail.get(term_id)
+        if tail is not None:
+            tail_docs = np.frombuffer(tail[0], dtype=np.int32)
+            tail_tfs = np.frombuffer(tail[1], dtype=np.uint16)
+            if docs is None or not len(docs):
+                return tail_docs, tail_tfs
+            return np.concatenate([docs, tail_docs]), np.concatenate([tfs, tail_tfs])
+        if docs is None:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint16)
+        return docs, tfs
+
+    def _grow(self, i: int):
+        if i >= len(self.doc_len):
+            size = max(i + 1, 2 * len(self.doc_len), 1024)
+            grown = np.full(size, -1, dtype=np.int32)
+            grown[:len(self.doc_len)] = self.doc_len
+            self.doc_len = grown
+
+    def _merged(self):
+        """CSR postings of base + tail over the whole vocabulary, without removed chunks."""
+        n_terms = len(self.terms)
+        base_counts = np.zeros(n_terms, dtype=np.int64)
+        base_counts[:len(self._offsets) - 1] = np.diff(self._offsets)
+        base_terms = np.repeat(np.arange(n_terms, dtype=np.int32), base_counts)
+        keep = self.doc_len[self._docs] >= 0
+        base_terms, base_docs, base_tfs = base_terms[keep], np.asarray(self._docs)[keep], np.asarray(self._tfs)[keep]
+
+        tail_ids = sorted(self._tail)
+        tail_terms = np.repeat(
+            np.asarray(tail_ids, dtype=np.int32),
+            np.fromiter((len(self._tail[t][0]) for t in tail_ids), dtype=np.int64, count=len(tail_ids)),
+        )
+        tail_docs = np.concatenate([np.frombuffer(self._tail[t][0], dtype=np.int32) for t in tail_ids] or [np.zeros(0, np.int32)])
+        tail_tfs = np.concatenate([np.frombuffer(self._tail[t][1], dtype=np.uint16) for t in tail_ids] or [np.zeros(0, np.uint16)])
+        keep = self.doc_len[tail_docs] >= 0
+        tail_terms, tail_docs, tail_tfs = tail_terms[keep], tail_docs[keep], tail_tfs[keep]
+
+        # Both parts are sorted by term, and tail ids are larger than base ids,
+        # so each term's postings stay in id order: base first, then tail.
+        kept_base = np.bincount(base_terms, minlength=n_terms)
+        kept_tail = np.bincount(tail_terms, minlength=n_terms)
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(kept_base + kept_tail, out=offsets[1:])
+        base_start = np.concatenate([[0], np.cumsum(kept_base)[:-1]]) if n_terms else np.zeros(0, dtype=np.int64)
+        tail_start = np.concatenate([[0], np.cumsum(kept_tail)[:-1]]) if n_terms else np.zeros(0, dtype=np.int64)
+
+        docs = np.empty(int(offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.uint16)
+        dest = offsets[base_terms] + np.arange(len(base_terms)) - base_start[base_terms]
+        docs[dest], tfs[dest] = base_docs, base_tfs
+        dest = offsets[tail_terms] + kept_base[tail_terms] + np.arange(len(tail_terms)) - tail_start[tail_terms]
+        docs[dest], tfs[dest] = tail_docs, tail_tfs
+        return offsets, docs, tfs
+
+    @staticmethod
+    def _saved_generation(path: str) -> int:
+        try:
+            with open(os.path.join(path, "lexical.json"), "r", encoding="utf-8") as f:
+                return json.load(f)["generation"]
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    @staticmethod
+    def _file(path: str, name: str, generation: int, ext: str) -> str:
+        return os.path.join(path, f"{name}.{generation}.{ext}")
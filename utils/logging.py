@@ -1,37 +1,209 @@
 # utils/logging.py
+import atexit
+import gzip
 import json
-from datetime import datetime
 import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+LOG_FILE = os.getenv("INTERACTION_LOG", "chat_interactions.jsonl")
+
+
+class InteractionLogger:
+    """
+    Append-only JSON Lines log written by a background thread.
+
+    - `log` only puts the record on a bounded queue; when the queue is full
+      the record is dropped (and counted) so the request path never waits on disk.
+    - The writer drains up to `batch_size` records at a time and flushes
+      every `flush_interval` seconds or when a batch is written.
+    - The file is rotated once it reaches `max_bytes` or is older than
+      `max_age` seconds (0 turns either check off). Rotated files get a
+      timestamp suffix and, with `compress`, are gzipped in the writer
+      thread; only the newest `backups` are kept.
+    """
+
+    def __init__(
+        self,
+        path: str = LOG_FILE,
+        max_bytes: int = 50 * 1024 * 1024,
+        max_age: float = 24 * 3600,
+        compress: bool = True,
+        backups: int = 10,
+        queue_size: int = 10_000,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.errors = 0
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._opened = 0.0
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="interaction-log", daemon=True)
+        self._worker.start()
+
+    # ---------- Public API ----------
+    def log(self, record: dict) -> bool:
+        """Queue `record` for writing; returns False if it was dropped."""
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout: float = 5.0):
+        """Write what is queued, then stop the writer."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._worker.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+            "errors": self.errors,
+        }
+
+    # ---------- Writer thread ----------
+    def _run(self):
+        stop = False
+        while not stop:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                self._maybe_rotate()
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stop = True
+                batch = [r for r in batch if r is not None]
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"[InteractionLogger] Dropped {len(batch)} records: {e}")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, batch):
+        if not batch:
+            return
+        self._maybe_rotate()
+        if self._file is None:
+            self._open()
+        lines = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in batch)
+        self._file.write(lines)
+        self._file.flush()
+        self.written += len(batch)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened = time.time()
+
+    def _maybe_rotate(self):
+        if self._file is None:
+            return
+        too_big = self.max_bytes and self._file.tell() >= self.max_bytes
+        too_old = self.max_age and time.time() - self._opened >= self.max_age and self._file.tell()
+        if not (too_big or too_old):
+            return
+        self._file.close()
+        self._file = None
+        rotated = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        n = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            rotated = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}.{n}"
+            n += 1
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self.rotations += 1
+        self._prune()
+
+    def _prune(self):
+        directory = os.path.dirname(self.path) or "."
+        prefix = os.path.basename(self.path) + "."
+        old = sorted(
+            (os.path.join(directory, f) for f in os.listdir(directory) if f.startswith(prefix)),
+            key=os.path.getmtime,
+        )
+        for f in old[:max(0, len(old) - self.backups)]:
+            os.remove(f)
+
+
+_logger: Optional[InteractionLogger] = None
+_logger_lock = threading.Lock()
 
-LOG_FILE = "chat_interactions.json"
 
-def log_interaction(agent: str, message: str, response: str):
+def get_logger() -> InteractionLogger:
     """
-    Logs interactions between user and agents to a JSON file.
-    
+    The process-wide interaction logger, configured from the environment:
+    INTERACTION_LOG, LOG_MAX_BYTES, LOG_MAX_AGE (seconds), LOG_COMPRESS and
+    LOG_QUEUE_SIZE. It is closed (and flushed) at exit.
+    """
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            _logger = InteractionLogger(
+                path=LOG_FILE,
+                max_bytes=int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+                max_age=float(os.getenv("LOG_MAX_AGE", str(24 * 3600))),
+                compress=os.getenv("LOG_COMPRESS", "1") == "1",
+                queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+            )
+            atexit.register(_logger.close)
+        return _logger
+
+
+def log_interaction(agent: str, message: str, response: str, **extra):
+    """
+    Logs interactions between user and agents as one JSON line.
+
     :param agent: Name of the agent responding
     :param message: User message
     :param response: Agent response
+    :param extra: Additional fields (e.g. endpoint, latency_ms)
     """
-    # Prepare log entry
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "agent": agent,
         "user_message": message,
-        "agent_response": response
+        "agent_response": response,
     }
-
-    # Check if file exists; if not, create it
-    if not os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "w", encoding="utf-8") as f:
-            json.dump([log_entry], f, indent=4)
-    else:
-        # Append new entry to existing file
-        with open(LOG_FILE, "r+", encoding="utf-8") as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = []
-            data.append(log_entry)
-            f.seek(0)
-            json.dump(data, f, indent=4)
+    log_entry.update(extra)
+    get_logger().log(log_entry)
@@ -0,0 +1,327 @@
+# utils/metadata_store.py
+import json
+import os
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+# Column kinds
+TEXT = "text"          # variable-length UTF-8, one blob plus an offsets array
+CATEGORY = "category"  # repeated strings (e.g. sources), interned to int32 codes
+INT = "int"            # int64, -1 when absent
+HASH = "hash"          # 16-byte digest, given and returned as a hex string
+
+
+def compact_path(meta_path: str) -> str:
+    """Directory of the compact store for `meta_path` (a legacy .pkl path maps to its stem)."""
+    root, ext = os.path.splitext(meta_path)
+    return root if ext == ".pkl" else meta_path
+
+
+class MetadataStore:
+    """
+    Columnar, memory-mapped row metadata keyed by increasing integer ids.
+
+    Saved rows live in per-column files that are memory-mapped on open, so
+    loading costs O(1) Python objects instead of one dict per row and only
+    the rows actually read are decoded. Rows appended since the last save
+    are kept in a small in-memory tail; `save` merges both into a new
+    generation of files and switches to it with one atomic rename of the
+    manifest. Fields outside the schema are not stored.
+    """
+
+    def __init__(self, schema: Dict[str, str]):
+        self.schema = dict(schema)
+        self.extra = {}
+        self._path = None
+        self._generation = 0
+        self._tables: Dict[str, List[str]] = {n: [] for n, k in self.schema.items() if k == CATEGORY}
+        self._codes: Dict[str, Dict[str, int]] = {n: {} for n in self._tables}
+        self._removed = set()
+        self._reset_base()
+        self._reset_tail()
+
+    # ---------- Opening and saving ----------
+    @classmethod
+    def open(cls, path: str, schema: Dict[str, str] = None) -> "MetadataStore":
+        """Memory-map a saved store."""
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        store = cls(schema or manifest["schema"])
+        store._path = path
+        store._generation = manifest["generation"]
+        store.extra = manifest.get("extra", {})
+        for name, table in manifest["tables"].items():
+            store._tables[name] = table
+            store._codes[name] = {value: code for code, value in enumerate(table)}
+        store._map_base(manifest["count"])
+        return store
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    def save(self, path: str, extra: dict = None):
+        """Write all live rows as a new generation under `path`, then switch to it."""
+        self.switch(self.write(path, extra))
+
+    def write(self, path: str, extra: dict = None) -> tuple:
+        """
+        Write all live rows as a new generation under `path` and return it for
+        `switch`. Only reads the store, so lookups can run meanwhile; rows
+        must not be added or removed until the switch.
+        """
+        os.makedirs(path, exist_ok=True)
+        old_generation = self._generation if path == self._path else self._saved_generation(path)
+        generation = old_generation + 1
+        if extra is None:
+            extra = self.extra
+
+        base_keep = np.ones(len(self._ids), dtype=bool)
+        tail_keep = np.ones(len(self._tail_ids), dtype=bool)
+        if self._removed:
+            removed = np.fromiter(self._removed, dtype=np.int64)
+            base_keep = ~np.isin(self._ids, removed)
+            tail_keep = ~np.isin(np.asarray(self._tail_ids, dtype=np.int64), removed)
+        tail_rows = np.flatnonzero(tail_keep)
+
+        ids = np.concatenate([self._ids[base_keep], np.asarray(self._tail_ids, dtype=np.int64)[tail_keep]])
+        self._write_array(path, "ids", generation, ids)
+        for name, kind in self.schema.items():
+            if kind == TEXT:
+                self._write_text(path, name, generation, base_keep, tail_rows)
+            else:
+                base = np.asarray(self._base[name])[base_keep]
+                tail = [self._tail[name][i] for i in tail_rows]
+                if kind == HASH:
+                    tail = np.frombuffer(b"".join(tail), dtype=np.uint8).reshape(-1, 16)
+                else:
+                    tail = np.asarray(tail, dtype=base.dtype)
+                self._write_array(path, name, generation, np.concatenate([base, tail]))
+
+        manifest = {
+            "version": 1,
+            "generation": generation,
+            "count": int(len(ids)),
+            "schema": self.schema,
+            "tables": self._tables,
+            "extra": extra,
+        }
+        tmp = os.path.join(path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(path, "meta.json"))
+        return path, generation, old_generation, int(len(ids)), extra
+
+    def switch(self, written: tuple):
+        """Map a generation returned by `write` and drop the previous one."""
+        path, generation, old_generation, count, extra = written
+        self.extra = extra
+        self._path, self._generation = path, generation
+        self._removed.clear()
+        self._reset_tail()
+        self._map_base(count)
+        if old_generation:
+            self._delete_generation(path, old_generation)
+
+    # ---------- Writes ----------
+    def append(self, ids: Iterable[int], rows: Iterable[Dict]):
+        """Add rows; ids must be larger than every id already stored."""
+        for i, row in zip(ids, rows):
+            self._tail_pos[int(i)] = len(self._tail_ids)
+            self._tail_ids.append(int(i))
+            for name, kind in self.schema.items():
+                value = row.get(name)
+                if kind == TEXT:
+                    self._tail[name].append(value or "")
+                elif kind == CATEGORY:
+                    self._tail[name].append(-1 if value is None else self._intern(name, value))
+                elif kind == INT:
+                    self._tail[name].append(-1 if value is None else int(value))
+                else:
+                    self._tail[name].append(bytes.fromhex(value) if value else bytes(16))
+
+    def remove(self, ids: Iterable[int]):
+        """Forget rows; they are dropped from disk at the next save."""
+        self._removed.update(int(i) for i in ids if int(i) in self)
+
+    # ---------- Reads ----------
+    def __len__(self):
+        return len(self._ids) + len(self._tail_ids) - len(self._removed)
+
+    def __contains__(self, i) -> bool:
+        i = int(i)
+        return i not in self._removed and (i in self._tail_pos or self._base_pos(i) is not None)
+
+    def get(self, i: int, fields: Iterable[str] = None):
+        """Decode row `i` (only `fields`, if given); None if the id is unknown."""
+        i = int(i)
+        if i in self._removed:
+            return None
+        pos = self._base_pos(i)
+        if pos is None and i not in self._tail_pos:
+            return None
+        row = {}
+        for name in fields or self.schema:
+            value = self._value(name, pos, i)
+            if value is not None:
+                row[name] = value
+        return row
+
+    def field(self, i: int, name: str):
+        """One decoded field of row `i`."""
+        row = self.get(i, (name,))
+        return None if row is None else row.get(name)
+
+    def max_id(self) -> int:
+        if self._tail_ids:
+            return self._tail_ids[-1]
+        return int(self._ids[-1]) if len(self._ids) else -1
+
+    def ids(self) -> np.ndarray:
+        """All live ids, ascending."""
+        ids = np.concatenate([self._ids, np.asarray(self._tail_ids, dtype=np.int64)])
+        if self._removed:
+            ids = ids[~np.isin(ids, np.fromiter(self._removed, dtype=np.int64))]
+        return ids
+
+    def column(self, name: str) -> np.ndarray:
+        """Raw values of a CATEGORY/INT/HASH column, aligned with `ids()`."""
+        kind = self.schema[name]
+        if kind == HASH:
+            tail = np.frombuffer(b"".join(self._tail[name]), dtype=np.uint8).reshape(-1, 16)
+        else:
+            tail = np.asarray(self._tail[name], dtype=np.int32 if kind == CATEGORY else np.int64)
+        values = np.concatenate([np.asarray(self._base[name]), tail])
+        if self._removed:
+            all_ids = np.concatenate([self._ids, np.asarray(self._tail_ids, dtype=np.int64)])
+            values = values[~np.isin(all_ids, np.fromiter(self._removed, dtype=np.int64))]
+        return values
+
+    def code(self, name: str, value: str) -> int:
+        """Interned code of a CATEGORY value, or -1 if it was never stored."""
+        return self._codes[name].get(value, -1)
+
+    def category(self, name: str, code: int) -> str:
+        return self._tables[name][code]
+
+    def ids_where(self, name: str, value: str) -> np.ndarray:
+        """Ids of rows whose CATEGORY column equals `value`."""
+        code = self.code(name, value)
+        if code < 0:
+            return np.zeros(0, dtype=np.int64)
+        return self.ids()[self.column(name) == code]
+
+    # ---------- Internal helpers ----------
+    def _intern(self, name: str, value: str) -> int:
+        code = self._codes[name].get(value)
+        if code is None:
+            code = len(self._tables[name])
+            self._tables[name].append(value)
+            self._codes[name][value] = code
+        return code
+
+    def _base_pos(self, i: int):
+        pos = int(np.searchsorted(self._ids, i))
+        if pos < len(self._ids) and self._ids[pos] == i:
+            return pos
+        return None
+
+    def _value(self, name: str, pos, i: int):
+        kind = self.schema[name]
+        if pos is None:
+            raw = self._tail[name][self._tail_pos[i]]
+            if kind == TEXT:
+                return raw
+        elif kind == TEXT:
+            blob, offsets = self._base[name]
+            return bytes(blob[offsets[pos]:offsets[pos + 1]]).decode("utf-8")
+        else:
+            raw = self._base[name][pos]
+
+        if kind == CATEGORY:
+            return None if raw < 0 else self._tables[name][raw]
+        if kind == INT:
+            return None if raw < 0 else int(raw)
+        return bytes(raw).hex()
+
+    def _reset_base(self):
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._base = {}
+        for name, kind in self.schema.items():
+            if kind == TEXT:
+                self._base[name] = (np.zeros(0, dtype=np.uint8), np.zeros(1, dtype=np.int64))
+            elif kind == HASH:
+                self._base[name] = np.zeros((0, 16), dtype=np.uint8)
+            else:
+                self._base[name] = np.zeros(0, dtype=np.int32 if kind == CATEGORY else np.int64)
+
+    def _reset_tail(self):
+        self._tail_ids: List[int] = []
+        self._tail_pos: Dict[int, int] = {}
+        self._tail: Dict[str, list] = {name: [] for name in self.schema}
+
+    def _file(self, path: str, name: str, generation: int, ext: str) -> str:
+        return os.path.join(path, f"{name}.{generation}.{ext}")
+
+    def _map_base(self, count: int):
+        if count == 0:
+            self._reset_base()
+            return
+        path, g = self._path, self._generation
+        self._ids = np.load(self._file(path, "ids", g, "npy"), mmap_mode="r")
+        for name, kind in self.schema.items():
+            if kind == TEXT:
+                offsets = np.load(self._file(path, f"{name}.offsets", g, "npy"), mmap_mode="r")
+                blob_path = self._file(path, name, g, "bin")
+                if offsets[-1] > 0:
+                    blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+                else:
+                    blob = np.zeros(0, dtype=np.uint8)
+                self._base[name] = (blob, offsets)
+            else:
+                self._base[name] = np.load(self._file(path, name, g, "npy"), mmap_mode="r")
+
+    def _write_array(self, path: str, name: str, generation: int, array: np.ndarray):
+        with open(self._file(path, name, generation, "npy"), "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_text(self, path: str, name: str, generation: int, base_keep: np.ndarray, tail_rows: np.ndarray):
+        blob, offsets = self._base[name]
+        offsets = np.asarray(offsets)
+        lengths = [np.diff(offsets)[base_keep]]
+        with open(self._file(path, name, generation, "bin"), "wb") as f:
+            # Copy runs of kept base rows straight from the old blob.
+            keep = np.concatenate([[False], base_keep, [False]])
+            edges = np.flatnonzero(keep[1:] != keep[:-1])
+            for start, end in zip(edges[::2], edges[1::2]):
+                for lo in range(int(offsets[start]), int(offsets[end]), 1 << 24):
+                    f.write(bytes(blob[lo:min(lo + (1 << 24), int(offsets[end]))]))
+            encoded = [self._tail[name][i].encode("utf-8") for i in tail_rows]
+            f.write(b"".join(encoded))
+            f.flush()
+            os.fsync(f.fileno())
+        lengths.append(np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded)))
+        new_offsets = np.concatenate([[0], np.cumsum(np.concatenate(lengths))]).astype(np.int64)
+        self._write_array(path, f"{name}.offsets", generation, new_offsets)
+
+    @staticmethod
+    def _saved_generation(path: str) -> int:
+        try:
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                return json.load(f)["generation"]
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def _delete_generation(self, path: str, generation: int):
+        suffix = f".{generation}."
+        for filename in os.listdir(path):
+            if suffix in filename and not filename.startswith("meta.json"):
+                try:
+                    os.remove(os.path.join(path, filename))
+                except OSError:
+                    pass
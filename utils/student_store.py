@@ -0,0 +1,217 @@
+# utils/student_store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (student_id TEXT PRIMARY KEY, record TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def build_database(records: Iterable[dict], db_path: str, source_stamp: str = "") -> int:
+    """
+    Write `records` (dicts with "student_id") to a new SQLite file at
+    `db_path`, replacing it atomically. Returns the number of records.
+    """
+    tmp = db_path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + SCHEMA)
+        count = 0
+        batch = []
+        for record in records:
+            batch.append((record["student_id"], json.dumps(record, ensure_ascii=False)))
+            if len(batch) >= 10_000:
+                conn.executemany("INSERT OR REPLACE INTO students VALUES (?, ?)", batch)
+                count += len(batch)
+                batch = []
+        conn.executemany("INSERT OR REPLACE INTO students VALUES (?, ?)", batch)
+        count += len(batch)
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('source', ?)", (source_stamp,))
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(tmp)  # don't leave a half-written database behind
+        raise
+    conn.close()
+    os.replace(tmp, db_path)
+    return count
+
+
+class StudentStore:
+    """
+    Student records keyed by `student_id`, read one at a time from SQLite.
+
+    - `source` is either a SQLite file built by `build_database`, a JSON
+      list of records or a JSON Lines file (`.jsonl`). A JSON source is converted once into a sidecar
+      database (`db_path`, default `<source>.sqlite`) and only converted
+      again when the JSON file changes.
+    - At most every `check_interval` seconds a lookup stats the source; if
+      it changed, the database is rebuilt (JSON) or reopened (SQLite) and the
+      cache is cleared, so edits are picked up without a restart. The
+      rebuild runs on one thread while other lookups keep reading the
+      previous data; a source that cannot be parsed is not retried until it
+      changes again.
+    - The `cache_size` most recently used records are kept in memory.
+
+    Each thread gets its own read-only connection.
+    """
+
+    def __init__(self, source: str, db_path: str = None, cache_size: int = 1024, check_interval: float = 1.0):
+        self.source = source
+        self.from_json = not _is_sqlite(source)
+        self.db_path = db_path or (source + ".sqlite" if self.from_json else source)
+        self.cache_size = cache_size
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._cache: "OrderedDict[str, Optional[dict]]" = OrderedDict()
+        self._lock = threading.Lock()  # cache and generation
+        self._reload_lock = threading.Lock()  # one rebuild at a time, outside `_lock`
+        self._local = threading.local()
+        self._stamp = None
+        self._failed_stamp = None
+        self._generation = 0
+        self._next_check = 0.0
+        self._refresh(force=True, wait=True)
+
+    # ---------- Public API ----------
+    def get(self, student_id: str) -> Optional[dict]:
+        """The record for `student_id`, or None."""
+        self._maybe_refresh()
+        with self._lock:
+            if student_id in self._cache:
+                self._cache.move_to_end(student_id)
+                self.hits += 1
+                return self._cache[student_id]
+            self.misses += 1
+            generation = self._generation
+
+        row = self._conn().execute("SELECT record FROM students WHERE student_id = ?", (student_id,)).fetchone()
+        record = json.loads(row[0]) if row else None
+        with self._lock:
+            if generation == self._generation:  # don't cache a record read before a reload
+                self._cache[student_id] = record
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return record
+
+    def __contains__(self, student_id: str) -> bool:
+        return self.get(student_id) is not None
+
+    def __len__(self) -> int:
+        self._maybe_refresh()
+        return self._conn().execute("SELECT COUNT(*) FROM students").fetchone()[0]
+
+    def reload(self):
+        """Check the source now instead of waiting for `check_interval`."""
+        self._refresh(force=False, wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "source": self.source,
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
+
+    # ---------- Internal helpers ----------
+    def _maybe_refresh(self):
+        if time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.check_interval
+        try:
+            stamp = _file_stamp(self.source)
+        except FileNotFoundError:
+            return  # keep serving the last good data while the file is being replaced
+        if stamp in (self._stamp, self._failed_stamp) or self._reload_lock.locked():
+            return
+        # Rebuild in the background; lookups keep reading the current generation meanwhile.
+        threading.Thread(target=self._refresh, args=(False, False), name="student-store-reload", daemon=True).start()
+
+    def _refresh(self, force: bool, wait: bool):
+        if not self._reload_lock.acquire(blocking=wait):
+            return
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                stamp = _file_stamp(self.source)
+            except FileNotFoundError:
+                if force:
+                    raise
+                return  # keep serving the last good data while the file is being replaced
+            if not force and stamp in (self._stamp, self._failed_stamp):
+                return
+            if self.from_json and not self._sidecar_matches(stamp):
+                try:
+                    count = build_database(_read_records(self.source), self.db_path, stamp)
+                except (ValueError, KeyError, TypeError, OSError, sqlite3.Error) as e:
+                    if force:
+                        raise
+                    # Retried only once the file changes again (e.g. a write finishes).
+                    self._failed_stamp = stamp
+                    print(f"[StudentStore] Keeping previous data, {self.source} could not be read: {e}")
+                    return
+                print(f"[StudentStore] Indexed {count} records from {self.source}")
+            with self._lock:
+                if self._stamp is not None:
+                    self.reloads += 1
+                self._stamp = stamp
+                self._generation += 1
+                self._cache.clear()
+        finally:
+            self._reload_lock.release()
+
+    def _sidecar_matches(self, stamp: str) -> bool:
+        if not os.path.exists(self.db_path):
+            return False
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return False
+        return row is not None and row[0] == stamp
+
+    def _conn(self) -> sqlite3.Connection:
+        # A rebuild replaces the file, so connections opened before it are reopened.
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            if getattr(local, "conn", None) is not None:
+                local.conn.close()
+            local.conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            local.generation = self._generation
+        return local.conn
+
+
+def _read_records(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def _is_sqlite(path: str) -> bool:
+    if not os.path.exists(path):
+        return path.endswith((".db", ".sqlite", ".sqlite3"))
+    with open(path, "rb") as f:
+        return f.read(16) == b"SQLite format 3\x00"
+
+
+def _file_stamp(path: str) -> str:
+    st = os.stat(path)
+    return f"{st.st_mtime_ns}:{st.st_size}"
@@ -1,58 +1,812 @@
+import hashlib
 import os
 import pickle
+import struct
+import threading
+import zlib
 import faiss
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Set
+from utils.concurrency import RWLock
+from utils.embedding_cache import normalize_text
+from utils.metadata_store import MetadataStore, compact_path, TEXT, CATEGORY, INT, HASH
+from utils.index_factory import build_index, train_index, search_params, index_kind, base_index, recall_at_k
+from utils.lexical_index import LexicalIndex
+from utils.metrics import counter, span
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process writer lock
+    fcntl = None
+
+# WAL record header: magic, kind, row count, dim, metadata length, crc32 of payload.
+# Payload: int64 ids, then (add records only) float32 vectors and pickled metadata rows.
+_WAL_MAGIC = b"VSW2"
+_WAL_HEADER = struct.Struct("<4sBIIII")
+_WAL_ADD, _WAL_DELETE = 1, 2
+
+# Older log records carry a start row instead of ids; they are still replayed.
+_WAL_V1_MAGIC = b"VSW1"
+_WAL_V1_HEADER = struct.Struct("<4sQIIII")
+
+SEARCH_QUERIES = counter("vector_search_queries", "Queries searched, by index side.", ("kind",))
+
+# Chunk metadata columns; other fields passed in `extra` are not stored.
+ROW_SCHEMA = {"text": TEXT, "source": CATEGORY, "doc": CATEGORY, "hash": HASH, "start": INT, "end": INT}
+
 
 class VectorStore:
     """
     Handles FAISS index + metadata persistence.
-    Supports append-only updates for RAG.
+    Supports adds, deletes and per-source replacement for RAG.
+
+    Every chunk has a stable integer id (the index is an IndexIDMap2) and
+    `metadata` is a memory-mapped MetadataStore of id -> {"text", "source",
+    "hash", ...}, saved in the directory `compact_path(meta_path)`. Chunks whose
+    (source, content hash, start, end) is already stored are skipped at ingest.
+    Deletes are tombstones excluded at search time; once they pass
+    `purge_ratio` of the index they are purged (in place for a flat index,
+    by a background rebuild for ANN indexes).
+
+    Persistence modes:
+    - "wal"  (default): each add/delete appends one record to a write-ahead
+      log, so the write cost depends on the batch size only.
+      The log is replayed on startup and periodically compacted into the
+      base index/metadata files with atomic renames.
+    - "full": legacy behaviour, rewrite index and metadata on every change.
+
+    Index type: the store starts with an exact IndexFlatIP. When `index_type`
+    names an ANN family ("hnsw", "ivf", "ivfpq") and the store reaches
+    `promote_at` vectors, a background thread trains the ANN index on a sample,
+    measures its recall against the flat index and swaps it in.
+
+    With `mmap=True` the saved index is memory-mapped read-only, so worker
+    processes share its pages through the OS cache and start without
+    reading it; the first write copies it into private memory.
+
+    One process writes a store at a time: the first write takes an
+    exclusive lock on `<index_path>.lock` and fails if another process holds
+    it, or if the files changed on disk since this store was opened (its ids
+    and log would clash with theirs). Readers take no lock.
+
+    With `lexical=True` chunk texts are also kept in a BM25 LexicalIndex
+    (saved next to the metadata, updated on every add and delete), which
+    `search_lexical` and `hybrid_search` use for exact terms such as course
+    codes, room numbers and policy ids that dense search tends to miss.
     """
-    def __init__(self, index_path: str, meta_path: str):
+    def __init__(
+        self,
+        index_path: str,
+        meta_path: str,
+        persistence: str = "wal",
+        wal_path: str = None,
+        compact_min_rows: int = 5000,
+        compact_ratio: float = 0.5,
+        index_type: str = "flat",
+        promote_at: int = 50_000,
+        index_options: Dict = None,
+        dedup: bool = True,
+        purge_ratio: float = 0.2,
+        purge_min_rows: int = 1000,
+        mmap: bool = False,
+        lexical: bool = False,
+    ):
+        if persistence not in ("wal", "full"):
+            raise ValueError(f"VectorStore: unknown persistence mode '{persistence}'.")
+
         self.index_path = index_path
         self.meta_path = meta_path
+        self.persistence = persistence
+        self.wal_path = wal_path or f"{index_path}.wal"
+        self.compact_min_rows = compact_min_rows
+        self.compact_ratio = compact_ratio
+        self.index_type = index_type
+        self.promote_at = promote_at
+        self.index_options = index_options or {}
+        self.dedup = dedup
+        self.purge_ratio = purge_ratio
+        self.purge_min_rows = purge_min_rows
+        self.mmap = mmap
+        self._mapped = False
+        self.meta_dir = compact_path(meta_path)
+        self.lexical_dir = f"{self.meta_dir}.lex"
         self.index = None
-        self.metadata: List[Dict] = []
+        self.metadata = MetadataStore(ROW_SCHEMA)
+        self.lexical = LexicalIndex() if lexical else None
+        self.deleted: Set[int] = set()
+        self.next_id = 0
+        self.last_recall = None
+        self._wal_rows = 0
+        self._index_max_id = -1
+        self._dedup_keys = None  # (source code, content hash, start, end) of live chunks, built on first add
+        self._selector = None
+        # Searches share the read side of `_lock`; writers take its write side
+        # only to apply a change in memory. Writers (log appends, compaction,
+        # index swaps) are serialized by `_write_mutex`, so the log fsync and
+        # the rewrite of the base files never block searches.
+        self._lock = RWLock()
+        self._write_mutex = threading.Lock()
+        self._rebuilding = False
+        self._compacting = False
+        self.lock_path = f"{index_path}.lock"
+        self._writer_lock = None
+        self._opened_stamp = None
+        self._listeners = []
+
+        if os.path.exists(index_path) and (MetadataStore.exists(self.meta_dir) or os.path.isfile(meta_path)):
+            self._load_base()
+
+        if self.persistence == "wal":
+            self._replay_wal()
+        self._opened_stamp = self._disk_stamp()
 
-        if os.path.exists(index_path) and os.path.exists(meta_path):
-            self.index = faiss.read_index(index_path)
-            with open(meta_path, "rb") as f:
-                self.metadata = pickle.load(f)
+        self._maybe_promote()
 
-    def add_embeddings(self, embeddings: np.ndarray, texts: List[str], sources: List[str]):
-        """Append embeddings and corresponding metadata."""
+    def __len__(self):
+        """Number of live (not deleted) chunks."""
+        return len(self.metadata) - len(self.deleted)
+
+    # ---------- Writes ----------
+    def add_embeddings(
+        self, embeddings: np.ndarray, texts: List[str], sources: List[str], extra: List[Dict] = None
+    ) -> np.ndarray:
+        """
+        Append embeddings and corresponding metadata; returns the new chunk ids.
+        `extra` optionally holds per-row fields (e.g. doc/start/end offsets).
+        """
         # L2 normalize
         norms = np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
-        embeddings = embeddings / norms
+        embeddings = (embeddings / norms).astype("float32")
 
-        if self.index is None:
-            dim = embeddings.shape[1]
-            self.index = faiss.IndexFlatIP(dim)
+        rows = [{"text": t, "source": s, "hash": content_hash(t)} for t, s in zip(texts, sources)]
+        if extra is not None:
+            for row, fields in zip(rows, extra):
+                row.update(fields)
 
-        self.index.add(embeddings.astype("float32"))
+        with self._write_mutex:
+            if self.dedup:
+                rows, embeddings = self._drop_duplicates(rows, embeddings)
+            if not rows:
+                return np.zeros(0, dtype=np.int64)
+            self._claim_writer()
 
-        for t, s in zip(texts, sources):
-            self.metadata.append({"text": t, "source": s})
+            ids = np.arange(self.next_id, self.next_id + len(rows), dtype=np.int64)
+            if self.persistence == "wal":
+                # Log first: once the record is on disk the batch survives a crash.
+                self._append_wal(_WAL_ADD, ids, embeddings, rows)
 
-        self._save()
+            with self._lock.write_locked():
+                self._apply_add(ids, embeddings, rows)
+            self._after_write(len(rows))
 
-    def search(self, query_vec: np.ndarray, top_k: int = 5):
-        """Return indices and scores for top-k matches."""
-        if self.index is None or len(self.metadata) == 0:
-            return [], []
+        self._notify({row["source"] for row in rows})
+        self._maybe_promote()
+        return ids
+
+    def delete_ids(self, ids) -> int:
+        """Tombstone chunks by id; returns how many live chunks were deleted."""
+        with self._write_mutex:
+            live = sorted({int(i) for i in ids if int(i) in self.metadata and int(i) not in self.deleted})
+            if not live:
+                return 0
+            self._claim_writer()
+            ids = np.array(live, dtype=np.int64)
+            if self.persistence == "wal":
+                self._append_wal(_WAL_DELETE, ids)
+            sources = {self.metadata.field(i, "source") for i in live}
+            with self._lock.write_locked():
+                self._apply_delete(ids)
+            self._after_write(len(ids))
+
+        self._notify(sources)
+        self._maybe_purge()
+        return len(ids)
 
-        norms = np.linalg.norm(query_vec, axis=1, keepdims=True) + 1e-12
-        query_vec = query_vec / norms
-        D, I = self.index.search(query_vec.astype("float32"), top_k)
+    def delete_source(self, source: str) -> int:
+        """Tombstone every chunk ingested from `source`."""
+        return self.delete_ids(self.ids_for_source(source))
+
+    def delete_stale(self, ids, keep: Set[tuple]) -> int:
+        """
+        Tombstone those of `ids` whose `chunk_key` is not in `keep`.
+        Used after adding a new version of a source: chunks it still contains
+        at the same offsets were deduplicated onto the old ids and stay.
+        """
+        stale = []
+        with self._lock.read_locked():
+            for i in ids:
+                row = self.metadata.get(int(i), ("hash", "start", "end"))
+                if row is not None and (row["hash"], row.get("start"), row.get("end")) not in keep:
+                    stale.append(int(i))
+        return self.delete_ids(stale)
+
+    # ---------- Reads ----------
+    def search(self, query_vec: np.ndarray, top_k: int = 5, nprobe: int = None, ef_search: int = None):
+        """
+        Return scores and chunk ids for top-k matches (-1 pads missing hits).
+        Deleted chunks are never returned.
+        `nprobe` (IVF) and `ef_search` (HNSW) trade recall for latency per query.
+        """
+        if self.index is None or len(self) == 0:
+            return [], []
+        D, I = self.search_batch(query_vec[:1], top_k, nprobe=nprobe, ef_search=ef_search)
         return D[0], I[0]
 
-    def get_texts(self, indices: List[int]):
-        """Retrieve metadata text by indices."""
-        return [self.metadata[i]["text"] for i in indices if i < len(self.metadata)]
+    def search_batch(self, query_vecs: np.ndarray, top_k: int = 5, nprobe: int = None, ef_search: int = None):
+        """
+        Search many queries with one FAISS call; returns (n, top_k) score and id matrices.
+        """
+        n = len(query_vecs)
+        if self.index is None or len(self) == 0:
+            return np.zeros((n, 0), dtype=np.float32), np.zeros((n, 0), dtype=np.int64)
+
+        norms = np.linalg.norm(query_vecs, axis=1, keepdims=True) + 1e-12
+        query_vecs = query_vecs / norms
+        SEARCH_QUERIES.labels("dense").inc(n)
+        with span("vector_search"), self._lock.read_locked():
+            selector = self._selector[0] if self._selector else None
+            params = search_params(self.index, nprobe=nprobe, ef_search=ef_search, selector=selector)
+            return self.index.search(np.ascontiguousarray(query_vecs, dtype=np.float32), top_k, params=params)
+
+    def search_lexical(self, query: str, top_k: int = 5):
+        """BM25 scores and chunk ids for `query` (needs `lexical=True`)."""
+        if self.lexical is None:
+            raise ValueError("VectorStore: lexical search needs lexical=True.")
+        SEARCH_QUERIES.labels("lexical").inc()
+        with span("lexical_search"), self._lock.read_locked():
+            return self.lexical.search(query, top_k)
+
+    def hybrid_search(
+        self,
+        query_vec: np.ndarray,
+        query: str,
+        top_k: int = 5,
+        dense_k: int = None,
+        lexical_k: int = None,
+        rrf_k: int = 60,
+        nprobe: int = None,
+        ef_search: int = None,
+    ):
+        """
+        Dense and BM25 results merged by reciprocal rank fusion: each chunk
+        scores sum(1 / (rrf_k + rank)) over the lists it appears in.
+        `dense_k` / `lexical_k` set how deep each side is read (default 4 * top_k).
+        Returns fused scores and chunk ids, best first.
+        """
+        results = self.hybrid_search_batch(
+            query_vec[:1], [query], top_k, dense_k=dense_k, lexical_k=lexical_k, rrf_k=rrf_k,
+            nprobe=nprobe, ef_search=ef_search,
+        )
+        return results[0]
+
+    def hybrid_search_batch(
+        self,
+        query_vecs: np.ndarray,
+        queries: List[str],
+        top_k: int = 5,
+        dense_k: int = None,
+        lexical_k: int = None,
+        rrf_k: int = 60,
+        nprobe: int = None,
+        ef_search: int = None,
+    ):
+        """`hybrid_search` for many queries with one dense matrix search; returns a list of (scores, ids)."""
+        dense_k = dense_k or 4 * top_k
+        lexical_k = lexical_k or 4 * top_k
+        _, dense_ids = self.search_batch(query_vecs, dense_k, nprobe=nprobe, ef_search=ef_search)
+        results = []
+        for row, query in zip(dense_ids, queries):
+            lexical_ids = self.search_lexical(query, lexical_k)[1] if self.lexical is not None else []
+            results.append(rrf_fuse((row, lexical_ids), top_k, rrf_k))
+        return results
+
+    def get_vectors(self, ids: List[int]) -> np.ndarray:
+        """Stored (normalized) embeddings of live chunk ids, in order."""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock.read_locked():
+            if self.index is None or not len(ids):
+                return np.zeros((len(ids), self.index.d if self.index is not None else 0), dtype=np.float32)
+            return self.index.reconstruct_batch(ids)
+
+    def get_texts(self, ids: List[int]):
+        """Retrieve metadata text by chunk ids; only these rows are decoded."""
+        return [row["text"] for row in self.get_metadata(ids, fields=("text",))]
+
+    def get_metadata(self, ids: List[int], fields=None):
+        """Retrieve live metadata entries by chunk ids (FAISS pads missing hits with -1)."""
+        rows = []
+        with self._lock.read_locked():
+            for i in ids:
+                i = int(i)
+                if i < 0 or i in self.deleted:
+                    continue
+                row = self.metadata.get(i, fields)
+                if row is not None:
+                    rows.append(row)
+        return rows
+
+    def ids_for_source(self, source: str) -> List[int]:
+        with self._lock.read_locked():
+            ids = self.metadata.ids_where("source", source)
+            return [int(i) for i in ids if int(i) not in self.deleted]
+
+    def sources(self) -> Dict[str, int]:
+        """Live chunk count per source."""
+        with self._lock.read_locked():
+            codes = self._live_column("source")
+            counts = np.bincount(codes[codes >= 0]) if len(codes) else []
+            return {self.metadata.category("source", c): int(n) for c, n in enumerate(counts) if n}
+
+    def add_listener(self, callback):
+        """Call `callback(sources)` with the set of sources whose content changed."""
+        self._listeners.append(callback)
+
+    def _notify(self, sources):
+        for callback in self._listeners:
+            callback(sources)
+
+    # ---------- Maintenance ----------
+    def compact(self):
+        """
+        Merge the write-ahead log into the base index and metadata files.
+        Searches keep running while the files are written; writes wait.
+        """
+        with self._write_mutex:
+            self._compact()
+
+    def _compact(self):
+        # Caller holds the write mutex.
+        if self.index is None:
+            return
+        self._claim_writer()
+        self._save()
+        if self.persistence == "wal":
+            # Base files now hold every logged change; start a fresh log.
+            with open(self.wal_path, "wb") as f:
+                os.fsync(f.fileno())
+            self._wal_rows = 0
+
+    def _compact_in_background(self):
+        # Caller holds the write mutex.
+        if self._compacting:
+            return
+        self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name="vector-store-compact", daemon=True).start()
+
+    def purge(self, background: bool = False):
+        """
+        Physically remove deleted chunks from the index and metadata.
+        A flat index removes them in place; ANN indexes are rebuilt from their live vectors.
+        """
+        if self.index is None or not self.deleted:
+            return
+        kind = index_kind(self.index)
+        if kind != "flat":
+            self._start_rebuild(kind, background)
+            return
+        with self._write_mutex:
+            self._claim_writer()
+            with self._lock.write_locked():
+                doomed = np.array(sorted(self.deleted), dtype=np.int64)
+                self._ensure_writable()
+                self.index.remove_ids(faiss.IDSelectorBatch(doomed))
+                self._forget(doomed)
+            self._compact()
+
+    def _maybe_purge(self):
+        if self.index is None:
+            return
+        if len(self.deleted) >= max(self.purge_min_rows, self.purge_ratio * self.index.ntotal):
+            self.purge(background=True)
+
+    # ---------- ANN promotion ----------
+    def promote(self, index_type: str = None, background: bool = False):
+        """
+        Rebuild the flat index as `index_type` (defaults to self.index_type).
+        Rows added while the new index is being built are caught up before the swap.
+        """
+        index_type = index_type or self.index_type
+        if self.index is None or index_type == "flat" or index_kind(self.index) != "flat":
+            return
+        self._start_rebuild(index_type, background)
+
+    def _maybe_promote(self):
+        if self.index_type == "flat" or not self.promote_at or self.index is None:
+            return
+        if self.index.ntotal >= self.promote_at and index_kind(self.index) == "flat":
+            self.promote(background=True)
+
+    def _start_rebuild(self, index_type: str, background: bool):
+        with self._write_mutex:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        if background:
+            threading.Thread(target=self._rebuild, args=(index_type,), daemon=True).start()
+        else:
+            self._rebuild(index_type)
+
+    def _rebuild(self, index_type: str):
+        """Build a fresh `index_type` index from the live vectors and swap it in."""
+        try:
+            # Snapshot under the lock (a concurrent add may reallocate the
+            # index storage); the expensive build runs outside it.
+            with self._lock.read_locked():
+                old = self.index
+                ids = faiss.vector_to_array(old.id_map).copy()
+                vectors = base_index(old).reconstruct_n(0, old.ntotal)
+                doomed = np.array(sorted(self.deleted), dtype=np.int64)
+                snapshot_max = self._index_max_id
+
+            live = ~np.isin(ids, doomed)
+            ids, vectors = ids[live], np.ascontiguousarray(vectors[live])
+            n = len(ids)
+
+            if index_type in ("ivf", "ivfpq") and index_kind(old) == index_type:
+                # Purging an IVF index: keep its trained quantizer, just re-add the live rows.
+                base = faiss.clone_index(base_index(old))
+                base.reset()
+            else:
+                base = build_index(index_type, old.d, n_vectors=n, **self.index_options)
+                if n:
+                    train_index(base, vectors, sample_size=self.index_options.get("train_size", 100_000))
+            index = faiss.IndexIDMap2(base)
+            index.add_with_ids(vectors, ids)
+
+            if index_type != "flat" and n:
+                # Recall of the new index against exact search on a sample of stored vectors.
+                rng = np.random.default_rng(0)
+                queries = vectors[rng.choice(n, min(n, 200), replace=False)]
+                self.last_recall = recall_at_k(base, vectors, queries, k=10)
+                print(f"VectorStore: Rebuilt {n} vectors as {index_type} (recall@10 vs flat = {self.last_recall:.3f}).")
+
+            with self._write_mutex:
+                self._claim_writer()
+                with self._lock.write_locked():
+                    current = faiss.vector_to_array(self.index.id_map)
+                    new_ids = current[current > snapshot_max]
+                    if len(new_ids):
+                        index.add_with_ids(self.index.reconstruct_batch(new_ids), new_ids)
+                    self.index = index
+                    self._mapped = False
+                    self._forget(doomed)
+                self._compact()
+        finally:
+            self._rebuilding = False
+
+    # ---------- State helpers (caller holds the write mutex; changes also take the write lock) ----------
+    def _live_column(self, name: str) -> np.ndarray:
+        values = self.metadata.column(name)
+        if self.deleted:
+            values = values[~np.isin(self.metadata.ids(), np.fromiter(self.deleted, dtype=np.int64))]
+        return values
+
+    def _dedup_key(self, row: Dict):
+        # Offsets are part of the key: a kept row must point at the same span of its document.
+        start, end = row.get("start"), row.get("end")
+        return (
+            self.metadata.code("source", row["source"]), bytes.fromhex(row["hash"]),
+            -1 if start is None else start, -1 if end is None else end,
+        )
+
+    def _drop_duplicates(self, rows: List[Dict], embeddings: np.ndarray):
+        if self._dedup_keys is None:
+            # Built lazily so that opening the store stays O(1) in Python objects.
+            columns = [self._live_column(name) for name in ("source", "hash", "start", "end")]
+            self._dedup_keys = {(int(c), h.tobytes(), int(s), int(e)) for c, h, s, e in zip(*columns)}
+        keep, seen = [], set()
+        for i, row in enumerate(rows):
+            key = (row["source"], row["hash"], row.get("start"), row.get("end"))
+            if self._dedup_key(row) not in self._dedup_keys and key not in seen:
+                seen.add(key)
+                keep.append(i)
+        if len(keep) == len(rows):
+            return rows, embeddings
+        return [rows[i] for i in keep], embeddings[keep]
+
+    def _apply_add(self, ids: np.ndarray, vectors: np.ndarray = None, rows: List[Dict] = None):
+        if vectors is not None:
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+            self._ensure_writable()
+            self.index.add_with_ids(vectors, ids)
+            self._index_max_id = max(self._index_max_id, int(ids[-1]))
+        if rows is not None:
+            self.metadata.append(ids, rows)
+            if self.lexical is not None:
+                self.lexical.add(ids, (row["text"] for row in rows))
+            if self._dedup_keys is not None:
+                self._dedup_keys.update(self._dedup_key(row) for row in rows)
+        self.next_id = max(self.next_id, int(ids[-1]) + 1)
+
+    def _apply_delete(self, ids: np.ndarray):
+        for i in ids:
+            i = int(i)
+            row = self.metadata.get(i, ("source", "hash", "start", "end"))
+            if row is None or i in self.deleted:
+                continue
+            self.deleted.add(i)
+            if self.lexical is not None:
+                self.lexical.remove((i,))
+            if self._dedup_keys is not None:
+                self._dedup_keys.discard(self._dedup_key(row))
+        self._refresh_selector()
+
+    def _forget(self, ids: np.ndarray):
+        """Drop purged chunks: their vectors are no longer in the index."""
+        self.metadata.remove(ids)
+        self.deleted.difference_update(int(i) for i in ids)
+        self._refresh_selector()
+
+    def _ensure_writable(self):
+        # A memory-mapped index is a read-only view; copy it before the first write.
+        if self._mapped:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self._mapped = False
+
+    def _refresh_selector(self):
+        # Searches skip tombstones; keep the batch referenced alongside the Not wrapping it.
+        if self.deleted:
+            batch = faiss.IDSelectorBatch(np.array(sorted(self.deleted), dtype=np.int64))
+            self._selector = (faiss.IDSelectorNot(batch), batch)
+        else:
+            self._selector = None
+
+    def _after_write(self, n: int):
+        if self.persistence == "wal":
+            self._wal_rows += n
+            if self._should_compact():
+                self._compact_in_background()
+        else:
+            self._save()
+
+    # ---------- Persistence helpers ----------
+    def _claim_writer(self):
+        """Take the cross-process writer lock before the first write (caller holds the write mutex)."""
+        if self._writer_lock is not None or fcntl is None:
+            return
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        f = open(self.lock_path, "a")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            raise RuntimeError(
+                f"VectorStore: {self.index_path} is being written by another process; "
+                "stop it or write through it."
+            )
+        if self._disk_stamp() != self._opened_stamp:
+            f.close()
+            raise RuntimeError(
+                f"VectorStore: {self.index_path} was changed by another process since it was opened; reopen it."
+            )
+        self._writer_lock = f  # held until the process exits
+
+    def _disk_stamp(self):
+        stamp = []
+        for path in (self.index_path, self.wal_path, os.path.join(self.meta_dir, "meta.json")):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                stamp.append(None)
+        return stamp
+
+    def _load_base(self):
+        flags = 0
+        if self.mmap:
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(self.index_path, flags)
+        self._mapped = bool(flags)
+        if MetadataStore.exists(self.meta_dir):
+            self.metadata = MetadataStore.open(self.meta_dir, ROW_SCHEMA)
+            self.deleted = set(self.metadata.extra.get("deleted", []))
+            next_id = self.metadata.extra.get("next_id", 0)
+        else:
+            next_id = self._migrate_pickle()
+
+        if not isinstance(index, faiss.IndexIDMap2):
+            if isinstance(index, faiss.IndexIVF):
+                index.make_direct_map()
+            vectors = index.reconstruct_n(0, index.ntotal)
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(index.d))
+            index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+            self._mapped = False
+            print(f"VectorStore: Migrated {len(vectors)} vectors to an id-mapped index.")
+
+        self.index = index
+        ids = faiss.vector_to_array(index.id_map)
+        self._index_max_id = int(ids.max()) if len(ids) else -1
+        self.next_id = max(next_id, self._index_max_id + 1, self.metadata.max_id() + 1)
+        self._refresh_selector()
+        if self.lexical is not None:
+            self._load_lexical()
+        if not MetadataStore.exists(self.meta_dir):
+            self._save()
+
+    def _load_lexical(self):
+        if LexicalIndex.exists(self.lexical_dir):
+            lexical = LexicalIndex.open(self.lexical_dir)
+            if lexical.max_id == self.metadata.max_id():
+                self.lexical = lexical
+                self.lexical.remove(self.deleted)
+                return
+        # Missing or behind the metadata (e.g. lexical search was just enabled): rebuild from the texts.
+        ids = [int(i) for i in self.metadata.ids()]
+        self.lexical.add(ids, (self.metadata.field(i, "text") for i in ids))
+        self.lexical.remove(self.deleted)
+        self.lexical.save(self.lexical_dir)
+        print(f"VectorStore: Built lexical index over {len(ids)} chunks.")
+
+    def _migrate_pickle(self) -> int:
+        """Load metadata saved as a pickle (list of rows, or the id-keyed dict) into the compact store."""
+        with open(self.meta_path, "rb") as f:
+            meta = pickle.load(f)
+        if isinstance(meta, list):
+            # Positional metadata list, matching an index without ids.
+            rows, deleted, next_id = dict(enumerate(meta)), set(), len(meta)
+        else:
+            rows, deleted, next_id = meta["rows"], set(meta["deleted"]), meta["next_id"]
+
+        for row in rows.values():
+            row.setdefault("hash", content_hash(row["text"]))
+        ids = sorted(rows)
+        self.metadata.append(ids, (rows[i] for i in ids))
+        self.deleted = deleted
+        print(f"VectorStore: Migrated {len(ids)} metadata rows from {self.meta_path} to {self.meta_dir}.")
+        return next_id
 
     def _save(self):
-        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
-        faiss.write_index(self.index, self.index_path)
-        with open(self.meta_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+        """
+        Atomically rewrite the base index and metadata files (caller holds the
+        write mutex). The files are written under the read lock; only the
+        switch to the new metadata generation takes the write lock.
+        """
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+
+        with self._lock.read_locked():
+            tmp_index = f"{self.index_path}.tmp"
+            faiss.write_index(self.index, tmp_index)
+            self._fsync_path(tmp_index)
+            os.replace(tmp_index, self.index_path)
+
+            meta = self.metadata.write(self.meta_dir, extra={"next_id": self.next_id, "deleted": sorted(self.deleted)})
+            lexical = self.lexical.write(self.lexical_dir) if self.lexical is not None else None
+
+        with self._lock.write_locked():
+            self.metadata.switch(meta)
+            if lexical is not None:
+                self.lexical.switch(lexical)
+
+    def _should_compact(self) -> bool:
+        # Compact once the log is a fixed fraction of the base, so the total
+        # rewrite cost stays linear in the number of rows ever written.
+        base_rows = len(self.metadata) - self._wal_rows
+        return self._wal_rows >= max(self.compact_min_rows, self.compact_ratio * base_rows)
+
+    def _append_wal(self, kind: int, ids: np.ndarray, embeddings: np.ndarray = None, rows: List[Dict] = None):
+        os.makedirs(os.path.dirname(self.wal_path) or ".", exist_ok=True)
+        id_bytes = np.ascontiguousarray(ids, dtype=np.int64).tobytes()
+        vec_bytes = b"" if embeddings is None else np.ascontiguousarray(embeddings, dtype=np.float32).tobytes()
+        meta_bytes = b"" if rows is None else pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL)
+        dim = 0 if embeddings is None else embeddings.shape[1]
+        payload = id_bytes + vec_bytes + meta_bytes
+        header = _WAL_HEADER.pack(_WAL_MAGIC, kind, len(ids), dim, len(meta_bytes), zlib.crc32(payload))
+        with open(self.wal_path, "ab") as f:
+            f.write(header + payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replay_wal(self):
+        """
+        Re-apply logged changes missing from the base files.
+
+        Ids only grow, so an add is applied to the index (and, separately, to
+        the metadata) only for ids above the highest one it already holds;
+        this keeps replay idempotent after a crash mid-compaction. Deletes
+        are idempotent as they are. A torn or corrupt tail record is truncated away.
+        """
+        if not os.path.exists(self.wal_path):
+            return
+
+        replayed = 0
+        good_end = 0
+        meta_max_id = self.metadata.max_id()
+        with open(self.wal_path, "rb") as f:
+            while True:
+                record = self._read_wal_record(f)
+                if record is None:
+                    break
+                kind, ids, vectors, rows = record
+
+                if kind == _WAL_ADD:
+                    new_vecs = ids > self._index_max_id
+                    if new_vecs.any():
+                        self._apply_add(ids[new_vecs], vectors=vectors[new_vecs])
+                    new_rows = ids > meta_max_id
+                    if new_rows.any():
+                        self._apply_add(ids[new_rows], rows=[r for r, m in zip(rows, new_rows) if m])
+                        meta_max_id = int(ids[-1])
+                else:
+                    self._apply_delete(ids)
+
+                replayed += len(ids)
+                good_end = f.tell()
+
+        if good_end < os.path.getsize(self.wal_path):
+            print("VectorStore: Truncating incomplete write-ahead log record.")
+            with open(self.wal_path, "r+b") as f:
+                f.truncate(good_end)
+
+        self._wal_rows = replayed
+        if replayed:
+            print(f"VectorStore: Replayed {replayed} rows from write-ahead log.")
+
+    @staticmethod
+    def _read_wal_record(f):
+        """Next (kind, ids, vectors, rows) in the log, or None at the end or a bad record."""
+        magic = f.read(4)
+        f.seek(-len(magic), os.SEEK_CUR)
+        if magic == _WAL_MAGIC:
+            header = f.read(_WAL_HEADER.size)
+            if len(header) < _WAL_HEADER.size:
+                return None
+            _, kind, n, dim, meta_len, crc = _WAL_HEADER.unpack(header)
+            id_len = n * 8
+        elif magic == _WAL_V1_MAGIC:
+            header = f.read(_WAL_V1_HEADER.size)
+            if len(header) < _WAL_V1_HEADER.size:
+                return None
+            _, start, n, dim, meta_len, crc = _WAL_V1_HEADER.unpack(header)
+            kind, id_len = _WAL_ADD, 0
+        else:
+            return None
+
+        vec_len = n * dim * 4
+        size = id_len + vec_len + meta_len
+        payload = f.read(size)
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            return None
+
+        if id_len:
+            ids = np.frombuffer(payload[:id_len], dtype=np.int64)
+        else:
+            ids = np.arange(start, start + n, dtype=np.int64)
+        vectors = np.frombuffer(payload[id_len:id_len + vec_len], dtype=np.float32).reshape(n, dim)
+        rows = pickle.loads(payload[id_len + vec_len:]) if meta_len else []
+        for row in rows:
+            row.setdefault("hash", content_hash(row["text"]))
+        return kind, ids, vectors, rows
+
+    @staticmethod
+    def _fsync_path(path: str):
+        with open(path, "rb") as f:
+            os.fsync(f.fileno())
+
+
+def rrf_fuse(rankings, top_k: int, rrf_k: int = 60):
+    """Reciprocal rank fusion of ranked id lists (-1 entries ignored); returns (scores, ids), best first."""
+    fused: Dict[int, float] = {}
+    for ranked in rankings:
+        for rank, i in enumerate(i for i in ranked if i >= 0):
+            fused[int(i)] = fused.get(int(i), 0.0) + 1.0 / (rrf_k + rank + 1)
+    best = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return np.array([fused[i] for i in best], dtype=np.float32), np.array(best, dtype=np.int64)
+
+
+def content_hash(text: str) -> str:
+    """Hash of a chunk's normalized text, used to skip re-ingesting identical chunks."""
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def chunk_key(text: str, start: int = None, end: int = None) -> tuple:
+    """(content hash, start, end) of a chunk, as compared by `VectorStore.delete_stale`."""
+    return content_hash(text), start, end